@@ -1,4 +1,4 @@
-from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
 from rest_framework import serializers, viewsets, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
@@ -10,6 +10,7 @@ from rest_framework.reverse import reverse
 from .models import *
 from .serializers import *
 from .data import PhotometryService, SpectraService, ObservingResourceService
+from YSE_App import frb_export
 
 from django_filters.rest_framework import DjangoFilterBackend,filters
 import django_filters
@@ -541,10 +542,25 @@ class FRBSampleCriteriaViewSet(custom_viewsets.ListCreateRetrieveUpdateViewSet):
 class CombinedViewSet_frbobs_and_frb_pending(viewsets.ViewSet):
     """
     Combined viewset to assist grabbing FRBs in ASAP
+
+    Optional query parameters:
+      - limit, cursor: one page of up to limit rows of each table;
+            pass the returned 'next' as cursor for the following page
+      - export=ndjson: stream all rows, one JSON object per line 
+            with its 'table' (see frb_export)
     """
 
     permission_classes = (permissions.IsAuthenticated,)
+    tables = [('frbfollowuprequests', FRBFollowUpRequest, FRBFollowUpRequestSerializer),
+              ('frbfollowupobservations', FRBFollowUpObservation, FRBFollowUpObservationSerializer)]
+
     def list(self, request):
+        if request.query_params.get('export') == 'ndjson':
+            return StreamingHttpResponse(self._stream(request), 
+                                         content_type=frb_export.content_types['ndjson'])
+        if request.query_params.get('limit') is not None:
+            return self._page(request)
+
         queryset1 = FRBFollowUpRequest.objects.all()
         queryset2 = FRBFollowUpObservation.objects.all()
 
@@ -555,4 +571,32 @@ class CombinedViewSet_frbobs_and_frb_pending(viewsets.ViewSet):
             'frbfollowuprequests': serializer1.data,
             'frbfollowupobservations': serializer2.data
         })
+
+    def _page(self, request):
+        try:
+            limit = int(request.query_params['limit'])
+            cursor = request.query_params.get('cursor')
+            afters = [None]*len(self.tables) if cursor is None else \
+                [int(after) if after != '' else None for after in cursor.split(',')]
+            assert len(afters) == len(self.tables)
+        except (ValueError, AssertionError):
+            return Response({"error": "Bad limit or cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        out, nexts = {}, []
+        for (key, model, serializer), after in zip(self.tables, afters):
+            rows, next_id = frb_export.page(model.objects.all(), limit=limit, after=after)
+            out[key] = serializer(rows, many=True, context={'request': request}).data
+            # Exhausted tables stay put
+            nexts.append(next_id if next_id is not None else 
+                         (rows[-1].pk if len(rows) > 0 else after))
+        done = all([len(out[key]) < limit for key, _, _ in self.tables])
+        out['next'] = None if done else ','.join(['' if inext is None else str(inext) 
+                                                  for inext in nexts])
+        return Response(out)
+
+    def _stream(self, request):
+        for key, model, serializer in self.tables:
+            for rows in frb_export.iter_chunks(model.objects.all()):
+                data = serializer(rows, many=True, context={'request': request}).data
+                yield from frb_export.ndjson_stream([[dict(table=key, **row) for row in data]])
     
\ No newline at end of file
@@ -1,46 +1,150 @@
 import datetime
+import hashlib
 import json
+import uuid
  
 from django.contrib.auth.decorators import login_required
+from django.core.cache import caches
 from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse, HttpResponseForbidden
 from django.contrib import auth
 from django.contrib.auth import authenticate, login
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions as rf_exceptions
+from rest_framework.authentication import BaseAuthentication
   
+
+# Verified credentials are kept in the Django cache (settings.CACHES),
+#  keyed by the SHA-256 of the Authorization header.  This saves the
+#  password hash (or token lookup) on repeated calls from the same
+#  client.  Each entry holds the generations of its user and of the
+#  whole cache;  clear_auth_cache() replaces them, which voids the
+#  entries of every worker sharing the cache backend.
+# NOTE: the default backend (LocMemCache) is per process, so with it a
+#  password change or a revoked token only reaches the other workers
+#  when their entries expire, hence the short TTL.  Configure a shared
+#  backend (e.g. the memcached of settings.py) for immediate invalidation.
+auth_cache_alias = 'default'
+auth_cache_ttl = 60  # seconds
+auth_cache_prefix = 'basicauth'
+auth_methods = ['basic', 'token']
+
+def _entry_key(header:str):
+	return f"{auth_cache_prefix}:header:{hashlib.sha256(header.encode('utf-8')).hexdigest()}"
+
+def _user_key(user_id:int):
+	return f'{auth_cache_prefix}:user:{user_id}'
+
+_all_key = f'{auth_cache_prefix}:all'
+
+def _generations(cache, user_id:int):
+	""" Current generations of a user and of the whole cache
+
+	A missing generation (never set, or evicted) gets a new one,
+	so the entries made before it are void
+	"""
+	keys = [_user_key(user_id), _all_key]
+	gens = cache.get_many(keys)
+	for key in keys:
+		if key not in gens:
+			cache.add(key, uuid.uuid4().hex, None)
+			gens[key] = cache.get(key)
+	return gens[keys[0]], gens[keys[1]]
+
+def user_from_header(header:str):
+	""" User of an HTTP Authorization header
+
+	Accepts 'Basic <base64 username:password>' and
+	'Token <key>' (rest_framework.authtoken;  create one with
+	python manage.py drf_create_token <username>)
+
+	Verified credentials are cached for auth_cache_ttl seconds
+
+	Args:
+		header (str): value of the Authorization header
+
+	Returns:
+		User or None: the active user, or None if the credentials are bad
+	"""
+	cache = caches[auth_cache_alias]
+	key = _entry_key(header)
+	cached = cache.get(key)
+	if cached is not None:
+		user, gens = cached
+		if _generations(cache, user.id) == gens:
+			return user
+
+	user = None
+	try:
+		auth_method, credentials = header.split(' ', 1)
+		if auth_method.lower() == 'basic':
+			credentials = base64.b64decode(credentials.strip()).decode('utf-8')
+			username, password = credentials.split(':', 1)
+			user = auth.authenticate(username=username, password=password)
+		elif auth_method.lower() == 'token':
+			from rest_framework.authtoken.models import Token
+			token = Token.objects.select_related('user').filter(key=credentials.strip()).first()
+			user = token.user if token is not None else None
+	except ValueError:
+		return None
+	if user is None or not user.is_active:
+		return None
+
+	# Cache
+	cache.set(key, (user, _generations(cache, user.id)), auth_cache_ttl)
+	return user
+
+def clear_auth_cache(user_id:int=None):
+	""" Void verified credentials in the cache
+
+	Args:
+		user_id (int, optional): Only those of this user. Defaults to all.
+	"""
+	cache = caches[auth_cache_alias]
+	key = _all_key if user_id is None else _user_key(user_id)
+	cache.set(key, uuid.uuid4().hex, None)
+
+@receiver(post_save, sender='auth.User')
+@receiver(post_delete, sender='auth.User')
+def reset_auth_cache_user(sender, instance, *args, **kwargs):
+	# Password changed, user deactivated, etc.
+	clear_auth_cache(instance.id)
+
+@receiver(post_delete, sender='authtoken.Token')
+def reset_auth_cache_token(sender, instance, *args, **kwargs):
+	# Revoked token
+	clear_auth_cache(instance.user_id)
+
+class CachedHeaderAuthentication(BaseAuthentication):
+	""" DRF authentication with Basic or Token headers
+	and the verified-credential cache of user_from_header()
+	"""
+	def authenticate(self, request):
+		header = request.META.get('HTTP_AUTHORIZATION')
+		if not header or header.split(' ', 1)[0].lower() not in auth_methods:
+			return None
+		user = user_from_header(header)
+		if user is None:
+			raise rf_exceptions.AuthenticationFailed('Incorrect user credentials.')
+		return (user, None)
+
+	def authenticate_header(self, request):
+		return 'Basic realm="api"'
+
 # The basic auth decorator
 import base64
 def login_or_basic_auth_required(view):
+	""" Require a user, from the session or the Authorization header
+
+	The user of the header is set on the request (request.user)
+	so the view does not need to authenticate again
+	"""
 	def _decorator(request, *args, **kwargs):
 		if 'META' in request.__dict__.keys() and 'HTTP_AUTHORIZATION' in request.META.keys():
-			auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-			if auth_method.lower() == 'basic':
-				credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-				username, password = credentials.split(':', 1)
-				user = auth.authenticate(username=username, password=password)
-				if user is not None and user.is_active:
-					# Correct password, and the user is marked "active"
-					return view(request, *args, **kwargs)
-				else:
-					return HttpResponseForbidden('Incorrect user credentials.')
-			response = HttpResponse()
-			response.status_code = 401
-			response['WWW-Authenticate'] = 'Basic'
-			return response
+			http_request = request
 		elif 'request' in request.__dict__.keys() and 'HTTP_AUTHORIZATION' in request.request.META.keys():
-			auth_method, credentials = request.request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-			if auth_method.lower() == 'basic':
-				credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-				username, password = credentials.split(':', 1)
-				user = auth.authenticate(username=username, password=password)
-				if user is not None and user.is_active:
-					# Correct password, and the user is marked "active"
-					return view(request, *args, **kwargs)
-				else:
-					return HttpResponseForbidden('Incorrect user credentials.')
-			response = HttpResponse()
-			response.status_code = 401
-			response['WWW-Authenticate'] = 'Basic'
-			return response			
+			http_request = request.request
 		else:
 			if 'user' in request.__dict__.keys() and request.user.is_authenticated:
 				return view(request, *args, **kwargs)
@@ -48,6 +152,20 @@ def login_or_basic_auth_required(view):
 				return view(request, *args, **kwargs)
 			else:
 				return HttpResponseForbidden('Incorrect user credentials')
+
+		header = http_request.META['HTTP_AUTHORIZATION']
+		if header.split(' ', 1)[0].lower() in auth_methods:
+			user = user_from_header(header)
+			if user is not None:
+				# Correct credentials, and the user is marked "active"
+				http_request.user = user
+				return view(request, *args, **kwargs)
+			else:
+				return HttpResponseForbidden('Incorrect user credentials.')
+		response = HttpResponse()
+		response.status_code = 401
+		response['WWW-Authenticate'] = 'Basic'
+		return response
 	return _decorator
 
 
@@ -6,12 +6,15 @@ from pkg_resources import resource_filename
 
 from django.contrib import auth
 
+import numpy as np
 import pandas
 
 from YSE_App.models import *
 from YSE_App.chime import chime_test_utils as ctu
 from YSE_App import frb_init
+from YSE_App import frb_ism
 from YSE_App import frb_status
+from YSE_App import frb_tables
 from YSE_App import frb_utils
 
 def init_kko(clean:bool=True):
@@ -40,13 +43,20 @@ def init_kko(clean:bool=True):
 def init_DMISM():
     """ Stop gap to add DM_ISM to the KKO objects """
 
-    for frb in FRBTransient.objects.all():
-        if frb.DM_ISM is None:
-            print(f'Working on: {frb.name}')
-            # 
-            frb.DM_ISM = frb.calc_DM_ISM()
-            # Set status
-            frb_status.set_status(frb)
-
-            # Save
-            frb.save()
\ No newline at end of file
+    frbs = list(FRBTransient.objects.filter(DM_ISM__isnull=True))
+    if len(frbs) == 0:
+        return
+    print(f'Working on: {len(frbs)} FRBs')
+
+    # One call for all of them
+    DM_ISMs = frb_ism.dm_ism(np.array([frb.ra for frb in frbs]),
+                             np.array([frb.dec for frb in frbs]))
+    for frb, DM_ISM in zip(frbs, DM_ISMs):
+        frb.DM_ISM = float(DM_ISM)
+    FRBTransient.objects.bulk_update(frbs, ['DM_ISM'], batch_size=1000)
+    # bulk_update() sends no signals
+    frb_tables.mark_summary_dirty([frb.id for frb in frbs])
+
+    # Set status
+    frb_status.set_status_bulk(FRBTransient.objects.filter(
+        id__in=[frb.id for frb in frbs]))
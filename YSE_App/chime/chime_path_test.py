@@ -17,6 +17,7 @@ from YSE_App.models import FRBSurvey
 from YSE_App.chime import chime_test_utils as ctu
 
 from YSE_App.galaxies import path
+from YSE_App.common.utilities import getGalaxyname
 
 from YSE_App.serializers import frbtransient_serializers 
 from YSE_App.serializers import user_serializers
@@ -133,4 +134,67 @@ def test_galaxy_serialize():
     destroy = True
     if destroy:
         galaxy = FRBGalaxy.objects.get(name=data['name'])
-        galaxy.delete()
\ No newline at end of file
+        galaxy.delete()
+
+
+def test_path_bulk():
+    """ Ingest PATH results for two FRBs in one call
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+
+    entries = []
+    for name, ra, dec in zip(['FRB20300714A', 'FRB20300714X'],
+                             [183.979572, 183.979572], [-13.0213, -13.0213]):
+        candidates = pandas.DataFrame()
+        candidates['ra'] = [ra, ra-0.0001]
+        candidates['dec'] = [dec, dec+0.0012]
+        candidates['ang_size'] = [0.5, 1.2] # arcsec
+        candidates['mag'] = [18.5, 19.5]
+        candidates['P_Ox'] = [0.98, 0.01]
+        entries.append(dict(transient=FRBTransient.objects.get(name=name),
+                            candidates=candidates, Filter='r',
+                            inst_name='GPC1', obs_group='Pan-STARRS1',
+                            P_Ux=0.01))
+
+    npath = path.ingest_path_results_bulk(entries, user)
+
+    # Test!
+    assert npath == 4
+    for entry in entries:
+        itransient = FRBTransient.objects.get(name=entry['transient'].name)
+        assert Path.objects.filter(transient=itransient).count() == 2
+        assert itransient.host == itransient.best_Path_galaxy
+        assert np.isclose(itransient.P_Ux, 0.01)
+
+    # A candidate 0.2 arcsec away is the same galaxy
+    galaxy = FRBGalaxy.objects.get(name=getGalaxyname(183.979572, -13.0213))
+    name = getGalaxyname(183.979572, -13.0213+0.2/3600)
+    assert name != galaxy.name
+    matched = path.match_galaxies({name: (183.979572, -13.0213+0.2/3600)})
+    assert matched[name].id == galaxy.id
+    assert path.match_galaxies({name: (183.979572, -13.0213+2./3600)}) == {}
+
+def test_delete_and_sweep():
+    """ Remove the PATH entries of an FRB and sweep the orphans
+
+    This test requires test_path_bulk() was run first
+    """
+    itransient = FRBTransient.objects.get(name='FRB20300714X')
+    gal_ids = list(Path.objects.filter(transient=itransient).values_list(
+        'galaxy_id', flat=True))
+
+    path.delete_path_entries(itransient)
+
+    # Test!
+    assert Path.objects.filter(transient=itransient).count() == 0
+    assert itransient.candidates.count() == 0
+    for gal_id in gal_ids:
+        if not FRBGalaxy.objects.filter(id=gal_id).exists():
+            continue
+        # Kept only if another FRB still points to it
+        assert FRBTransient.objects.filter(candidates__id=gal_id).exists()
+
+    path.sweep_orphan_galaxies()
+    assert path.sweep_orphan_galaxies(dry_run=True) == (0, 0)
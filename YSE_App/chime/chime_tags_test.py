@@ -63,4 +63,74 @@ def run(delete_existing:bool=False):
 
     # Finish
     print(FRBTransient.objects.all())
-    print("All clear!")
\ No newline at end of file
+    print("All clear!")
+
+def test_bulk_criteria():
+    """ Test that the criteria matrix and set_status_bulk() match
+    the per-FRB checks they replaced (see chime_test_utils)
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    import numpy as np
+    from YSE_App import frb_tags
+    from YSE_App import frb_status
+
+    frbs = FRBTransient.objects.all().order_by('name')
+    cmatrix = frb_tags.chk_all_criteria_bulk(frbs)
+
+    nchk = 0
+    for ii, frb in enumerate(frbs):
+        reference = ctu.chk_all_criteria_perfrb(frb)
+        bulk, _ = frb_tags.criteria_for_frb(cmatrix, ii)
+        assert sorted(bulk['sample']) == sorted(reference.keys())
+        for jj, name in enumerate(bulk['sample']):
+            for key in frb_tags.criteria_keys:
+                assert bulk[key][jj] == reference[name][key], (frb.name, name, key)
+            nchk += 1
+    assert nchk > 0
+
+    # Status
+    expected = {frb.name: ctu.status_perfrb(frb) for frb in frbs}
+    all_status = frb_status.set_status_bulk(frbs)
+    for frb in frbs:
+        frb.refresh_from_db()
+        if expected[frb.name] is not None:
+            assert all_status[frb.name] == expected[frb.name], frb.name
+        assert frb.status.name == all_status[frb.name]
+
+    # No criteria for the tags:  the status is kept
+    empty = {key: np.zeros(0, dtype=bool) for key in ['sample']+frb_tags.criteria_keys}
+    assert frb_status.status_from_criteria(empty, False, None, False,
+                                           False, False, False, False) is None
+
+def test_bulk_ingest():
+    """ Test that frb_init.bulk_add_df_to_db() matches the
+    one-by-one ingestion for the CHIME test FRBs
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    import numpy as np
+    from YSE_App import frb_init
+
+    csv_file = os.path.join(
+        resource_filename('YSE_App', 'chime'), 'chime_tests.csv')
+    df_frbs = pandas.read_csv(csv_file)
+    user = auth.authenticate(username='root', password='F4isthebest')
+
+    # One by one
+    frbs = FRBTransient.objects.filter(name__in=df_frbs['name']).order_by('name')
+    before = {frb.name: (frb.status.name, frb.mw_ebv, frb.DM_ISM,
+                         sorted([tag.name for tag in frb.frb_tags.all()]))
+              for frb in frbs}
+
+    # Bulk
+    code, _ = frb_init.bulk_add_df_to_db(df_frbs, user, delete_existing=True)
+    assert code == 200
+
+    frbs = FRBTransient.objects.filter(name__in=df_frbs['name']).order_by('name')
+    for frb in frbs:
+        status, ebv, DM_ISM, tags = before[frb.name]
+        assert frb.status.name == status
+        assert np.isclose(frb.mw_ebv, ebv)
+        assert np.isclose(frb.DM_ISM, DM_ISM)
+        assert sorted([tag.name for tag in frb.frb_tags.all()]) == tags
@@ -0,0 +1,97 @@
+""" Test and benchmark the authentication of the FRB endpoints """
+
+import base64
+import time
+
+from django.contrib import auth
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from YSE_App import basicauth
+
+username, password = 'root', 'F4isthebest'
+
+
+def basic_header(username:str, password:str):
+    return 'Basic ' + base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('utf-8')
+
+
+@basicauth.login_or_basic_auth_required
+def whoami(request):
+    return JsonResponse({"username": request.user.username}, status=200)
+
+
+def run_benchmark(ncall:int=20, verbose:bool=True):
+    """ Time the authentication of an endpoint call:
+    the previous double auth.authenticate() vs. the cache
+
+    Args:
+        ncall (int, optional): Number of calls. Defaults to 20.
+        verbose (bool, optional): Print the timings. Defaults to True.
+
+    Returns:
+        tuple: time per call [s] of the two
+    """
+    header = basic_header(username, password)
+
+    # Decorator + view each ran a password hash
+    t0 = time.perf_counter()
+    for _ in range(ncall):
+        for _ in range(2):
+            auth.authenticate(username=username, password=password)
+    t_hash = (time.perf_counter() - t0) / ncall
+
+    # Cached
+    basicauth.clear_auth_cache()
+    basicauth.user_from_header(header)
+    t0 = time.perf_counter()
+    for _ in range(ncall):
+        basicauth.user_from_header(header)
+    t_cache = (time.perf_counter() - t0) / ncall
+
+    if verbose:
+        print(f'2x authenticate: {1e3*t_hash:.3f} ms/call, cached: {1e3*t_cache:.4f} ms/call')
+    return t_hash, t_cache
+
+
+def test_auth_cache():
+    """ Basic and Token credentials, and the cache
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    basicauth.clear_auth_cache()
+    header = basic_header(username, password)
+
+    # Basic
+    user = basicauth.user_from_header(header)
+    assert user.username == username
+    assert basicauth.user_from_header(header).id == user.id
+    # Voided by a change of the user, e.g. of its password
+    user.save()
+    key = basicauth._entry_key(header)
+    cached_user, gens = caches[basicauth.auth_cache_alias].get(key)
+    assert basicauth._generations(caches[basicauth.auth_cache_alias], user.id) != gens
+    assert basicauth.user_from_header(header).id == user.id
+    assert basicauth.user_from_header(basic_header(username, 'wrong')) is None
+
+    # Token
+    token, _ = Token.objects.get_or_create(user=user)
+    assert basicauth.user_from_header(f'Token {token.key}').id == user.id
+    token.delete()
+    assert basicauth.user_from_header(f'Token {token.key}') is None
+
+    # The view gets the user
+    request = RequestFactory().post('/whoami/', HTTP_AUTHORIZATION=header)
+    response = whoami(request)
+    assert response.status_code == 200
+    assert request.user.username == username
+
+    # And the timing
+    t_hash, t_cache = run_benchmark(ncall=5, verbose=False)
+    assert t_cache < t_hash
+
+
+if __name__ == '__main__':
+    run_benchmark()
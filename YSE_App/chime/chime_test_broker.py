@@ -0,0 +1,77 @@
+""" Test the concurrent broker fetcher against a local mock broker """
+
+import http.server
+import json
+import threading
+import time
+
+from YSE_App.data_ingest import broker_fetch
+
+
+class _Broker(http.server.BaseHTTPRequestHandler):
+    """ Mock broker:  slow, and throttles the first request of each locus """
+    delay = 0.2
+    seen = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            first = self.path not in self.seen
+            self.seen.add(self.path)
+        time.sleep(self.delay)
+        if first:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps(dict(result=dict(path=self.path))).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_all():
+    """ Per-locus lookups run concurrently, retry the 503s and keep their order """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Broker)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    loci = ['ANT{}'.format(ii) for ii in range(16)]
+    sess = broker_fetch.session(pool_size=8, backoff_factor=0.01)
+    try:
+        tstart = time.time()
+        matches = broker_fetch.fetch_all(
+            lambda locus: broker_fetch.get_json(
+                sess, '{}/loci/{}/catalog-matches'.format(url, locus)),
+            loci, workers=8, tries=1)
+        elapsed = time.time() - tstart
+    finally:
+        sess.close()
+        server.shutdown()
+        server.server_close()
+
+    assert [m['result']['path'] for m in matches] == \
+        ['/loci/{}/catalog-matches'.format(locus) for locus in loci]
+    # 32 requests of 0.2s;  serially >6s
+    assert elapsed < 3.
+
+
+def test_retries():
+    """ Failures are retried, then returned in place of the result """
+    calls = []
+    def flaky(item):
+        calls.append(item)
+        if item == 'bad' or calls.count(item) < 2:
+            raise IOError(item)
+        return item
+
+    results = broker_fetch.fetch_all(flaky, ['a', 'bad', 'b'],
+                                     tries=3, wait=0.01)
+    assert results[0] == 'a' and results[2] == 'b'
+    assert isinstance(results[1], IOError)
+    assert calls.count('bad') == 3
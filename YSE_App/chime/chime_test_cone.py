@@ -0,0 +1,67 @@
+""" Test the HEALPix cone searches """
+
+import numpy as np
+
+from YSE_App.models import FRBTransient, FRBGalaxy
+from YSE_App.common import healpix
+
+
+def test_disc_ranges():
+    """ No point within the cone falls outside the pixel ranges """
+    rstate = np.random.RandomState(1234)
+    for ra, dec, radius in [(10., 20., 2./60), (359.99, -5., 0.5),
+                            (180., 89.9, 1.), (45., -89.95, 0.2)]:
+        # Random points in the cone
+        npt = 10000
+        rho = np.deg2rad(radius)*np.sqrt(rstate.uniform(size=npt))
+        pa = rstate.uniform(0., 2*np.pi, size=npt)
+        dec0, ra0 = np.deg2rad(dec), np.deg2rad(ra)
+        sdec = np.sin(dec0)*np.cos(rho) + np.cos(dec0)*np.sin(rho)*np.cos(pa)
+        decs = np.arcsin(sdec)
+        ras = ra0 + np.arctan2(np.sin(pa)*np.sin(rho)*np.cos(dec0),
+                               np.cos(rho) - np.sin(dec0)*sdec)
+        pixs = healpix.radec_to_pix(np.rad2deg(ras), np.rad2deg(decs))
+
+        ranges = np.array(healpix.disc_ranges(ra, dec, radius))
+        inside = np.zeros(npt, dtype=bool)
+        for lo, hi in ranges:
+            inside |= (pixs >= lo) & (pixs <= hi)
+        assert np.all(inside)
+
+
+def test_cone_search():
+    """ The cone searches match a brute force search
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frb = FRBTransient.objects.get(name='FRB20300714A')
+    for model, radius in [(FRBTransient, 5.), (FRBGalaxy, 1./60)]:
+        objs = healpix.cone_search(model.objects.all(), frb.ra, frb.dec, radius)
+
+        all_objs = list(model.objects.all())
+        seps = healpix.separation(frb.ra, frb.dec, [obj.ra for obj in all_objs],
+                                  [obj.dec for obj in all_objs])
+        brute = [obj.id for obj, sep in zip(all_objs, seps) if sep <= radius]
+
+        assert sorted([obj.id for obj, _ in objs]) == sorted(brute)
+        # Nearest first
+        assert np.all(np.diff([sep for _, sep in objs]) >= 0.)
+    # The FRB itself
+    assert healpix.cone_search(FRBTransient.objects.all(), frb.ra, frb.dec,
+                               1./3600)[0][0].id == frb.id
+
+
+def test_box():
+    """ The box search matches a brute force search, across RA=0
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frb = FRBTransient.objects.get(name='FRB20300714A')
+    for ra, width in [(frb.ra, 10.), (0., 30.)]:
+        objs = FRBTransient.objects.filter(healpix.box_q(ra, frb.dec, width, 10.))
+
+        cosdec = np.cos(np.deg2rad(min(abs(frb.dec)+5., 90.)))
+        brute = [obj.id for obj in FRBTransient.objects.all()
+                 if abs(obj.dec - frb.dec) <= 5. and
+                 abs((obj.ra - ra + 180.) % 360. - 180.)*cosdec <= width/2]
+        assert sorted([obj.id for obj in objs]) == sorted(brute)
@@ -0,0 +1,40 @@
+""" CHIME test(s) for the number of queries made by the FRB dashboard """
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from YSE_App.models import FRBTransient
+from YSE_App.table_utils import FRBTransientTable
+
+
+def count_table_queries(frbs):
+    """ Count the queries made to render a FRBTransientTable
+
+    Args:
+        frbs (QuerySet): FRBTransient objects
+
+    Returns:
+        int: number of queries
+    """
+    table = FRBTransientTable(frbs)
+    with CaptureQueriesContext(connection) as ctx:
+        for row in table.rows:
+            for cell in row:
+                pass
+    return len(ctx.captured_queries)
+
+
+def test_table_queries():
+    """ The number of queries does not grow with the number of FRBs
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frbs = FRBTransient.objects.all().order_by('name').for_table()
+    nfrb = frbs.count()
+    assert nfrb > 1
+
+    n_one = count_table_queries(frbs[:1])
+    n_all = count_table_queries(frbs)
+
+    # Test
+    assert n_one == n_all
@@ -67,5 +67,5 @@ def build_chime_test_db():
                Resource='Gemini-LP-2024A-99',
                mode='longslit')
     obsplan = pandas.DataFrame([row])
-    code, msg = frb_observing.ingest_obsplan(obsplan, user)
+    code, msg = frb_observing.ingest_obsplan(obsplan, user, 'Gemini-LP-2024A-99')
 
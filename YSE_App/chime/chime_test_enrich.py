@@ -0,0 +1,65 @@
+""" Test the local PS1 point-source cross-match of the broker crons """
+
+import os
+import tempfile
+
+import numpy as np
+
+from astropy.table import Table
+
+from YSE_App.common import healpix
+from YSE_App.data_ingest import alert_enrich
+
+
+def test_match_ps1_psc():
+    """ The nearest source within 3 arcsec, as by brute force """
+    rng = np.random.default_rng(42)
+    # Sources across RA=0 and near the pole
+    ras = np.concatenate([rng.uniform(-0.1, 0.1, 20000) % 360.,
+                          rng.uniform(0., 360., 20000)])
+    decs = np.concatenate([rng.uniform(-0.1, 0.1, 20000),
+                           rng.uniform(89.9, 90., 20000)])
+    scores = rng.uniform(0., 1., len(ras)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Two input files, merged into the partitions
+        half = len(ras)//2
+        infiles = []
+        for ii, sl in enumerate([slice(0, half), slice(half, None)]):
+            infile = os.path.join(tmpdir, f'psc{ii}.fits')
+            Table(dict(raMean=ras[sl], decMean=decs[sl],
+                       ps_score=scores[sl])).write(infile)
+            infiles.append(infile)
+        path = os.path.join(tmpdir, 'psc')
+        alert_enrich.build_ps1_psc(infiles, path)
+
+        # Alerts within ~4 arcsec of a source
+        isrc = rng.integers(0, len(ras), 200)
+        qras = (ras[isrc] + rng.uniform(-4., 4., 200)/3600 /
+                np.cos(np.deg2rad(decs[isrc])).clip(0.01)) % 360.
+        qdecs = np.clip(decs[isrc] + rng.uniform(-4., 4., 200)/3600, -90., 90.)
+        matched = alert_enrich.match_ps1_psc(qras, qdecs, path=path)
+        alert_enrich.load_partition.cache_clear()
+
+    for ii in range(len(qras)):
+        sep = healpix.separation(qras[ii], qdecs[ii], ras, decs)
+        inear = np.argmin(sep)
+        if sep[inear] <= alert_enrich.psc_radius:
+            assert matched[ii] == scores[inear]
+        else:
+            assert np.isnan(matched[ii])
+    assert np.sum(np.isfinite(matched)) > 0
+
+
+def test_remote_fallback():
+    """ Without a local catalog the remote query gets RA in [0,360) """
+    calls = []
+    def remote(ra, dec):
+        calls.append(ra)
+        if dec > 0:
+            raise IOError('MAST is down')
+        return 0.5
+
+    ps_probs = alert_enrich.ps_score([-1., 10.], [0., 1.], remote=remote)
+    assert ps_probs == [0.5, None]
+    assert calls == [359., 10.]
@@ -0,0 +1,128 @@
+""" Test and benchmark the analytic ephemeris backend against astroplan """
+
+import datetime
+import time
+
+import numpy as np
+
+from YSE_App.models import FRBFollowUpResource
+from YSE_App import frb_ephem
+from YSE_App import frb_visibility
+
+# Maunakea
+lon, lat, elev = -155.47, 19.82, 4213.
+
+
+def run_benchmark(nfrb:int=300, ndays:int=7, seed:int=1, verbose:bool=True):
+    """ Compare the minimum airmasses of random targets
+    from the two backends
+
+    Args:
+        nfrb (int, optional): Number of targets. Defaults to 300.
+        ndays (int, optional): Length of the run. Defaults to 7.
+        seed (int, optional): Random seed. Defaults to 1.
+        verbose (bool, optional): Print the timings. Defaults to True.
+
+    Returns:
+        tuple: min_AM from astroplan, min_AM from analytic
+    """
+    start = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    stop = start + datetime.timedelta(days=ndays)
+    rng = np.random.default_rng(seed)
+    ras = rng.uniform(0., 360., nfrb)
+    decs = np.rad2deg(np.arcsin(rng.uniform(-1., 1., nfrb)))
+
+    min_AMs, timings = [], []
+    for backend in frb_visibility.backends:
+        t0 = time.perf_counter()
+        grid = frb_visibility.VisibilityGrid(lon, lat, elev, start, stop,
+                                             backend=backend)
+        t1 = time.perf_counter()
+        min_AMs.append(grid.min_airmass(ras, decs))
+        t2 = time.perf_counter()
+        timings.append((len(grid.jd), t1-t0, t2-t1))
+
+    if verbose:
+        for backend, (nsamp, t_grid, t_eval) in zip(frb_visibility.backends, timings):
+            print(f'{backend}: {nsamp} samples, grid {t_grid:.3f}s, airmasses {t_eval:.4f}s')
+    return tuple(min_AMs)
+
+
+def test_ephem_vs_astroplan():
+    """ The analytic backend matches astroplan to 0.01 in airmass
+
+    Does not require the DB
+    """
+    AM_astroplan, AM_analytic = run_benchmark(verbose=False)
+
+    # Same targets below the horizon
+    assert np.all((AM_astroplan >= frb_visibility.below_horizon) ==
+                  (AM_analytic >= frb_visibility.below_horizon))
+    # Airmass
+    gd = AM_astroplan < 3.
+    assert np.max(np.abs(AM_astroplan[gd] - AM_analytic[gd])) < 0.01
+
+    # Sun
+    jd = 2460371.5 + np.linspace(0., 1., 25)
+    sun_alt = frb_ephem.sun_altitude(jd, lon, lat)
+    assert np.all(np.abs(sun_alt) <= 90.)
+
+
+def test_ephem_vs_altaz():
+    """ Both backends match the altitudes of astroplan's Observer.altaz()
+    for a handful of targets and times, to 0.01 in airmass
+
+    Does not require the DB
+    """
+    from astropy import units
+    from astropy.coordinates import EarthLocation, SkyCoord
+    from astropy.time import Time
+    from astroplan import Observer
+
+    tel = Observer(location=EarthLocation.from_geodetic(
+        lon*units.deg, lat*units.deg, elev*units.m), timezone="UTC")
+    ras = np.array([10., 95., 183.979572, 250., 330.])
+    decs = np.array([-30., 45., -13.0213, 5., 70.])
+    jds = 2460371.5 + np.array([0.3, 0.45, 0.6, 3.55, 6.4])
+    times = Time(jds, format='jd')
+
+    # Reference
+    altaz = tel.altaz(times[:, None], SkyCoord(ra=ras, dec=decs, unit='deg')[None, :])
+    alt_ref = altaz.alt.deg
+    up = alt_ref > 20.
+    assert np.sum(up) > 5
+
+    for backend in frb_visibility.backends:
+        grid = frb_visibility.VisibilityGrid(
+            lon, lat, elev, times[0].datetime, times[-1].datetime, backend=backend)
+        for jd, ref, gd in zip(jds, alt_ref, up):
+            # Precess and sidereal time as the grid does
+            grid.equinox = Time(jd, format='jd')
+            ra, dec = grid.precess(ras, decs)
+            if backend == 'astroplan':
+                lst = grid.equinox.sidereal_time('mean', longitude=lon*units.deg).rad
+            else:
+                lst = frb_ephem.lst(jd, lon)
+            alt = frb_ephem.altitude(ra, dec, lst, lat)
+            assert np.max(np.abs(1./np.sin(alt[gd]) - 1./np.sin(np.deg2rad(ref[gd])))) < 0.01
+
+
+def test_backends():
+    """ Both backends select the same FRBs for a resource
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frb_fu = FRBFollowUpResource.objects.get(name='Gemini-LP-2024A-99')
+
+    frbs_astroplan = frb_fu.get_frbs_by_mode(backend='astroplan')
+    frbs_analytic = frb_fu.get_frbs_by_mode(backend='analytic')
+
+    for key in frbs_astroplan.keys():
+        assert set(frbs_astroplan[key].values_list('id', flat=True)) == \
+            set(frbs_analytic[key].values_list('id', flat=True))
+
+
+if __name__ == '__main__':
+    AM_astroplan, AM_analytic = run_benchmark()
+    gd = AM_astroplan < 3.
+    print(f'max |dAM| (AM<3): {np.max(np.abs(AM_astroplan[gd]-AM_analytic[gd])):.5f}')
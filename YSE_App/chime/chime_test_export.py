@@ -0,0 +1,73 @@
+""" Test the paginated and streaming export of the FRB table """
+
+import io
+import json
+
+import pandas
+
+from YSE_App.models import FRBSummary
+from YSE_App import frb_export
+from YSE_App import frb_tables
+
+
+def test_pages():
+    """ The pages add up to the full table
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frbs = frb_tables.summary_table(columns=['DM', 'status'])
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = frb_tables.summary_page(columns=['DM', 'status'],
+                                               cursor=cursor, limit=2)
+        pages.append(page)
+        if cursor is None:
+            break
+    assert len(pages) >= 2
+    assert pandas.concat(pages, ignore_index=True).equals(frbs)
+
+
+def test_stream():
+    """ NDJSON and Arrow streams hold the full table
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frbs = frb_tables.summary_table()
+
+    # NDJSON
+    chunks, columns = frb_tables.summary_chunks(chunk=2)
+    lines = ''.join(frb_export.stream(chunks, 'ndjson')).splitlines()
+    assert len(lines) == len(frbs)
+    assert [json.loads(line)['TNS'] for line in lines] == frbs['TNS'].tolist()
+
+    # Arrow
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return
+    chunks, columns = frb_tables.summary_chunks(chunk=2)
+    schema = frb_export.arrow_schema(FRBSummary, columns,
+                                     list_types=frb_tables.summary_list_types)
+    data = b''.join(frb_export.stream(chunks, 'arrow', schema=schema))
+    tbl = pa.ipc.open_stream(io.BytesIO(data)).read_all()
+    assert tbl.num_rows == len(frbs)
+    assert tbl.column('TNS').to_pylist() == frbs['TNS'].tolist()
+
+
+def test_rename():
+    """ Renaming a tag or a status refreshes the summary
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    from YSE_App.models import FRBTransient
+
+    frb = FRBTransient.objects.get(name='FRB20300714A')
+    for obj, column in [(frb.frb_tags.first(), 'Tags'), (frb.status, 'status')]:
+        old_name = obj.name
+        obj.name = old_name + '_renamed'
+        obj.save()
+        assert obj.name in FRBSummary.objects.get(transient=frb).__dict__[column]
+        obj.name = old_name
+        obj.save()
+        assert obj.name + '_renamed' not in FRBSummary.objects.get(transient=frb).__dict__[column]
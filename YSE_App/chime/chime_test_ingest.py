@@ -0,0 +1,102 @@
+""" Test the bulk upsert of transients """
+
+from django.contrib import auth
+
+from YSE_App.models import Transient, TransientStatus, AlternateTransientNames
+from YSE_App.models import PhotometricBand, TransientPhotData
+from YSE_App import transient_ingest
+
+
+def test_upsert():
+    """ Create, then match by name and by position
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    status = TransientStatus.objects.all()[0]
+    names = ['2030test_a', '2030test_b']
+    Transient.objects.filter(name__in=names+['2030test_c']).delete()
+
+    upload = {name: dict(name=name, ra=10.+ii, dec=-20., obs_group='CHIME',
+                         status=status.name, disc_date='2030-07-14T00:00:00')
+              for ii, name in enumerate(names)}
+    results = transient_ingest.upsert_transients(upload, user)
+    assert [results[name]['action'] for name in names] == ['created']*2
+    transients = Transient.objects.filter(name__in=names)
+    assert transients.count() == 2
+    assert all([transient.healpix is not None for transient in transients])
+
+    # Same name
+    upload[names[0]]['redshift'] = 0.1
+    results = transient_ingest.upsert_transients({names[0]: upload[names[0]]}, user)
+    assert results[names[0]]['matched_by'] == 'name'
+    assert Transient.objects.get(name=names[0]).redshift == 0.1
+
+    # Same position (0.5"), new name
+    moved = dict(upload[names[1]], name='2030test_c', dec=-20.+0.5/3600)
+    results = transient_ingest.upsert_transients({'c': moved}, user)
+    assert results['c']['action'] == 'updated'
+    assert results['c']['matched_by'] == 'position'
+    assert results['c']['name'] == names[1]
+    assert AlternateTransientNames.objects.filter(
+        name='2030test_c', transient__name=names[1]).exists()
+
+    # Clean up
+    Transient.objects.filter(name__in=names).delete()
+
+
+def test_photometry_merge():
+    """ New points are added, matched points are clobbered
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    status = TransientStatus.objects.all()[0]
+    band = PhotometricBand.objects.all()[0]
+    name = '2030test_phot'
+    Transient.objects.filter(name=name).delete()
+
+    def upload(days:list, mag:float, clobber:bool):
+        photdata = {str(ii): dict(obs_date=f'2030-07-{day:02d}T00:00:00', band=band.name,
+                                  flux=None, flux_err=None, flux_zero_point=None,
+                                  mag=mag, mag_err=0.1, forced=False, diffim=True,
+                                  discovery_point=False, data_quality=None)
+                    for ii, day in enumerate(days)}
+        phot = dict(instrument=band.instrument.name, obs_group='CHIME', photdata=photdata)
+        transient = dict(name=name, ra=30., dec=-20., obs_group='CHIME', status=status.name,
+                         transientphotometry=dict(P1=phot, clobber=clobber, mjdmatchmin=0.01))
+        return transient_ingest.upsert_transients({name: transient}, user)
+
+    upload([1, 2, 3], 20., False)
+    points = TransientPhotData.objects.filter(photometry__transient__name=name)
+    assert points.count() == 3
+
+    # 2 matches (not clobbered), 1 new
+    upload([2, 3, 4], 19., False)
+    assert points.count() == 4
+    assert points.filter(mag=19.).count() == 1
+
+    # Clobber
+    upload([1, 4], 18., True)
+    assert points.count() == 4
+    assert points.filter(mag=18.).count() == 2
+
+    Transient.objects.filter(name=name).delete()
+
+
+def test_upload():
+    """ In-process upload of a cron job
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    status = TransientStatus.objects.all()[0]
+    name = '2030test_cron'
+    Transient.objects.filter(name=name).delete()
+
+    upload = {name: dict(name=name, ra=40., dec=-20., obs_group='CHIME', status=status.name)}
+    results = transient_ingest.upload_transients(upload, 'root', noupdatestatus=True)
+    assert transient_ingest.summary(results) == 'success: 1 created, 0 updated, 0 failed'
+    # The batch is not modified
+    assert 'noupdatestatus' not in upload.keys()
+
+    Transient.objects.filter(name=name).delete()
@@ -0,0 +1,45 @@
+""" Test the local Galactic foreground lookups """
+
+import os
+import tempfile
+
+import numpy as np
+
+from YSE_App import frb_ism
+
+
+def test_ang2pix_ring():
+    """ A few pixels of the RING scheme
+
+    Does not require the DB
+    """
+    # North and south poles, nside=1
+    assert frb_ism.ang2pix_ring(1, 0.01, 0.1)[0] == 0
+    assert frb_ism.ang2pix_ring(1, np.pi-0.01, 0.1)[0] == 8
+    # Equator
+    assert frb_ism.ang2pix_ring(1, np.pi/2, 0.)[0] == 4
+    # All pixels are hit
+    nside = 8
+    theta = np.arccos(np.linspace(-0.9999, 0.9999, 2000))
+    phi = np.linspace(0., 2*np.pi, 200, endpoint=False)
+    tt, pp = np.meshgrid(theta, phi)
+    pix = frb_ism.ang2pix_ring(nside, tt.ravel(), pp.ravel())
+    assert np.array_equal(np.unique(pix), np.arange(12*nside**2))
+
+
+def test_ne2001_lookup():
+    """ Interpolation of a (fake) grid, including the wrap in l
+
+    Does not require the DB
+    """
+    l = np.arange(0., 361., 1.)
+    b = np.arange(-90., 90.1, 0.5)
+    ll, bb = np.meshgrid(l, b, indexing='ij')
+    DM = 30. + 0.1*bb + 0.01*np.minimum(ll, 360.-ll)
+    grid_file = os.path.join(tempfile.mkdtemp(), 'ne2001_grid.npz')
+    np.savez(grid_file, l=l, b=b, DM=DM)
+
+    ql = np.array([10.25, 359.5, 370.25])
+    qb = np.array([5.1, -20., 5.1])
+    DMs = frb_ism.ne2001_lookup(grid_file, ql, qb)
+    assert np.allclose(DMs, 30. + 0.1*qb + 0.01*np.array([10.25, 0.5, 10.25]))
@@ -0,0 +1,117 @@
+""" Test the FRB job queue """
+
+import base64
+import datetime
+import json
+
+from django.contrib import auth
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from django.utils import timezone
+
+from YSE_App.models import FRBTransient, FRBJob
+from YSE_App import data_utils
+from YSE_App import frb_jobs
+
+
+def test_status_job():
+    """ Queue a status job and run it in this process
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    frb = FRBTransient.objects.get(name='FRB20300714A')
+
+    job = frb_jobs.submit('status', dict(ids=[frb.id]), user)
+    assert job.status == FRBJob.QUEUED
+
+    # Run
+    frb_jobs.work(worker='test', exit_when_empty=True)
+
+    job.refresh_from_db()
+    assert job.status == FRBJob.DONE
+    assert job.attempts == 1
+    frb.refresh_from_db()
+    assert job.result['status'][frb.name] == frb.status.name
+
+
+def test_failed_job():
+    """ A failing job is retried and then marked failed
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    # Missing ids
+    job = frb_jobs.submit('enrich', {})
+
+    # The retry waits
+    frb_jobs.work(worker='test', exit_when_empty=True)
+    job.refresh_from_db()
+    assert job.status == FRBJob.QUEUED
+    assert job.attempts == 1
+    assert job.run_after > job.finished_date
+    assert frb_jobs.claim(worker='test') is None
+
+    # Without the wait
+    retry_wait = frb_jobs.retry_wait
+    frb_jobs.retry_wait = 0.
+    job.run_after = None
+    job.save()
+    try:
+        frb_jobs.work(worker='test', exit_when_empty=True)
+    finally:
+        frb_jobs.retry_wait = retry_wait
+
+    job.refresh_from_db()
+    assert job.status == FRBJob.FAILED
+    assert job.attempts == frb_jobs.max_attempts
+    assert 'KeyError' in job.error
+
+
+def test_requeue_stale():
+    """ Orphaned jobs are re-queued, unless out of attempts
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    jobs = [frb_jobs.submit('status', dict(ids=[])) for _ in range(2)]
+    for job, attempts in zip(jobs, [1, frb_jobs.max_attempts]):
+        job.status = FRBJob.RUNNING
+        job.attempts = attempts
+        job.started_date = timezone.now() - datetime.timedelta(hours=2)
+        job.save()
+
+    assert frb_jobs.requeue_stale() == 1
+    for job in jobs:
+        job.refresh_from_db()
+    assert jobs[0].status == FRBJob.QUEUED
+    assert jobs[0].run_after > timezone.now()
+    assert jobs[1].status == FRBJob.FAILED
+    for job in jobs:
+        job.delete()
+
+
+def test_job_status_owner():
+    """ Only the owner of a job, or staff, see its status
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    other = User.objects.create_user('frbjob_other', password='not_root')
+    job = frb_jobs.submit('status', dict(ids=[]), user)
+
+    def job_status(username, password):
+        header = 'Basic ' + base64.b64encode(
+            f'{username}:{password}'.encode('utf-8')).decode('utf-8')
+        request = RequestFactory().post(
+            '/frb_job_status/', data=json.dumps(dict(job_id=job.id)),
+            content_type='application/json', HTTP_AUTHORIZATION=header)
+        return data_utils.frb_job_status(request)
+
+    try:
+        assert job_status('root', 'F4isthebest').status_code == 200
+        assert job_status('frbjob_other', 'not_root').status_code == 404
+        other.is_staff = True
+        other.save()
+        assert job_status('frbjob_other', 'not_root').status_code == 200
+    finally:
+        other.delete()
+        job.delete()
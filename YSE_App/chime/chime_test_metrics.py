@@ -0,0 +1,70 @@
+""" Test the request metrics """
+
+import time
+
+import numpy as np
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory
+
+from YSE_App.middleware import request_logger
+
+
+def test_summary():
+    """ Percentiles of the ring buffer """
+    request_logger.clear()
+    latencies = np.linspace(0.001, 0.1, 100)
+    for latency in latencies:
+        request_logger.record('get_host', 'GET', 200, latency, nquery=2, size=100)
+    request_logger.record('get_host', 'GET', 500, 0.2, nquery=1)
+
+    summary = request_logger.summary(force=True)
+    assert summary['nrequest'] == 101
+    view = summary['views']['get_host']
+    assert view['count'] == 101
+    assert np.isclose(view['p50'], 1e3*np.percentile(np.append(latencies, 0.2), 50))
+    assert view['max_queries'] == 2
+    assert view['mean_size'] == 100.
+    assert view['n5xx'] == 1
+
+    # Cached until the next aggregation
+    request_logger.record('get_host', 'GET', 200, 0.01)
+    assert request_logger.summary()['nrequest'] == 101
+    request_logger.clear()
+
+
+def test_middleware():
+    """ The middleware records the requests """
+    request_logger.clear()
+    middleware = request_logger.RequestLoggingMiddleware(
+        lambda request: JsonResponse({"test": 1}, status=201))
+    response = middleware(RequestFactory().post('/test/', data={'a': 1}))
+
+    summary = request_logger.summary(force=True)
+    assert summary['nrequest'] == 1
+    view = summary['views']['unresolved']
+    assert view['n4xx'] == 0
+    assert view['mean_size'] == len(response.content)
+    request_logger.clear()
+
+
+def test_middleware_streaming():
+    """ A streamed response is recorded once its content is sent """
+    request_logger.clear()
+
+    def content():
+        time.sleep(0.05)
+        yield b'a'*10
+        yield b'b'*5
+    middleware = request_logger.RequestLoggingMiddleware(
+        lambda request: StreamingHttpResponse(content()))
+    response = middleware(RequestFactory().get('/test/'))
+    assert request_logger.summary(force=True)['nrequest'] == 0
+
+    assert b''.join(response.streaming_content) == b'a'*10 + b'b'*5
+    summary = request_logger.summary(force=True)
+    assert summary['nrequest'] == 1
+    view = summary['views']['unresolved']
+    assert view['mean_size'] == 15
+    assert view['p50'] >= 50.
+    request_logger.clear()
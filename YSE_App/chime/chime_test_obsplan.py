@@ -10,6 +10,7 @@ from django.db.models import ForeignKey
 from django.http import HttpResponse,JsonResponse
 
 from YSE_App.models import FRBFollowUpResource
+from YSE_App.models import FRBFollowUpRequest
 from YSE_App.models import FRBTransient
 from YSE_App.models import FRBTag
 from YSE_App.models import TransientStatus
@@ -47,4 +48,27 @@ def test_ingest_obsplan():
 
     # Reset status
     transient.status = sv_status
-    transient.save()
\ No newline at end of file
+    transient.save()
+
+def test_obsplan_rollback():
+    """ A bad row leaves the pending requests untouched
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    resource = FRBFollowUpResource.objects.get(name='Gemini-LP-2024A-99')
+    sv_pending = set(FRBFollowUpRequest.objects.filter(
+        resource=resource).values_list('transient__name', 'mode'))
+
+    # Second FRB is not in the DB
+    obsplan = pandas.DataFrame([dict(TNS='FRB20300714A', Resource=resource.name,
+                                     mode='longslit'),
+                                dict(TNS='FRB20990101A', Resource=resource.name,
+                                     mode='longslit')])
+    code, msg = frb_observing.ingest_obsplan(obsplan, user, resource.name,
+                                             override=True)
+    assert code == 401
+
+    # Nothing changed
+    assert set(FRBFollowUpRequest.objects.filter(
+        resource=resource).values_list('transient__name', 'mode')) == sv_pending
@@ -0,0 +1,83 @@
+""" Test the registry of the FRBSampleCriteria (frb_criteria) """
+
+import numpy as np
+
+from django.contrib import auth
+
+from YSE_App.models import FRBTransient, FRBTag, FRBSampleCriteria
+from YSE_App.chime import chime_test_utils as ctu
+from YSE_App import frb_criteria
+from YSE_App import frb_tags
+
+
+def test_registry_columns():
+    """ The columns of the registry hold the FRBSampleCriteria
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    registry = frb_criteria.get_registry()
+    samples = list(FRBSampleCriteria.objects.all())
+    assert len(registry) == len(samples)
+    for sample in samples:
+        ii = registry.index[sample.name]
+        assert registry.names[ii] == sample.name
+        for col in frb_criteria.float_cols:
+            value = getattr(sample, col)
+            if value is None:
+                assert np.isnan(getattr(registry, col)[ii])
+            else:
+                assert getattr(registry, col)[ii] == value
+        for col in frb_criteria.bool_cols:
+            assert getattr(registry, col)[ii] == bool(getattr(sample, col))
+
+
+def test_registry_matrix():
+    """ Every registered sample gives the criteria of the per-FRB checks
+    (see chime_test_utils.chk_all_criteria_perfrb), for every FRB
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    registry = frb_criteria.get_registry()
+    assert len(registry) > 0
+    all_tags = [FRBTag.objects.get_or_create(name=name, defaults=dict(
+        created_by=user, modified_by=user))[0] for name in registry.names]
+
+    # Tag each FRB with every sample
+    frbs = list(FRBTransient.objects.all().order_by('name'))
+    orig_tags = {frb.id: list(frb.frb_tags.all()) for frb in frbs}
+    try:
+        for frb in frbs:
+            frb.frb_tags.add(*all_tags)
+        cmatrix = frb_tags.chk_all_criteria_bulk(
+            FRBTransient.objects.filter(id__in=orig_tags.keys()).order_by('name'))
+        assert np.all(cmatrix['member'])
+        for ii, frb in enumerate(frbs):
+            reference = ctu.chk_all_criteria_perfrb(frb)
+            for jj, name in enumerate(registry.names):
+                for key in frb_tags.criteria_keys:
+                    assert cmatrix[key][ii, jj] == reference[name][key], (frb.name, name, key)
+    finally:
+        for frb in frbs:
+            frb.frb_tags.set(orig_tags[frb.id])
+
+
+def test_registry_invalidate():
+    """ An edit of a FRBSampleCriteria reaches the registry
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    sample = FRBSampleCriteria.objects.all().order_by('name').first()
+    max_EBV = sample.max_EBV
+    assert frb_criteria.get_registry().max_EBV[
+        frb_criteria.get_registry().index[sample.name]] == max_EBV
+    try:
+        sample.max_EBV = max_EBV + 1.
+        sample.save()
+        registry = frb_criteria.get_registry()
+        assert registry.max_EBV[registry.index[sample.name]] == max_EBV + 1.
+    finally:
+        sample.max_EBV = max_EBV
+        sample.save()
+    registry = frb_criteria.get_registry()
+    assert registry.max_EBV[registry.index[sample.name]] == max_EBV
@@ -0,0 +1,130 @@
+""" Test the statuses set by frb_status.set_status_bulk() """
+
+import pandas
+
+from django.contrib import auth
+
+from YSE_App.models import FRBTransient, FRBTag, FRBSampleCriteria
+from YSE_App.models import FRBSurvey, FRBFollowUpRequest, FRBFollowUpResource
+from YSE_App.models import TransientStatus
+from YSE_App.galaxies import path
+from YSE_App import frb_status
+
+# Samples of the test:  name, min_POx, use_top_two, run_public_path, max_PUx
+samples = [('TestStatus-Blind', 0.9, False, True, 0.2),
+           ('TestStatus-Top2', 0.9, True, True, None),
+           ('TestStatus-NoPATH', 0.9, False, False, None)]
+# Tag without a FRBSampleCriteria
+no_criteria_tag = 'TestStatus-NoCriteria'
+
+# FRBs:  tags, fields, PATH (P(O|x), mag, P(U|x)), expected status
+test_frbs = {
+    'FRB20990101A': (['TestStatus-Blind'], {}, None, 'RunPublicPATH'),
+    'FRB20990101B': (['TestStatus-Blind'], dict(bright_star=True), None, 'BrightStar'),
+    'FRB20990101C': (['TestStatus-Blind'], dict(mw_ebv=0.5), None, 'TooDusty'),
+    'FRB20990101D': (['TestStatus-NoPATH'], {}, None, 'Unassigned'),
+    'FRB20990101E': (['TestStatus-Blind'], {}, ([0.98], [19.], 0.01), 'NeedSpectrum'),
+    'FRB20990101F': (['TestStatus-Blind', 'TestStatus-Top2'], {},
+                     ([0.6, 0.35], [20., 20.5], 0.01), 'NeedSpectrum'),
+    'FRB20990101G': (['TestStatus-Blind'], {}, ([0.5, 0.3], [20., 20.5], 0.01), 'AmbiguousHost'),
+    'FRB20990101H': (['TestStatus-Blind'], {}, ([0.98], [19.], 0.01), 'Redshift'),
+    'FRB20990101I': (['TestStatus-Blind'], {}, ([0.98], [19.], 0.5), 'NeedImage'),
+    'FRB20990101K': (['TestStatus-Blind'], {}, ([0.98], [19.], 0.01), 'SpectrumPending'),
+    # No criteria:  the status is kept
+    'FRB20990101J': ([no_criteria_tag], dict(status='TooFaint'), None, 'TooFaint'),
+}
+
+
+def add_test_frbs(user):
+    """ Add the samples, tags and FRBs of the test
+
+    Args:
+        user (User): user
+
+    Returns:
+        list: the FRBTransient objects
+    """
+    survey = FRBSurvey.objects.get(name='CHIME/FRB')
+    kw = dict(created_by=user, modified_by=user)
+    for name, min_POx, use_top_two, run_public_path, max_PUx in samples:
+        FRBSampleCriteria.objects.create(
+            name=name, frb_survey=survey, version='test', desc='chime_test_status',
+            weight=1., min_POx=min_POx, use_top_two=use_top_two, max_EBV=0.3,
+            max_mr=23., run_public_path=run_public_path, apply_bright_star=True,
+            max_PUx=max_PUx, **kw)
+    tags = {}
+    for name in [sample[0] for sample in samples] + [no_criteria_tag]:
+        tags[name], _ = FRBTag.objects.get_or_create(name=name, defaults=kw)
+
+    unassigned = TransientStatus.objects.get(name='Unassigned')
+    frbs, entries = [], []
+    for ii, (name, (tag_names, fields, path_vals, _)) in enumerate(test_frbs.items()):
+        frb = FRBTransient(name=name, ra=30.+ii, dec=-20., DM=500.,
+                           status=unassigned, frb_survey=survey, **kw)
+        frb.save()
+        # Past the enrichment of the post_save
+        fields = dict(dict(mw_ebv=0.05, DM_ISM=30.), **fields)
+        if 'status' in fields:
+            fields['status'] = TransientStatus.objects.get(name=fields['status'])
+        FRBTransient.objects.filter(id=frb.id).update(**fields)
+        frb.refresh_from_db()
+        frb.frb_tags.set([tags[tag_name] for tag_name in tag_names])
+        frbs.append(frb)
+
+        if path_vals is not None:
+            POx, mags, P_Ux = path_vals
+            candidates = pandas.DataFrame()
+            candidates['ra'] = [frb.ra + 0.001*(jj+1) for jj in range(len(POx))]
+            candidates['dec'] = frb.dec
+            candidates['ang_size'] = 1.
+            candidates['mag'] = mags
+            candidates['P_Ox'] = POx
+            entries.append(dict(transient=frb, candidates=candidates, Filter='r',
+                                inst_name='GPC1', obs_group='Pan-STARRS1', P_Ux=P_Ux))
+    path.ingest_path_results_bulk(entries, user, set_status=False)
+
+    # Redshift of the host
+    host = FRBTransient.objects.get(name='FRB20990101H').host
+    host.redshift, host.redshift_source = 0.1, 'Keck'
+    host.save()
+    # Spectrum requested
+    FRBFollowUpRequest.objects.create(
+        resource=FRBFollowUpResource.objects.get(name='Gemini-LP-2024A-99'),
+        transient=FRBTransient.objects.get(name='FRB20990101K'), mode='longslit', **kw)
+
+    return frbs
+
+
+def remove_test_frbs(frbs):
+    path.delete_path_entries_bulk(frbs)
+    for frb in frbs:
+        frb.delete()
+    FRBSampleCriteria.objects.filter(name__in=[sample[0] for sample in samples]).delete()
+    FRBTag.objects.filter(name__in=[sample[0] for sample in samples]+[no_criteria_tag]).delete()
+
+
+def test_status_bulk():
+    """ set_status_bulk() gives the expected status of each test FRB,
+    and keeps the status of an FRB whose tags have no criteria
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    frbs = add_test_frbs(user)
+    try:
+        all_status = frb_status.set_status_bulk(
+            FRBTransient.objects.filter(name__in=test_frbs.keys()))
+        for name, (_, _, _, expected) in test_frbs.items():
+            assert all_status[name] == expected, name
+            assert FRBTransient.objects.get(name=name).status.name == expected, name
+
+        # One at a time
+        for frb in FRBTransient.objects.filter(name__in=test_frbs.keys()):
+            frb.status = TransientStatus.objects.get(name='Unassigned')
+            frb.save()
+            frb_status.set_status(frb)
+            expected = test_frbs[frb.name][3]
+            assert frb.status.name == ('Unassigned' if frb.name == 'FRB20990101J'
+                                       else expected), frb.name
+    finally:
+        remove_test_frbs(frbs)
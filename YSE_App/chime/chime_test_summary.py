@@ -0,0 +1,109 @@
+""" Test the FRBSummary table and its incremental refresh """
+
+import numpy as np
+
+from django.contrib import auth
+
+from YSE_App.models import FRBTransient, FRBSummary, FRBTag, Path
+from YSE_App.models import FRBFollowUpRequest, FRBFollowUpResource
+from YSE_App import frb_tables
+
+
+def _same(value, expected):
+    """ None in the summary for NaN of the per-FRB properties """
+    if expected is None or (isinstance(expected, float) and np.isnan(expected)):
+        return value is None or (isinstance(value, float) and np.isnan(value))
+    return value == expected
+
+
+def chk_summary(frb):
+    """ The summary row of an FRB against its per-FRB properties,
+    as the original frb_tables.summary_table() computed them
+
+    Args:
+        frb (FRBTransient): FRBTransient instance
+    """
+    summ = FRBSummary.objects.get(transient=frb)
+    assert summ.TNS == frb.name
+    for col in ['ra', 'dec', 'a_err', 'b_err', 'theta', 'DM', 'DM_ISM',
+                'event_id', 'repeater', 'mw_ebv']:
+        assert _same(getattr(summ, col), getattr(frb, col)), (frb.name, col)
+    assert summ.frb_survey == str(frb.frb_survey)
+    assert summ.status == str(frb.status)
+    assert sorted(summ.Tags.split(',')) == sorted(frb.FRBTagsString().split(','))
+    assert summ.Resources == frb.FRBFollowUpResourcesString()
+    assert summ.Host == frb.HostString()
+
+    # Host
+    if frb.host is not None:
+        assert _same(summ.Host_mag, frb.host.path_mag), frb.name
+        assert _same(summ.POx, frb.host.P_Ox), frb.name
+        assert _same(summ.z, frb.host.redshift), frb.name
+        assert summ.z_qual == (-1 if frb.host.redshift_quality is None 
+                               else frb.host.redshift_quality)
+        assert summ.z_src == ('' if frb.host.redshift_source is None 
+                              else frb.host.redshift_source)
+    else:
+        assert summ.Host_mag is None and summ.POx is None and summ.z is None
+
+    # Top two candidates
+    for col, attr in [('cand_POx', 'P_Ox'), ('cand_gal_names', 'name'), 
+                      ('cand_gal_redshifts', 'redshift')]:
+        expected = frb_tables.get_top_two_pox_gal_attr(frb, attr=attr)
+        assert len(getattr(summ, col)) == len(expected), (frb.name, col)
+        for value, evalue in zip(getattr(summ, col), expected):
+            assert _same(value, evalue), (frb.name, col)
+
+
+def test_summary_rows():
+    """ Each summary row matches the per-FRB properties
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    frbs = FRBTransient.objects.all()
+    assert FRBSummary.objects.count() == frbs.count()
+    for frb in frbs:
+        chk_summary(frb)
+
+
+def test_summary_refresh():
+    """ The row of an FRB is refreshed after a change of its 
+    PATH, tags or follow-up
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+    user = auth.authenticate(username='root', password='F4isthebest')
+    frb = FRBTransient.objects.exclude(host=None).order_by('name').first()
+    chk_summary(frb)
+
+    # Path
+    ipath = Path.objects.get(transient=frb, galaxy=frb.host)
+    P_Ox = ipath.P_Ox
+    ipath.P_Ox = P_Ox - 0.01
+    ipath.save()
+    assert np.isclose(FRBSummary.objects.get(transient=frb).POx, P_Ox - 0.01)
+    chk_summary(frb)
+    ipath.P_Ox = P_Ox
+    ipath.save()
+    assert np.isclose(FRBSummary.objects.get(transient=frb).POx, P_Ox)
+
+    # Tag
+    tag, _ = FRBTag.objects.get_or_create(name='TestSummary', defaults=dict(
+        created_by=user, modified_by=user))
+    frb.frb_tags.add(tag)
+    assert 'TestSummary' in FRBSummary.objects.get(transient=frb).Tags
+    chk_summary(frb)
+    frb.frb_tags.remove(tag)
+    assert 'TestSummary' not in FRBSummary.objects.get(transient=frb).Tags
+    tag.delete()
+
+    # Follow-up
+    resource = FRBFollowUpResource.objects.get(name='Gemini-LP-2024A-99')
+    request = FRBFollowUpRequest.objects.create(
+        resource=resource, transient=frb, mode='imaging', 
+        created_by=user, modified_by=user)
+    assert resource.name in FRBSummary.objects.get(transient=frb).Resources
+    chk_summary(frb)
+    request.delete()
+    assert resource.name not in FRBSummary.objects.get(transient=frb).Resources
+    chk_summary(frb)
@@ -97,4 +97,40 @@ def test_status():
     # Revert
     status = TransientStatus.objects.get(name='New')
     itransient.status = status
-    itransient.save()
\ No newline at end of file
+    itransient.save()
+
+
+def test_host_path_cuts():
+    """ Test the annotated PATH items match the FRBGalaxy/FRBTransient properties
+
+    This test requires the DB was populated using chime_test_db.build_chime_test_db()
+    """
+
+    # Resource
+    frb_fu = FRBFollowUpResource.objects.get(name='Gemini-LP-2024A-99')
+    gd_frbs = frb_targeting.targetfrbs_for_fu(frb_fu).filter(host__isnull=False)
+
+    for frb in gd_frbs.with_path_stats():
+        assert frb.host_POx == frb.host.P_Ox
+        assert frb.host_path_mag == frb.host.path_mag
+        assert np.isclose(frb.path_sum_top_two, frb.sum_top_two_PATH)
+        assert np.isclose(frb.path_mag_top_two, frb.mag_top_two_PATH)
+        best = frb.best_Path_galaxy
+        assert frb.best_path_galaxy_id == (best.id if best is not None else None)
+
+
+def test_seed():
+    """ Test that a seed gives a reproducible selection
+    """
+
+    # Resource
+    frb_fu = FRBFollowUpResource.objects.get(name='Gemini-LP-2024A-99')
+    frbs_by_mode = frb_fu.get_frbs_by_mode()
+
+    sel1 = frb_targeting.select_with_priority(frb_fu, frbs_by_mode, seed=1234)
+    sel2 = frb_targeting.select_with_priority(frb_fu, frbs_by_mode, seed=1234)
+
+    # Test
+    for mode in sel1.keys():
+        assert set(sel1[mode].values_list('id', flat=True)) == \
+            set(sel2[mode].values_list('id', flat=True))
@@ -1,7 +1,9 @@
 """ Common methods for CHIME tests """
 
+import numpy as np
 import pandas
 
+from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import ForeignKey
 
 from YSE_App.models import *
@@ -96,4 +98,177 @@ def clean_all(skip_resources:bool=False):
 
     print("Removing FRBTransient objects")
     for itransient in FRBTransient.objects.all():
-        itransient.delete()
\ No newline at end of file
+        itransient.delete()
+
+
+def chk_all_criteria_perfrb(frb):
+    """ Reference:  the per-FRB criteria checks that
+    frb_tags.chk_all_criteria_bulk() replaced, one query per item
+
+    As the original loop on the tags of the FRB, except that tags
+    without a FRBSampleCriteria are skipped (not created) and that
+    missing values (E(B-V), P(U|x), redshift source, PATH magnitude)
+    fail their criterion instead of raising
+
+    Args:
+        frb (FRBTransient): FRBTransient instance
+
+    Returns:
+        dict: list of the value of each criterion, keyed by sample name
+    """
+    good_z_sources = ['FFFF', 'Keck', 'Lick', 'Gemini', 'MMT']
+    good_z = lambda gal: gal.redshift is not None and gal.redshift_source is not None \
+        and np.any([gd_source in gal.redshift_source for gd_source in good_z_sources])
+
+    all_criteria = {}
+    for frb_tag in frb.frb_tags.all():
+        sample = FRBSampleCriteria.objects.filter(name=frb_tag.name).first()
+        if sample is None:
+            continue
+        criteria = {}
+        criteria['bright_star'] = bool(sample.apply_bright_star and frb.bright_star)
+        criteria['EBV'] = frb.mw_ebv is not None and sample.max_EBV is not None \
+            and frb.mw_ebv < sample.max_EBV
+        criteria['run_public_PATH'] = bool(sample.run_public_path)
+        criteria['skip_need_image'] = bool(sample.skip_need_image)
+
+        POx_values, galaxies, path_objs = frb.get_Path_values()
+        if frb.host is None or len(POx_values) == 0:
+            for key in ['POx', 'POx_primary', 'PUx', 'ran_deep_PATH', 'z_done',
+                        'z_consistent', 'z_primary', 'too_faint']:
+                criteria[key] = False
+            criteria['N_POx'] = 0
+            all_criteria[sample.name] = criteria
+            continue
+
+        argsrt = np.argsort(POx_values)
+        pri_gal = galaxies[argsrt[-1]]  # Primary galaxy
+
+        # P(O|x)
+        criteria['POx_primary'] = np.max(POx_values) > sample.min_POx
+        if sample.use_top_two:
+            criteria['N_POx'] = 2
+            criteria['POx'] = frb.sum_top_two_PATH > sample.min_POx
+        else:
+            criteria['N_POx'] = 1
+            criteria['POx'] = criteria['POx_primary']
+
+        # P(U|x)
+        criteria['PUx'] = sample.max_PUx is not None and frb.P_Ux is not None \
+            and frb.P_Ux > sample.max_PUx
+
+        # Ran deep PATH?
+        rfilter = pri_gal.FilterMagString()[0]
+        criteria['ran_deep_PATH'] = not ('Blanco' in rfilter or 'DECam' in rfilter
+                                         or 'Pan-STARRS' in rfilter)
+
+        # Redshifts
+        criteria['z_primary'] = good_z(pri_gal)
+        if criteria['POx_primary']:
+            criteria['z_done'] = good_z(pri_gal)
+            criteria['z_consistent'] = True
+        else:
+            idxs = argsrt[-2:]
+            criteria['z_done'] = bool(np.all([good_z(galaxies[idx]) for idx in idxs]))
+            criteria['z_consistent'] = criteria['z_done'] and (len(idxs) == 1 or
+                np.abs(galaxies[idxs[-1]].redshift - galaxies[idxs[-2]].redshift) <= 0.003)
+
+        # Too faint?
+        try:
+            mag = path_objs[argsrt[-1]].galaxy_mag
+        except (IndexError, ObjectDoesNotExist):
+            mag = None
+        criteria['too_faint'] = sample.max_mr is not None and mag is not None \
+            and mag > sample.max_mr
+
+        all_criteria[sample.name] = criteria
+
+    return all_criteria
+
+
+def status_perfrb(frb):
+    """ Reference:  the per-FRB status decision tree that
+    frb_status.set_status_bulk() replaced;  nothing is saved
+
+    Args:
+        frb (FRBTransient): FRBTransient instance
+
+    Returns:
+        str: name of the status;  None if none of the tags
+            of the FRB has criteria
+    """
+    all_criteria = chk_all_criteria_perfrb(frb)
+    if len(all_criteria) == 0:
+        return None
+    criteria = {key: np.array([all_criteria[name][key] for name in all_criteria])
+                for key in list(all_criteria.values())[0].keys()}
+    PATH_run = frb.host is not None
+
+    # Is the top candidate too faint?
+    r_too_faint = False
+    POx_values, galaxies, _ = frb.get_Path_values()
+    if frb.host is not None and len(galaxies) > 0:
+        pri_gal = galaxies[np.argsort(POx_values)[-1]]
+        fm = pri_gal.FilterMagString()
+        if fm != 'None':
+            rfilter, mag = fm[0], float(fm[1])
+            if 'Blanco' in rfilter or 'DECam' in rfilter:
+                r_too_faint = mag > 23.0
+            elif 'Pan-STARRS' in rfilter:
+                r_too_faint = mag > 21.0
+
+    fu_req = FRBFollowUpRequest.objects.filter(transient=frb)
+    fu_obs = FRBFollowUpObservation.objects.filter(transient=frb, success=True)
+    image_pending = fu_req.filter(mode='imaging').exists()
+    image_done = fu_obs.filter(mode='imaging').exists()
+
+    if np.all(criteria['bright_star']):
+        return 'BrightStar'
+    if np.all(np.invert(criteria['bright_star']) & np.invert(criteria['EBV'])):
+        return 'TooDusty'
+    if np.any(np.invert(criteria['bright_star']) & criteria['EBV'] & 
+              criteria['run_public_PATH']):
+        if not PATH_run:
+            return 'RunPublicPATH'
+    else:
+        return 'Unassigned'
+
+    good = np.invert(criteria['bright_star']) & criteria['EBV'] & \
+        criteria['run_public_PATH']
+    good_idx = np.where(good)[0]
+
+    if image_pending:
+        return 'ImagePending'
+    if (np.any(criteria['PUx'][good_idx] & np.invert(criteria['skip_need_image'][good_idx])) or (
+            r_too_faint & (not np.all(criteria['skip_need_image'])))) and (
+            not image_pending) and (not image_done):
+        return 'NeedImage'
+    if image_done and (not criteria['ran_deep_PATH'][0]):
+        return 'RunDeepPATH'
+    if np.any(criteria['PUx'][good_idx] & criteria['ran_deep_PATH'][good_idx]):
+        return 'UnseenHost'
+    if np.all(np.invert(criteria['POx'][good_idx])):
+        return 'AmbiguousHost'
+
+    status = None
+    if frb.host is not None and frb.host.redshift is not None and \
+            np.any(criteria['POx'][good_idx]):
+        if np.any(criteria['z_done'][good_idx] & criteria['z_consistent'][good_idx]):
+            return 'Redshift'
+        if np.any(criteria['z_done'][good_idx] & np.invert(criteria['z_consistent'][good_idx])):
+            return 'AmbiguousHost'
+        if np.any(criteria['z_primary'][good_idx]):
+            # Unless a spectrum is pending or done
+            status = 'NeedSecondary'
+
+    if frb.host is not None and np.all(criteria['too_faint'][good_idx]):
+        return 'TooFaint'
+    if fu_req.filter(mode__in=['longslit','mask']).exists():
+        return 'SpectrumPending'
+    if fu_obs.filter(mode__in=['longslit','mask']).exists():
+        return 'GoodSpectrum'
+    if status is not None:
+        return status
+    if frb.host is not None and np.any(criteria['POx'][good_idx]):
+        return 'NeedSpectrum'
+    return 'Unassigned'
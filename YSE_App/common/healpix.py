@@ -0,0 +1,364 @@
+""" HEALPix spatial index for cone searches
+
+Host, Transient, FRBGalaxy and FRBTransient carry an indexed
+`healpix` column:  the RING-scheme pixel of (ra,dec) at NSIDE=4096
+(pixels of ~0.86 arcmin).  It is set on save (see set_healpix()).
+
+In the RING scheme the pixels of a ring of constant Dec have
+consecutive indices, so a cone maps to one pixel range per ring
+crossed.  cone_search() filters on these ranges (an index range scan)
+and computes exact separations only for the few rows that pass.
+
+cone_queryset() and box_q() build these filters for any QuerySet of
+a model with ra, dec and healpix (e.g. Transient, FRBTransient):  the
+separation is computed in SQL and the pixel ranges and coordinates are
+passed as query parameters.
+"""
+
+import numpy as np
+
+from django.db.models import Q, F, Value, FloatField
+from django.db.models.functions import ASin, Cos, Degrees, Power, Radians, Sin, Sqrt
+
+# Resolution of the index
+nside = 4096
+# Upper bound on the center-to-corner distance of a pixel is ~1.07/nside [rad]
+pixrad_factor = 1.2
+# Beyond this many rings, filter on the single range of the Dec band
+max_ranges = 200
+
+
+def ang2pix_ring(nside:int, theta, phi):
+    """ HEALPix pixel index in the RING scheme
+
+    Follows ang2pix_ring of the HEALPix library
+
+    Args:
+        nside (int): HEALPix NSIDE
+        theta (np.ndarray): colatitude [rad]
+        phi (np.ndarray): longitude [rad]
+
+    Returns:
+        np.ndarray: pixel indices
+    """
+    z = np.cos(np.atleast_1d(theta))
+    za = np.abs(z)
+    tt = np.mod(np.atleast_1d(phi), 2*np.pi) / (0.5*np.pi)  # in [0,4)
+    pix = np.zeros(z.shape, dtype=np.int64)
+
+    # Equatorial region
+    eq = za <= 2./3
+    temp1 = nside*(0.5 + tt[eq])
+    temp2 = nside*z[eq]*0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ir = nside + 1 + jp - jm
+    kshift = 1 - (ir & 1)
+    ip = np.mod((jp + jm - nside + kshift + 1) // 2, 4*nside)
+    pix[eq] = 2*nside*(nside-1) + (ir-1)*4*nside + ip
+
+    # Polar caps
+    cap = ~eq
+    tp = tt[cap] - np.floor(tt[cap])
+    tmp = nside*np.sqrt(3*(1-za[cap]))
+    jp = (tp*tmp).astype(np.int64)
+    jm = ((1.-tp)*tmp).astype(np.int64)
+    ir = jp + jm + 1
+    ip = np.mod((tt[cap]*ir).astype(np.int64), 4*ir)
+    pix[cap] = np.where(z[cap] > 0, 2*ir*(ir-1) + ip,
+                        12*nside**2 - 2*ir*(ir+1) + ip)
+    return pix
+
+def radec_to_pix(ra, dec, nside:int=nside):
+    """ Index pixels of a set of coordinates
+
+    Args:
+        ra (float or np.ndarray): RA [deg]
+        dec (float or np.ndarray): Dec [deg]
+        nside (int, optional): HEALPix NSIDE. Defaults to 4096.
+
+    Returns:
+        np.ndarray: pixel indices (RING)
+    """
+    return ang2pix_ring(nside, np.deg2rad(90.-np.asarray(dec, dtype=float)),
+                        np.deg2rad(np.asarray(ra, dtype=float)))
+
+def ring_info(nside:int, iring):
+    """ Geometry of a set of rings
+
+    Args:
+        nside (int): HEALPix NSIDE
+        iring (np.ndarray): ring indices, 1 (north) to 4*nside-1
+
+    Returns:
+        tuple: z of the ring centers, first pixel, number of pixels,
+            and whether the pixel centers are offset by half a pixel
+    """
+    iring = np.atleast_1d(iring).astype(np.int64)
+    north = iring < nside
+    south = iring > 3*nside
+    ii = np.where(south, 4*nside - iring, iring)
+
+    z = np.where(north | south, 1. - ii**2/(3.*nside**2),
+                 4./3 - 2.*iring/(3.*nside))
+    z = np.where(south, -z, z)
+    npix = np.where(north | south, 4*ii, 4*nside)
+    startpix = np.where(north, 2*ii*(ii-1),
+                        np.where(south, 12*nside**2 - 2*ii*(ii+1),
+                                 2*nside*(nside-1) + (iring-nside)*4*nside))
+    shifted = north | south | (((iring - nside) & 1) == 0)
+    return z, startpix, npix, shifted
+
+def _ring_of_z(nside:int, z:float):
+    """ (Fractional) ring index at a given z """
+    if z > 2./3:
+        return nside*np.sqrt(3*(1-z))
+    elif z < -2./3:
+        return 4*nside - nside*np.sqrt(3*(1+z))
+    return nside*(2. - 1.5*z)
+
+def disc_ranges(ra:float, dec:float, radius:float, nside:int=nside):
+    """ Pixel ranges covering a cone (inclusive)
+
+    Every pixel whose center lies within radius plus the maximum
+    pixel radius is included, so no pixel touching the cone is missed
+
+    Args:
+        ra (float): RA of the center [deg]
+        dec (float): Dec of the center [deg]
+        radius (float): radius [deg]
+        nside (int, optional): HEALPix NSIDE. Defaults to 4096.
+
+    Returns:
+        list: (first, last) pixel index ranges, inclusive
+    """
+    theta0 = np.deg2rad(90.-dec)
+    phi0 = np.deg2rad(ra) % (2*np.pi)
+    rad = np.deg2rad(radius) + pixrad_factor/nside
+
+    # Rings in the Dec band
+    zmax = np.cos(max(theta0 - rad, 0.))
+    zmin = np.cos(min(theta0 + rad, np.pi))
+    imin = max(int(np.floor(_ring_of_z(nside, zmax))), 1)
+    imax = min(int(np.ceil(_ring_of_z(nside, zmin))), 4*nside-1)
+    if imax - imin + 1 > max_ranges:
+        startpix = ring_info(nside, [imin, imax])[1]
+        npix = ring_info(nside, imax)[2][0]
+        return [(int(startpix[0]), int(startpix[1] + npix - 1))]
+
+    z, startpix, npix, shifted = ring_info(nside, np.arange(imin, imax+1))
+    sin_theta = np.sqrt(1. - z**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosd = (np.cos(rad) - z*np.cos(theta0)) / (sin_theta*np.sin(theta0))
+
+    ranges = []
+    for iz in range(len(z)):
+        n = int(npix[iz])
+        start = int(startpix[iz])
+        if not np.isfinite(cosd[iz]):
+            # Cone centered on a pole:  whole ring or none
+            if z[iz]*np.cos(theta0) >= np.cos(rad):
+                ranges.append((start, start+n-1))
+            continue
+        if cosd[iz] <= -1.:
+            # The cone holds a pole
+            ranges.append((start, start+n-1))
+            continue
+        if cosd[iz] > 1.:
+            continue
+        dphi = np.arccos(cosd[iz])
+        step = 2*np.pi / n
+        shift = 0.5 if shifted[iz] else 0.
+        jlo = int(np.ceil((phi0 - dphi)/step - shift))
+        jhi = int(np.floor((phi0 + dphi)/step - shift))
+        if jhi < jlo:
+            continue
+        if jhi - jlo + 1 >= n:
+            ranges.append((start, start+n-1))
+        elif jlo < 0:
+            ranges += [(start, start+jhi), (start+n+jlo, start+n-1)]
+        elif jhi >= n:
+            ranges += [(start, start+jhi-n), (start+jlo, start+n-1)]
+        else:
+            ranges.append((start+jlo, start+jhi))
+
+    # Merge
+    ranges.sort()
+    merged = []
+    for lo, hi in ranges:
+        if len(merged) > 0 and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def cone_q(ra:float, dec:float, radius:float, field:str='healpix'):
+    """ Q object selecting the pixels of a cone
+
+    Args:
+        ra (float): RA of the center [deg]
+        dec (float): Dec of the center [deg]
+        radius (float): radius [deg]
+        field (str, optional): name of the pixel field. Defaults to 'healpix'.
+
+    Returns:
+        Q: the pixel ranges, OR'ed
+    """
+    q = Q()
+    for lo, hi in disc_ranges(ra, dec, radius):
+        q |= Q(**{f'{field}__range': (lo, hi)}) if lo != hi else Q(**{field: lo})
+    return q
+
+def separation(ra1, dec1, ra2, dec2):
+    """ Angular separation (haversine)
+
+    Args:
+        ra1, dec1, ra2, dec2 (float or np.ndarray): coordinates [deg]
+
+    Returns:
+        np.ndarray: separation [deg]
+    """
+    ra1, dec1, ra2, dec2 = [np.deg2rad(np.asarray(x, dtype=float))
+                            for x in (ra1, dec1, ra2, dec2)]
+    hav = np.sin((dec2-dec1)/2)**2 + np.cos(dec1)*np.cos(dec2)*np.sin((ra2-ra1)/2)**2
+    return np.rad2deg(2*np.arcsin(np.sqrt(np.clip(hav, 0., 1.))))
+
+def sql_separation(ra:float, dec:float, ra_field:str='ra', dec_field:str='dec'):
+    """ Expression of the angular separation (haversine) to a point
+
+    Args:
+        ra (float): RA of the point [deg]
+        dec (float): Dec of the point [deg]
+        ra_field (str, optional): name of the RA field. Defaults to 'ra'.
+        dec_field (str, optional): name of the Dec field. Defaults to 'dec'.
+
+    Returns:
+        Func: separation [deg]
+    """
+    ra0 = Radians(Value(float(ra), output_field=FloatField()))
+    dec0 = Radians(Value(float(dec), output_field=FloatField()))
+    ra1, dec1 = Radians(F(ra_field)), Radians(F(dec_field))
+    hav = Power(Sin((dec1 - dec0)/2), 2) + \
+        Cos(dec0)*Cos(dec1)*Power(Sin((ra1 - ra0)/2), 2)
+    return Degrees(2*ASin(Sqrt(hav)))
+
+def cone_queryset(qs, ra:float, dec:float, radius:float):
+    """ Restrict a QuerySet to a cone, nearest first
+
+    One query:  the pixel ranges select the candidates from the index
+    and the separation, computed in SQL, is annotated as `sep` [deg]
+
+    Args:
+        qs (QuerySet): of a model with ra, dec and healpix
+        ra (float): RA of the center [deg]
+        dec (float): Dec of the center [deg]
+        radius (float): radius [deg]
+
+    Returns:
+        QuerySet: the objects in the cone, annotated with sep [deg]
+    """
+    return qs.filter(cone_q(ra, dec, radius)).annotate(
+        sep=sql_separation(ra, dec)).filter(
+            sep__lte=float(radius)).order_by('sep')
+
+def cone_search(qs, ra:float, dec:float, radius:float):
+    """ Objects of a QuerySet within a cone, nearest first
+
+    Args:
+        qs (QuerySet): of a model with ra, dec and healpix
+        ra (float): RA of the center [deg]
+        dec (float): Dec of the center [deg]
+        radius (float): radius [deg]
+
+    Returns:
+        list: (object, separation [deg]) tuples
+    """
+    return [(obj, float(obj.sep))
+            for obj in cone_queryset(qs, ra, dec, radius)]
+
+def box_q(ra:float, dec:float, ra_width:float, dec_width:float):
+    """ Q object selecting an RA, Dec box
+
+    The RA range is widened by 1/cos(Dec) at the Dec edge closest
+    to a pole and split in two if it wraps at 0/360;  if the box
+    holds a pole, all RAs are kept.  The pixels of the cone
+    enclosing the box are also required so the index is used.
+
+    Args:
+        ra (float): RA of the center [deg]
+        dec (float): Dec of the center [deg]
+        ra_width (float): full width on the sky along RA [deg]
+        dec_width (float): full width along Dec [deg]
+
+    Returns:
+        Q: the box
+    """
+    ra = ra % 360.
+    decmin, decmax = max(dec - dec_width/2, -90.), min(dec + dec_width/2, 90.)
+    q = Q(dec__gte=decmin, dec__lte=decmax)
+
+    cosmin = min(np.cos(np.deg2rad(decmin)), np.cos(np.deg2rad(decmax)))
+    halfra = 180. if cosmin <= 0. else ra_width/2/cosmin
+    if halfra < 180.:
+        ramin, ramax = (ra - halfra) % 360., (ra + halfra) % 360.
+        if ramin <= ramax:
+            q &= Q(ra__gte=ramin, ra__lte=ramax)
+        else:
+            q &= Q(ra__gte=ramin) | Q(ra__lte=ramax)
+
+    # Enclosing cone:  dDec plus the arc along the parallel
+    cosmax = 1. if decmin <= 0. <= decmax else \
+        max(np.cos(np.deg2rad(decmin)), np.cos(np.deg2rad(decmax)))
+    radius = dec_width/2 + min(halfra, 180.)*cosmax
+    if radius < 90.:
+        q &= cone_q(ra, dec, radius)
+    return q
+
+
+# #########################################################
+# Maintenance
+# #########################################################
+
+def set_healpix(sender, instance, *args, **kwargs):
+    """ pre_save receiver:  keep the healpix column in sync with ra, dec """
+    if instance.ra is not None and instance.dec is not None:
+        instance.healpix = int(radec_to_pix(instance.ra, instance.dec)[0])
+
+def assign(objs:list):
+    """ Set the healpix of unsaved instances, e.g. before a bulk_create
+    (which skips the pre_save signal)
+
+    Args:
+        objs (list): model instances with ra, dec
+    """
+    if len(objs) == 0:
+        return
+    pixs = radec_to_pix([obj.ra for obj in objs], [obj.dec for obj in objs])
+    for obj, pix in zip(objs, pixs):
+        obj.healpix = int(pix)
+
+def backfill(model, chunk:int=5000):
+    """ Set the healpix column of all the rows of a model
+
+    Also used by the migration adding the column
+
+    Args:
+        model (django model): model with ra, dec and healpix
+        chunk (int, optional): rows per UPDATE. Defaults to 5000.
+
+    Returns:
+        int: number of rows updated
+    """
+    nrow, after = 0, 0
+    while True:
+        rows = list(model.objects.filter(pk__gt=after).order_by('pk').values_list(
+            'pk', 'ra', 'dec')[:chunk])
+        if len(rows) == 0:
+            return nrow
+        pks, ras, decs = zip(*rows)
+        pixs = radec_to_pix(ras, decs)
+        model.objects.bulk_update([model(pk=pk, healpix=int(pix))
+                                   for pk, pix in zip(pks, pixs)],
+                                  ['healpix'], batch_size=chunk)
+        nrow += len(rows)
+        after = pks[-1]
@@ -10,6 +10,7 @@ import sys
 from requests.auth import HTTPBasicAuth
 import configparser
 from YSE_App.models import Transient, TransientTag, AlternateTransientNames
+from YSE_App import transient_ingest
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import smtplib
@@ -204,13 +205,10 @@ class GaiaLC(CronJobBase):
 
     def UploadTransients(self,TransientUploadDict):
 
-        url = '%s'%self.options.dburl.replace('/api','/add_transient')
+        # In-process:  no HTTP round trip back to add_transient
         try:
-            r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-                              auth=HTTPBasicAuth(self.options.dblogin,self.options.dbpassword),
-                              timeout=60)
-            try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-            except: print(r.text)
+            results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+            print('YSE_PZ says: %s'%transient_ingest.summary(results))
             print("Process done.")
 
         except Exception as e:
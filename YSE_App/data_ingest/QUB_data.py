@@ -33,6 +33,8 @@ from antares_client.search import cone_search
 from string import ascii_lowercase
 import itertools
 from YSE_App.common.utilities import getRADecBox
+from YSE_App import transient_ingest
+from YSE_App.data_ingest import alert_enrich
 
 def iter_all_strings():
     for size in itertools.count(1):
@@ -44,17 +46,6 @@ def iter_all_strings():
 psst_image_url = "https://psweb.mp.qub.ac.uk/sne/ps13pi/media/images/data/ps13pi"
 yse_image_url = "https://psweb.mp.qub.ac.uk/sne/ps1yse/media/images/data/ps1yse"
 
-try:
-  from dustmaps.sfd import SFDQuery
-  sfd = SFDQuery()
-except:
-  raise RuntimeError("""can\'t import dust maps
-
-run:
-import dustmaps
-import dustmaps.sfd
-dustmaps.sfd.fetch()""")
-
 def fluxToMicroJansky(adu, exptime, zp):
     factor = 10**(-0.4*(zp-23.9))
     uJy = adu/exptime*factor
@@ -297,15 +288,12 @@ class QUB(CronJobBase):
         obj,ra,dec = [],[],[]
         nsn = 0
 
-        for i,s in enumerate(summary[transient_idx:transient_idx+max_transients]):
+        rows = summary[transient_idx:transient_idx+max_transients]
+        # E(B-V) and point-source score of the batch at once
+        mw_ebvs,ps_probs = alert_enrich.enrich(rows['ra_psf'],rows['dec_psf'],remote=get_ps_score)
+        for i,s in enumerate(rows):
             
-            sc = SkyCoord(s['ra_psf'],s['dec_psf'],unit=u.deg)
-            try:
-                ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-            except:
-                ps_prob = None
-
-            mw_ebv = float('%.3f'%(sfd(sc)*0.86))
+            mw_ebv,ps_prob = mw_ebvs[i],ps_probs[i]
 
             iLC = (lc['ps1_designation'] == s['ps1_designation']) & (nowmjd - lc['mjd_obs'] < self.options.max_days)
 
@@ -458,12 +446,9 @@ class QUB(CronJobBase):
                         
     def UploadTransients(self,TransientUploadDict):
 
-        url = '%s'%self.options.dburl.replace('/api','/add_transient')
-        r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-                          auth=HTTPBasicAuth(self.options.dblogin,self.options.dbpassword))
-
-        try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-        except: print(r.text)
+        # In-process:  no HTTP round trip back to add_transient
+        results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+        print('YSE_PZ says: %s'%transient_ingest.summary(results))
         print("Process done.")
 
 class YSE(CronJobBase):
@@ -648,7 +633,10 @@ class YSE(CronJobBase):
         obj,ra,dec = [],[],[]
         nsn = 0
 
-        for i,s in enumerate(summary[transient_idx:transient_idx+max_transients]):
+        rows = summary[transient_idx:transient_idx+max_transients]
+        # E(B-V) and point-source score of the batch at once
+        mw_ebvs,ps_probs = alert_enrich.enrich(rows['ra_psf'],rows['dec_psf'],remote=get_ps_score)
+        for i,s in enumerate(rows):
 
             if s['ra_psf'] < 0:
                 s['ra_psf'] += 360 # WTF....
@@ -696,13 +684,7 @@ class YSE(CronJobBase):
                 has_forced_phot = False
 
 
-            sc = SkyCoord(s['ra_psf'],s['dec_psf'],unit=u.deg)
-            try:
-                ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-            except:
-                ps_prob = None
-
-            mw_ebv = float('%.3f'%(sfd(sc)*0.86))
+            mw_ebv,ps_prob = mw_ebvs[i],ps_probs[i]
 
             iLC = (lc['local_designation'] == s['local_designation']) & (nowmjd - lc['mjd_obs'] < self.options.max_days)
 
@@ -952,13 +934,10 @@ class YSE(CronJobBase):
 
     def UploadTransients(self,TransientUploadDict):
 
-        url = '%s'%self.options.dburl.replace('/api','/add_transient')
+        # In-process:  no HTTP round trip back to add_transient
         try:
-            r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-                              auth=HTTPBasicAuth(self.options.dblogin,self.options.dbpassword),
-                              timeout=300)
-            try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-            except: print(r.text)
+            results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+            print('YSE_PZ says: %s'%transient_ingest.summary(results))
             print("Process done.")
 
         except Exception as e:
@@ -1153,7 +1132,9 @@ class YSE_Stack(CronJobBase):
         if naming_convention == 'stack': ysestacktag = TransientTag.objects.get(name='YSE Stack')
         elif naming_convention == 'agn': ysestacktag = TransientTag.objects.get(name='YSE AGN')
         else: raise RuntimeError('unknown naming convention')
-        for i,s in enumerate(summary[transient_idx:transient_idx+max_transients]):
+        # skip the transients already found by other surveys
+        rows,boxes = [],[]
+        for s in summary[transient_idx:transient_idx+max_transients]:
             # check RA/dec
             ramin,ramax,decmin,decmax = getRADecBox(s['ra_psf'],s['dec_psf'],size=0.00042)
             dbtransient = Transient.objects.filter(
@@ -1164,6 +1145,14 @@ class YSE_Stack(CronJobBase):
             if len(dbtransient):
                 nsn += 1
                 continue
+            rows += [s]
+            boxes += [(ramin,ramax,decmin,decmax)]
+
+        # E(B-V) and point-source score of the remaining ones at once
+        mw_ebvs,ps_probs = alert_enrich.enrich(
+            [s['ra_psf'] for s in rows],[s['dec_psf'] for s in rows],remote=get_ps_score)
+        for i,s in enumerate(rows):
+            ramin,ramax,decmin,decmax = boxes[i]
             dbstacktransient = Transient.objects.filter(
                 Q(ra__gt=ramin) & Q(ra__lt=ramax) & Q(dec__gt=decmin) & Q(dec__lt=decmax) &
                 Q(disc_date__gte=dateutil.parser.parse(s['followup_flag_date'])-datetime.timedelta(365)) &
@@ -1188,13 +1177,7 @@ class YSE_Stack(CronJobBase):
                 has_forced_phot = False
 
 
-            sc = SkyCoord(s['ra_psf'],s['dec_psf'],unit=u.deg)
-            try:
-                ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-            except:
-                ps_prob = None
-
-            mw_ebv = float('%.3f'%(sfd(sc)*0.86))
+            mw_ebv,ps_prob = mw_ebvs[i],ps_probs[i]
             iLC = (lc['transient_object_id'] == s['id']) #& (nowmjd - lc['mjd_obs'] < self.options.max_days_ysestacklc)
 
             if naming_convention == 'stack':
@@ -1418,13 +1401,10 @@ class YSE_Stack(CronJobBase):
 
     def UploadTransients(self,TransientUploadDict):
 
-        url = '%s'%self.options.dburl.replace('/api','/add_transient')
+        # In-process:  no HTTP round trip back to add_transient
         try:
-            r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-                              auth=HTTPBasicAuth(self.options.dblogin,self.options.dbpassword),
-                              timeout=300)
-            try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-            except: print(r.text)
+            results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+            print('YSE_PZ says: %s'%transient_ingest.summary(results))
             print("Process done.")
 
         except Exception as e:
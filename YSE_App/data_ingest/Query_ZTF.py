@@ -9,10 +9,13 @@ import configparser
 import imaplib
 import email
 from YSE_App.common.utilities import date_to_mjd
+from YSE_App import transient_ingest
+from YSE_App.data_ingest import alert_enrich, broker_fetch
 from YSE_App.models.survey_models import *
 from django.conf import settings as djangoSettings
 import json
 import re
+import copy
 import datetime
 from antares_client.search import search
 from astropy.coordinates import SkyCoord, Angle
@@ -28,17 +31,6 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 import smtplib
 
-try:
-  from dustmaps.sfd import SFDQuery
-  sfd = SFDQuery()
-except:
-  raise RuntimeError("""can\'t import dust maps
-
-run:
-import dustmaps
-import dustmaps.sfd
-dustmaps.sfd.fetch()""")
-
 query_template = {
     "query": {
         "bool": {
@@ -168,36 +160,78 @@ class AntaresZTF(CronJobBase):
 		recentmjd = date_to_mjd(datetime.datetime.utcnow() - datetime.timedelta(self.options.max_days))
 		survey_obs = SurveyObservation.objects.filter(obs_mjd__gt=recentmjd)
 		field_pk = survey_obs.values('survey_field').distinct()
-		survey_fields = SurveyField.objects.filter(pk__in = field_pk).select_related()
-		nsn = 0
+		survey_fields = list(SurveyField.objects.filter(pk__in = field_pk).select_related())
 		print(survey_fields)
-		for s in survey_fields:
-
-			width_corr = 1.55/np.abs(np.cos(s.dec_cen*np.pi/180))
-			ra_offset = Angle(width_corr/2., unit=u.deg)
-			dec_offset = Angle(1.55/2., unit=u.deg)
-			sc = SkyCoord(s.ra_cen,s.dec_cen,unit=u.deg)
-			ra_min = sc.ra - ra_offset
-			ra_max = sc.ra + ra_offset
-			dec_min = sc.dec - dec_offset
-			dec_max = sc.dec + dec_offset
 
-			query = query_template.copy()
-			query['query']['bool']['must'][0]['range']['ra']['gte'] = ra_min.deg
-			query['query']['bool']['must'][0]['range']['ra']['lte'] = ra_max.deg
-			query['query']['bool']['must'][1]['range']['dec']['gte'] = dec_min.deg
-			query['query']['bool']['must'][1]['range']['dec']['lte'] = dec_max.deg
-			query['query']['bool']['must'][2]['range']['properties.ztf_rb']['gte'] = 0.5
-			query['query']['bool']['must'][3]['range']['properties.ztf_jd']['gte'] = recentmjd+2400000.5
-
-			result_set = search(query)
-
-			transientdict,nsn = self.parse_data(result_set)
-			print('uploading %i transients'%nsn)
-			if nsn > 0: self.send_data(transientdict)
+		# query all the fields in parallel
+		queries = [self.field_query(s,recentmjd) for s in survey_fields]
+		result_sets = broker_fetch.fetch_all(
+			lambda query: list(search(query)),queries,
+			workers=self.options.nthreads,tries=self.options.retries)
+		failed = [r for r in result_sets if isinstance(r,Exception)]
+		for s,r in zip(survey_fields,result_sets):
+			if isinstance(r,Exception):
+				print('ANTARES query of field %s failed: %s'%(s,r))
+		if len(failed) and len(failed) == len(result_sets):
+			raise failed[0]
+
+		# overlapping fields return the same alerts
+		result_set,seen = [],set()
+		for r in result_sets:
+			if isinstance(r,Exception): continue
+			for a in r:
+				key = (a['properties']['ztf_object_id'],a['properties']['ztf_jd'],a['properties']['passband'])
+				if key in seen: continue
+				seen.add(key)
+				result_set += [a]
+
+		transientdict,nsn = self.parse_data(result_set)
+		print('uploading %i transients'%nsn)
+		if nsn > 0: self.send_data(transientdict)
 
 		return nsn
 
+	def field_query(self,s,recentmjd):
+
+		width_corr = 1.55/np.abs(np.cos(s.dec_cen*np.pi/180))
+		ra_offset = Angle(width_corr/2., unit=u.deg)
+		dec_offset = Angle(1.55/2., unit=u.deg)
+		sc = SkyCoord(s.ra_cen,s.dec_cen,unit=u.deg)
+		ra_min = sc.ra - ra_offset
+		ra_max = sc.ra + ra_offset
+		dec_min = sc.dec - dec_offset
+		dec_max = sc.dec + dec_offset
+
+		# deep copy:  the queries of the fields run concurrently
+		query = copy.deepcopy(query_template)
+		query['query']['bool']['must'][0]['range']['ra']['gte'] = ra_min.deg
+		query['query']['bool']['must'][0]['range']['ra']['lte'] = ra_max.deg
+		query['query']['bool']['must'][1]['range']['dec']['gte'] = dec_min.deg
+		query['query']['bool']['must'][1]['range']['dec']['lte'] = dec_max.deg
+		query['query']['bool']['must'][2]['range']['properties.ztf_rb']['gte'] = 0.5
+		query['query']['bool']['must'][3]['range']['properties.ztf_jd']['gte'] = recentmjd+2400000.5
+
+		return query
+
+	def catalog_matches(self,result_set):
+
+		# catalog matches of the loci in known galaxies, in parallel
+		# through one pooled session
+		loci = []
+		for s in result_set:
+			if 'streams' not in s.keys() or 'yse_candidate_test' not in s["streams"]: continue
+			if s['properties']['snfilter_known_exgal'] == 1 and s['locus_id'] not in loci:
+				loci += [s['locus_id']]
+		if not len(loci): return {}
+
+		sess = broker_fetch.session(pool_size=self.options.nthreads,tries=self.options.retries)
+		matches = broker_fetch.fetch_all(
+			lambda locus: broker_fetch.get_json(
+				sess,'{}/loci/{}/catalog-matches'.format(self.options.antaresapi,locus)),
+			loci,workers=self.options.nthreads,tries=1)
+		sess.close()
+		return dict(zip(loci,matches))
+
 	def send_data(self,TransientUploadDict):
 
 		TransientUploadDict['noupdatestatus'] = True
@@ -205,18 +239,21 @@ class AntaresZTF(CronJobBase):
 
 	def UploadTransients(self,TransientUploadDict):
 
-		url = '%s'%self.options.dburl.replace('/api','/add_transient')
-		r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-						  auth=HTTPBasicAuth(self.options.dblogin,self.options.dbpassword))
-
-		try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-		except: print(r.text)
+		# In-process:  no HTTP round trip back to add_transient
+		results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+		print('YSE_PZ says: %s'%transient_ingest.summary(results))
 		print("Process done.")
 		
 	def parse_data(self,result_set):
 		transientdict = {}
 		obj,ra,dec = [],[],[]
 		nsn = 0
+		matches = self.catalog_matches(result_set)
+		# E(B-V) and point-source score of all the objects at once
+		enrichment = alert_enrich.enrich_objects(
+			[s['properties']['ztf_object_id'] for s in result_set],
+			[s['properties']['ztf_ra'] for s in result_set],
+			[s['properties']['ztf_dec'] for s in result_set])
 		for i,s in enumerate(result_set):
 			#if 'astrorapid_skipped' in s['properties'].keys(): continue
 			if 'streams' not in s.keys() or 'yse_candidate_test' not in s["streams"]: continue
@@ -224,12 +261,14 @@ class AntaresZTF(CronJobBase):
 			
 			#if s['properties']['ztf_object_id'] == 'ZTF20aaykvgb': import pdb; pdb.set_trace()
 			#print(s['properties']['snfilter_known_exgal'])
+			hostdict = {}
 			if s['properties']['snfilter_known_exgal'] == 1:
 				# name, ra, dec, redshift
 				# print(s['properties']['ztf_object_id'])
-				antareslink = '{}/loci/{}/catalog-matches'.format(self.options.antaresapi,s['locus_id'])
-				r = requests.get(antareslink)
-				data = json.loads(r.text)
+				data = matches[s['locus_id']]
+				if isinstance(data,Exception):
+					print('catalog matches of locus %s failed: %s'%(s['locus_id'],data))
+					data = {'result':{}}
 				
 				for k in _allowed_galaxy_catalogs.keys():
 					if k in data['result'].keys():
@@ -238,17 +277,8 @@ class AntaresZTF(CronJobBase):
 									'dec':data['result'][k][0][_allowed_galaxy_catalogs[k]['dec_key']]}
 						if _allowed_galaxy_catalogs[k]['redshift_key'] is not None:
 							hostdict['redshift'] = data['result'][k][0][_allowed_galaxy_catalogs[k]['redshift_key']]
-				
-			else:
-				hostdict = {}
-
-			sc = SkyCoord(s['properties']['ztf_ra'],s['properties']['ztf_dec'],unit=u.deg)
-			try:
-				ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-			except:
-				ps_prob = None
 
-			mw_ebv = float('%.3f'%(sfd(sc)*0.86))
+			mw_ebv,ps_prob = enrichment[s['properties']['ztf_object_id']]
 
 			if s['properties']['ztf_object_id'] not in transientdict.keys():
 				tdict = {'name':s['properties']['ztf_object_id'],
@@ -325,6 +355,10 @@ class AntaresZTF(CronJobBase):
 						  help='transient status to enter in YS_PZ')
 		parser.add_argument('--max_days', default=7, type=float,
 						  help='grab photometry/objects from the last x days')
+		parser.add_argument('--nthreads', default=broker_fetch.max_workers, type=int,
+						  help='concurrent ANTARES queries')
+		parser.add_argument('--retries', default=broker_fetch.max_tries, type=int,
+						  help='tries of an ANTARES query')
 
 		if config:
 			parser.add_argument('--dblogin', default=config.get('main','dblogin'), type=str,
@@ -433,27 +467,23 @@ class MARS_ZTF(CronJobBase):
 
 	def UploadTransients(self,TransientUploadDict):
 
-		url = '%s'%self.options.dburl.replace('/api','/add_transient')
-		r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-						  auth=HTTPBasicAuth(self.options.dblogin,self.options.dbemailpassword))
-
-		try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-		except: print(r.text)
+		# In-process:  no HTTP round trip back to add_transient
+		results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+		print('YSE_PZ says: %s'%transient_ingest.summary(results))
 		print("Process done.")
 		
 	def parse_data(self,result_set,mjdlim):
 		transientdict = {}
 		obj,ra,dec = [],[],[]
 		nsn = 0
+		# E(B-V) and point-source score of all the objects at once
+		enrichment = alert_enrich.enrich_objects(
+			[s['objectId'] for s in result_set],
+			[s['candidate']['ra'] for s in result_set],
+			[s['candidate']['dec'] for s in result_set])
 		for i,s in enumerate(result_set):
 			if s['candidate']['rb'] < 0.5: continue
-			sc = SkyCoord(s['candidate']['ra'],s['candidate']['dec'],unit=u.deg)
-			try:
-				ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-			except:
-				ps_prob = None
-
-			mw_ebv = float('%.3f'%(sfd(sc)*0.86))
+			mw_ebv,ps_prob = enrichment[s['objectId']]
 
 			if s['objectId'] not in transientdict.keys():
 				if s['candidate']['jdstarthist']-2400000.5 < mjdlim:
@@ -653,12 +683,9 @@ class AlerceZTF(CronJobBase):
 
 	def UploadTransients(self,TransientUploadDict):
 
-		url = '%s'%self.options.dburl.replace('/api','/add_transient')
-		r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-						  auth=HTTPBasicAuth(self.options.dblogin,self.options.dbpassword))
-
-		try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-		except: print(r.text)
+		# In-process:  no HTTP round trip back to add_transient
+		results = transient_ingest.upload_transients(TransientUploadDict,self.options.dblogin)
+		print('YSE_PZ says: %s'%transient_ingest.summary(results))
 		print("Process done.")
 		
 	def parse_data(self,result_set):
@@ -668,15 +695,14 @@ class AlerceZTF(CronJobBase):
 			transientdict = {}
 			obj,ra,dec = [],[],[]
 			nsn = 0
+			# E(B-V) and point-source score of all the objects at once
+			enrichment = alert_enrich.enrich_objects(
+				[s['oid'] for s in result_set],
+				[s['meanra'] for s in result_set],
+				[s['meandec'] for s in result_set])
 			for i,s in enumerate(result_set):
 				print(s['oid'])
-				sc = SkyCoord(s['meanra'],s['meandec'],unit=u.deg)
-				try:
-					ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-				except:
-					ps_prob = None
-
-				mw_ebv = float('%.3f'%(sfd(sc)*0.86))
+				mw_ebv,ps_prob = enrichment[s['oid']]
 
 				if s['oid'] not in transientdict.keys():
 					tdict = {'name':s['oid'],
@@ -40,6 +40,8 @@ from itertools import islice
 from astropy.cosmology import FlatLambdaCDM
 import sys
 from YSE_App.common import mast_query,chandra_query,spitzer_query
+from YSE_App import transient_ingest
+from YSE_App.data_ingest import alert_enrich
 from django_cron import CronJobBase, Schedule
 from django.conf import settings as djangoSettings
 import argparse, configparser
@@ -62,12 +64,6 @@ reg_obj = "https://www.wis-tns.org/object/(\w+)"
 reg_ra = "\>\sRA[\=\*a-zA-Z\<\>\" ]+(\d{2}:\d{2}:\d{2}\.\d+)"
 reg_dec = "DEC[\=\*a-zA-Z\<\>\" ]+((?:\+|\-)\d{2}:\d{2}:\d{2}\.\d+)\<\/em\>\,"
 
-try:
-    from dustmaps.sfd import SFDQuery
-    sfd = SFDQuery()
-except:
-    pass
-
 def get_ps_score(RA, DEC):
     '''Get ps1 star/galaxy score from MAST. Provide RA and DEC in degrees.
     Returns an empty string if no match is found witing 3 arcsec.
@@ -204,18 +200,13 @@ class processTNS:
 
         return(parser)
 
-    def getTNSData(self,jd,obj,sc,ebv):
+    def getTNSData(self,jd,obj,sc,ebv,ps_prob):
 
         if obj.startswith('2016'):
             status = 'Ignore'
         else:
             status = self.status
 
-        try:
-            ps_prob = get_ps_score(sc.ra.deg,sc.dec.deg)
-        except:
-            ps_prob = None
-
         # get space archival data
         try:
             hst=mast_query.hstImages(sc.ra.deg,sc.dec.deg,'Object')
@@ -872,7 +863,7 @@ class processTNS:
             signal.signal(signal.SIGALRM, handler)
             try:
                 signal.alarm(600)
-                ebvall = sfd(scall)*0.86
+                ebvall = alert_enrich.mw_ebv(scall.ra.deg,scall.dec.deg)
             except:
                 print('MW E(B-V) timeout!')
                 ebv_timeout = True
@@ -892,7 +883,7 @@ class processTNS:
             signal.signal(signal.SIGALRM, handler)
             try:
                 signal.alarm(600)
-                ebvall = sfd(scall)*0.86
+                ebvall = alert_enrich.mw_ebv(scall.ra.deg,scall.dec.deg)
             except:
                 print('MW E(B-V) timeout!')
                 ebv_timeout = True
@@ -922,6 +913,9 @@ class processTNS:
             print('E(B-V)/NED time: %.1f seconds'%(time.time()-ebvtstart))
             signal.alarm(0)
         
+        # point-source scores of all the objects at once
+        ps_probs = alert_enrich.ps_score(scall.ra.deg,scall.dec.deg,remote=get_ps_score)
+
         tstart = time.time()
         print('getting TNS data')
         TNSData = []
@@ -991,7 +985,7 @@ class processTNS:
                 else:
                     jd = None
 
-            transientdict = self.getTNSData(jd,obj,sc,ebv)
+            transientdict = self.getTNSData(jd,obj,sc,ebv,ps_probs[iobj])
             try:
                 photdict = self.getZTFPhotometry_ANTARES(sc)
             except: photdict = None
@@ -1048,13 +1042,10 @@ class processTNS:
 
     def UploadTransients(self,TransientUploadDict):
 
-        url = '%s'%self.dburl.replace('/api','/add_transient')
+        # In-process:  no HTTP round trip back to add_transient
         try:
-            r = requests.post(url = url, data = json.dumps(TransientUploadDict),
-                              auth=HTTPBasicAuth(self.dblogin,self.dbpassword))
-
-            try: print('YSE_PZ says: %s'%json.loads(r.text)['message'])
-            except: print(r.text)
+            results = transient_ingest.upload_transients(TransientUploadDict,self.dblogin)
+            print('YSE_PZ says: %s'%transient_ingest.summary(results))
         except Exception as e:
             exc_type, exc_obj, exc_tb = sys.exc_info()
             nsn = 0
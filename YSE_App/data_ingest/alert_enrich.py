@@ -0,0 +1,270 @@
+""" Galactic E(B-V) and PS1 point-source scores for batches of alerts
+
+The broker crons attach to every new transient its Milky Way
+E(B-V) and its PS1 point-source score (Tachibana & Miller 2018).
+enrich() computes both for a whole batch in one call:
+
+  E(B-V)   -- SFD map (x0.86, Schlafly & Finkbeiner), from the local
+              HEALPix map of settings.FRB_SFD_MAP (see frb_ism) if
+              configured, otherwise from dustmaps, on one array of
+              coordinates
+  ps_score -- score of the nearest source within 3 arcsec in a
+              local copy of the PS1-PSC catalog
+              (settings.PS1_PSC_CATALOG, see match_ps1_psc())
+
+The local catalog is a directory of .npy files, one per HEALPix
+pixel at NSIDE=psc_nside (RING), each sorted by its pixel at the
+NSIDE of the cone search index (see common.healpix), so a cone reads
+a few contiguous slices of one or two memory-mapped files.  Build it
+once with build_ps1_psc().  Without it the scores come from the
+per-object `remote` query of the caller, if any.
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from YSE_App.common import healpix
+from YSE_App.frb_ism import sf11_scale, sfd_lookup
+
+# Partitions of the local catalog
+psc_nside = 16
+# Match radius of the point-source score [deg];  as the MAST query
+psc_radius = 3./3600
+# Columns of the local catalog
+psc_dtype = np.dtype([('healpix', '<i8'), ('ra', '<f8'),
+                      ('dec', '<f8'), ('ps_score', '<f4')])
+
+
+def _local_path(key:str):
+    from django.conf import settings
+    path = getattr(settings, key, None)
+    if path and os.path.exists(path):
+        return path
+    return None
+
+
+# #########################################################
+# E(B-V)
+# #########################################################
+
+@lru_cache(maxsize=1)
+def _sfd_query():
+    from dustmaps.sfd import SFDQuery
+    return SFDQuery()
+
+def mw_ebv(ras, decs):
+    """ Galactic E(B-V) (Schlafly & Finkbeiner) of a batch
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+
+    Returns:
+        np.ndarray: E(B-V), to 3 decimals
+    """
+    from astropy.coordinates import SkyCoord
+
+    ras = np.atleast_1d(np.asarray(ras, dtype=float))
+    decs = np.atleast_1d(np.asarray(decs, dtype=float))
+    if len(ras) == 0:
+        return np.zeros(0)
+    coords = SkyCoord(ra=ras, dec=decs, unit='deg')
+    sfd_file = _local_path('FRB_SFD_MAP')
+    if sfd_file is not None:
+        gcoords = coords.transform_to('galactic')
+        ebv = sfd_lookup(sfd_file, gcoords.l.deg, gcoords.b.deg)
+    else:
+        ebv = _sfd_query()(coords)
+    return np.round(sf11_scale*np.asarray(ebv, dtype=float), 3)
+
+
+# #########################################################
+# PS1 point-source score
+# #########################################################
+
+def _partition_file(path:str, ipix:int):
+    return os.path.join(path, f'psc_{ipix:05d}.npy')
+
+@lru_cache(maxsize=64)
+def load_partition(path:str, ipix:int):
+    """ Memory-map one partition of the local PS1-PSC catalog
+
+    Args:
+        path (str): catalog directory
+        ipix (int): partition (RING pixel at psc_nside)
+
+    Returns:
+        np.ndarray: sources, sorted by healpix;  None if the
+            partition holds none
+    """
+    pfile = _partition_file(path, ipix)
+    if not os.path.isfile(pfile):
+        return None
+    return np.load(pfile, mmap_mode='r')
+
+def build_ps1_psc(infiles:list, path:str, ra_col:str='raMean',
+                  dec_col:str='decMean', score_col:str='ps_score'):
+    """ Write (or extend) the local PS1-PSC catalog
+
+    The input files are read one at a time and their sources merged
+    into the partitions, so memory is set by the largest file
+
+    Args:
+        infiles (list): tables of the PS1-PSC (any format astropy
+            reads, e.g. the FITS or CSV files of the HLSP)
+        path (str): catalog directory
+        ra_col (str, optional): RA column [deg]
+        dec_col (str, optional): Dec column [deg]
+        score_col (str, optional): point-source score column
+    """
+    from astropy.table import Table
+
+    os.makedirs(path, exist_ok=True)
+    for infile in infiles:
+        tbl = Table.read(infile)
+        ras = np.asarray(tbl[ra_col], dtype=float) % 360.
+        decs = np.asarray(tbl[dec_col], dtype=float)
+        parts = healpix.radec_to_pix(ras, decs, nside=psc_nside)
+
+        rows = np.zeros(len(tbl), dtype=psc_dtype)
+        rows['healpix'] = healpix.radec_to_pix(ras, decs)
+        rows['ra'], rows['dec'] = ras, decs
+        rows['ps_score'] = np.asarray(tbl[score_col], dtype=float)
+
+        for ipix in np.unique(parts):
+            new = rows[parts == ipix]
+            pfile = _partition_file(path, ipix)
+            if os.path.isfile(pfile):
+                new = np.concatenate([np.load(pfile), new])
+            np.save(pfile, new[np.argsort(new['healpix'], kind='stable')])
+    load_partition.cache_clear()
+
+def match_ps1_psc(ras, decs, path:str=None, radius:float=psc_radius):
+    """ PS1 point-source score of a batch, from the local catalog
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+        path (str, optional): catalog directory.
+            Defaults to settings.PS1_PSC_CATALOG.
+        radius (float, optional): match radius [deg]
+
+    Returns:
+        np.ndarray: score of the nearest source within radius
+            (NaN if none);  None if there is no local catalog
+    """
+    path = _local_path('PS1_PSC_CATALOG') if path is None else path
+    if path is None or not os.path.isdir(path):
+        return None
+    ras = np.atleast_1d(np.asarray(ras, dtype=float)) % 360.
+    decs = np.atleast_1d(np.asarray(decs, dtype=float))
+
+    # Partitions touched by each cone
+    by_part = {}
+    for ii in range(len(ras)):
+        for lo, hi in healpix.disc_ranges(ras[ii], decs[ii], radius, nside=psc_nside):
+            for ipix in range(lo, hi+1):
+                by_part.setdefault(ipix, []).append(ii)
+
+    # Candidates:  the sources in the pixel ranges of each cone
+    idx, cand_ra, cand_dec, cand_score = [], [], [], []
+    for ipix, alerts in by_part.items():
+        cat = load_partition(path, ipix)
+        if cat is None:
+            continue
+        for ii in alerts:
+            for lo, hi in healpix.disc_ranges(ras[ii], decs[ii], radius):
+                i0 = np.searchsorted(cat['healpix'], lo, side='left')
+                i1 = np.searchsorted(cat['healpix'], hi, side='right')
+                if i1 > i0:
+                    rows = cat[i0:i1]
+                    idx.append(np.full(i1-i0, ii))
+                    cand_ra.append(rows['ra'])
+                    cand_dec.append(rows['dec'])
+                    cand_score.append(rows['ps_score'])
+
+    scores = np.full(len(ras), np.nan)
+    if len(idx) == 0:
+        return scores
+    idx = np.concatenate(idx)
+    sep = healpix.separation(ras[idx], decs[idx],
+                             np.concatenate(cand_ra), np.concatenate(cand_dec))
+    cand_score = np.concatenate(cand_score)
+    keep = sep <= radius
+    idx, sep, cand_score = idx[keep], sep[keep], cand_score[keep]
+
+    # Nearest per alert
+    order = np.lexsort((sep, idx))
+    first = np.unique(idx[order], return_index=True)[1]
+    scores[idx[order][first]] = cand_score[order][first]
+    return scores
+
+
+# #########################################################
+# Batches
+# #########################################################
+
+def ps_score(ras, decs, remote=None):
+    """ PS1 point-source score of a batch of alerts
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+        remote (callable, optional): remote query remote(ra, dec) of
+            one score, used only without a local catalog.  Failures
+            give None.
+
+    Returns:
+        list: scores (float or None)
+    """
+    # Some surveys report RA < 0
+    ras = np.atleast_1d(np.asarray(ras, dtype=float)) % 360.
+    decs = np.atleast_1d(np.asarray(decs, dtype=float))
+    scores = match_ps1_psc(ras, decs)
+    if scores is not None:
+        return [None if np.isnan(score) else round(float(score), 3)
+                for score in scores]
+    ps_probs = []
+    for ra, dec in zip(ras, decs):
+        try:
+            ps_probs.append(remote(ra, dec) if remote is not None else None)
+        except Exception:
+            ps_probs.append(None)
+    return ps_probs
+
+def enrich(ras, decs, remote=None):
+    """ E(B-V) and point-source score of a batch of alerts
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+        remote (callable, optional): see ps_score()
+
+    Returns:
+        tuple: E(B-V) (list of float), scores (list of float or None)
+    """
+    return [float(ebv) for ebv in mw_ebv(ras, decs)], \
+        ps_score(ras, decs, remote=remote)
+
+def enrich_objects(names:list, ras, decs, remote=None):
+    """ enrich() of the objects of a set of alerts
+
+    Args:
+        names (list): object of each alert
+        ras (np.ndarray): RA of each alert [deg]
+        decs (np.ndarray): Dec of each alert [deg]
+        remote (callable, optional): see enrich()
+
+    Returns:
+        dict: (E(B-V), score) of each object, at its first alert
+    """
+    first = {}
+    for name, ra, dec in zip(names, ras, decs):
+        first.setdefault(name, (ra, dec))
+    if len(first) == 0:
+        return {}
+    ebvs, ps_probs = enrich([first[name][0] for name in first],
+                            [first[name][1] for name in first], remote=remote)
+    return dict(zip(first.keys(), zip(ebvs, ps_probs)))
@@ -0,0 +1,129 @@
+""" Concurrent fetching for the broker crons
+
+The queries of a broker cron (one per survey field, one per locus
+for the catalog matches, ...) are independent and wait on the
+network, so they run in a bounded pool of threads:
+
+  fetch_all(func, items) -- func(item) for all the items, in parallel,
+                            each retried with exponential backoff
+
+The HTTP calls share one pooled requests.Session (session()), which
+keeps the connections to the broker open and itself retries the
+failed or throttled (429/5xx) requests.
+"""
+
+import concurrent.futures
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Concurrent calls
+max_workers = 8
+# Tries of a call
+max_tries = 3
+# Wait before the first retry [s];  doubled at each retry
+backoff = 1.
+# Timeout of an HTTP request [s]
+timeout = 30.
+# HTTP statuses worth a retry
+retry_status = [429, 500, 502, 503, 504]
+
+
+def session(pool_size:int=max_workers, tries:int=max_tries,
+            backoff_factor:float=backoff):
+    """ HTTP session with a connection pool and retries
+
+    Args:
+        pool_size (int, optional): connections kept open per host;
+            match it to the number of workers
+        tries (int, optional): tries of a request
+        backoff_factor (float, optional): wait before the first
+            retry [s];  doubled at each retry
+
+    Returns:
+        requests.Session: the session
+    """
+    retry = Retry(total=tries-1, backoff_factor=backoff_factor,
+                  status_forcelist=retry_status,
+                  allowed_methods=['GET', 'POST'],
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size, max_retries=retry)
+    sess = requests.Session()
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    return sess
+
+def get_json(sess, url:str, **kwargs):
+    """ GET a JSON document
+
+    Args:
+        sess (requests.Session): see session()
+        url (str): URL
+        **kwargs: passed to sess.get();  timeout defaults to `timeout`
+
+    Raises:
+        requests.HTTPError: if the request still fails after the retries
+
+    Returns:
+        dict or list: the decoded document
+    """
+    kwargs.setdefault('timeout', timeout)
+    r = sess.get(url, **kwargs)
+    r.raise_for_status()
+    return r.json()
+
+def with_retries(func, *args, tries:int=max_tries, wait:float=backoff,
+                 **kwargs):
+    """ Call func, retrying with exponential backoff when it raises
+
+    Args:
+        func (callable): the call
+        *args, **kwargs: its arguments
+        tries (int, optional): tries of the call
+        wait (float, optional): wait before the first retry [s];
+            doubled at each retry
+
+    Returns:
+        the return of func;  the exception of the last try is raised
+    """
+    for itry in range(tries):
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if itry == tries-1:
+                raise
+            time.sleep(wait * 2**itry)
+
+def fetch_all(func, items:list, workers:int=max_workers,
+              tries:int=max_tries, wait:float=backoff):
+    """ Call func on all the items in a pool of threads
+
+    One failed item does not stop the others:  the exception of its
+    last try is returned in place of its result.
+
+    Args:
+        func (callable): takes one item
+        items (list): the items
+        workers (int, optional): maximum concurrent calls
+        tries (int, optional): tries of each call;  use 1 when func
+            already retries (e.g. HTTP calls through session())
+        wait (float, optional): wait before the first retry [s]
+
+    Returns:
+        list: the results (or exceptions), in the order of items
+    """
+    def call(item):
+        try:
+            return with_retries(func, item, tries=tries, wait=wait)
+        except Exception as e:
+            return e
+
+    items = list(items)
+    if len(items) == 0:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(workers, len(items)))) as pool:
+        return list(pool.map(call, items))
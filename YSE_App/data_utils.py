@@ -1,7 +1,7 @@
 import django
-from django.http import HttpResponse,JsonResponse
+from django.http import HttpResponse,JsonResponse,StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.db import models
+from django.db import models, transaction
 from astropy.coordinates import get_moon, SkyCoord
 from django.core.exceptions import ObjectDoesNotExist
 
@@ -28,6 +28,9 @@ from rest_framework.parsers import JSONParser
 from django.db.models import ForeignKey
 from .common.alert import sendemail
 from .common.utilities import getRADecBox
+from .common import healpix
+from .middleware import request_logger
+from . import transient_ingest
 from django.db.models import Q
 from .queries.yse_python_queries import *
 from .queries import yse_python_queries
@@ -36,7 +39,9 @@ from urllib.parse import unquote
 
 from YSE_App.galaxies import path
 from YSE_App import frb_observing
+from YSE_App import frb_export
 from YSE_App import frb_init
+from YSE_App import frb_jobs
 from YSE_App import frb_utils
 from YSE_App import frb_status
 from YSE_App import frb_tables
@@ -47,7 +52,6 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import BasicAuthentication
 
 from django.utils.decorators import method_decorator
 
@@ -247,268 +251,19 @@ def add_yse_survey_obs(request):
 @csrf_exempt
 @login_or_basic_auth_required
 def add_transient(request):
-    transient_data = JSONParser().parse(request)
-
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
-
-    # ready to send error emails
-    smtpserver = "%s:%s" % (djangoSettings.SMTP_HOST, djangoSettings.SMTP_PORT)
-    from_addr = "%s@gmail.com" % djangoSettings.SMTP_LOGIN
-    subject = "TNS Transient Upload Failure"
-    txt_msg = "Alert : YSE_PZ Failed to upload transient %s "
-
-    transient_entries = []
-    # first bulk create new transients
-    for transientlistkey in transient_data.keys():
-        if transientlistkey == 'noupdatestatus': continue
-        if transientlistkey == 'TNS': continue
-
-        transient = transient_data[transientlistkey]
-        tmp_name = transient['name']
-
-        transientkeys = transient.keys()
-        if 'name' not in transientkeys:
-            return_dict = {"message":"Error : Transient name not provided for transient %s!"%transientlistkey}
-            return JsonResponse(return_dict)
-        print('updating transient %s'%transient['name'])
-        try:
-            transientdict = {'created_by_id':user.id,'modified_by_id':user.id}
-            for transientkey in transientkeys:
-                if transientkey == 'transientphotometry' or \
-                   transientkey == 'transientspectra' or \
-                   transientkey == 'host' or \
-                   transientkey == 'tags' or \
-                   transientkey == 'gw' or \
-                   transientkey == 'non_detect_instrument' or \
-                   transientkey == 'internal_names': continue
-
-                if not isinstance(Transient._meta.get_field(transientkey), ForeignKey):
-                    if transient[transientkey] is not None: transientdict[transientkey] = transient[transientkey]
-                else:
-                    fkmodel = Transient._meta.get_field(transientkey).remote_field.model
-                    if transientkey == 'non_detect_band' and 'non_detect_instrument' in transient.keys():
-                        fk = fkmodel.objects.filter(name=transient[transientkey]).filter(instrument__name=transient['non_detect_instrument'])
-                        if not len(fk):
-                            fk = fkmodel.objects.filter(name=transient[transientkey])
-                    else:
-                        fk = fkmodel.objects.filter(name=transient[transientkey])
-                    if not len(fk):
-                        fk = fkmodel.objects.filter(name='Unknown')
-                        print("Sending email to: %s" % user.username)
-                        html_msg = "Alert : YSE_PZ Failed to upload transient %s "
-                        html_msg += "\nError : %s value doesn\'t exist in transient.%s FK relationship"
-                        sendemail(from_addr, user.email, subject,
-                                  html_msg%(transient['name'],transient[transientkey],transientkey),
-                                  djangoSettings.SMTP_LOGIN, djangoSettings.SMTP_PASSWORD, smtpserver)
-
-                    transientdict[transientkey] = fk[0]
-
-            dbtransient = Transient.objects.filter(name=transient['name'])
-            if len(dbtransient) > 1:
-                dbtransient.filter(~Q(pk=dbtransient[0].id)).delete()
-                dbtransient = Transient.objects.filter(name=transient['name'])
-
-            if not len(dbtransient):
-                # check RA/dec
-                ramin,ramax,decmin,decmax = getRADecBox(transient['ra'],transient['dec'],size=0.00042)
-                if 'disc_date' in transient.keys():
-                    dbtransient = Transient.objects.filter(
-                        Q(ra__gt=ramin) & Q(ra__lt=ramax) & Q(dec__gt=decmin) & Q(dec__lt=decmax) &
-                        Q(disc_date__gte=dateutil.parser.parse(transient['disc_date'])-datetime.timedelta(365)) &
-                        Q(disc_date__lte=dateutil.parser.parse(transient['disc_date'])+datetime.timedelta(365)))
-                else:
-                    dbtransient = Transient.objects.filter(
-                        Q(ra__gt=ramin) & Q(ra__lt=ramax) & Q(dec__gt=decmin) & Q(dec__lt=decmax))
-
-                if len(dbtransient):
-                    #dbtransient = dbtransient[0]
-                    obs_group = ObservationGroup.objects.get(name=transient['obs_group'])
-                    if 'TNS' in transient_data.keys() and transient_data['TNS']:
-                        alt_transients = AlternateTransientNames.objects.filter(name=transient['name'])
-                        if not len(alt_transients):
-                            AlternateTransientNames.objects.create(
-                                transient=dbtransient[0],obs_group=obs_group,name=dbtransient[0].name,
-                                created_by_id=user.id,modified_by_id=user.id)
-                        dbtransient[0].name = transient['name']
-                        dbtransient[0].slug = transient['name']
-                        dbtransient[0].save()
-                    else:
-                        alt_transients = AlternateTransientNames.objects.filter(name=transient['name'])
-                        if not len(alt_transients):
-                            AlternateTransientNames.objects.create(
-                                transient=dbtransient[0],obs_group=obs_group,name=transient['name'],
-                                created_by_id=user.id,modified_by_id=user.id)
-                        transientdict['name'] = dbtransient[0].name
-
-                    if 'noupdatestatus' in transient_data.keys() and not transient_data['noupdatestatus']:
-                        if dbtransient[0].status.name == 'Ignore':
-                            dbtransient[0].status = TransientStatus.objects.filter(name='New')[0]
-                        else: transientdict['status'] = dbtransient[0].status
-                    else: transientdict['status'] = dbtransient[0].status
-                    if dbtransient[0].postage_stamp_file:
-                        transientdict['postage_stamp_file'] = dbtransient[0].postage_stamp_file
-                        transientdict['postage_stamp_ref'] = dbtransient[0].postage_stamp_ref
-                        transientdict['postage_stamp_diff'] = dbtransient[0].postage_stamp_diff
-                        transientdict['postage_stamp_file_fits'] = dbtransient[0].postage_stamp_file_fits
-                        transientdict['postage_stamp_ref_fits'] = dbtransient[0].postage_stamp_ref_fits
-                        transientdict['postage_stamp_diff_fits'] = dbtransient[0].postage_stamp_diff_fits
-
-                    #taglist = []
-                    #if 'tags' in transientkeys:
-                    #   for tag in transient['tags']:
-                    #       tagobj = TransientTag.objects.get(name=tag)
-                    #       taglist += [tagobj]
-                    dbtransient.update(**transientdict)
-                    if 'tags' in transientkeys:
-                        for tag in transient['tags']:
-                            tagobj = TransientTag.objects.get(name=tag)
-                            dbtransient[0].tags.add(tagobj)
-                            dbtransient[0].save()
-
-                else:
-                    dbtransient = Transient(**transientdict)
-
-                    transient_entries += [dbtransient]
-                    #dbtransient = Transient.objects.create(**transientdict)
-            else: #if clobber:
-                if 'noupdatestatus' in transient_data.keys() and not transient_data['noupdatestatus']:
-                    if dbtransient[0].status.name == 'Ignore': dbtransient[0].status = TransientStatus.objects.filter(name='New')[0]
-                    else: transientdict['status'] = dbtransient[0].status
-                else: transientdict['status'] = dbtransient[0].status
-                if dbtransient[0].postage_stamp_file:
-                    transientdict['postage_stamp_file'] = dbtransient[0].postage_stamp_file
-                    transientdict['postage_stamp_ref'] = dbtransient[0].postage_stamp_ref
-                    transientdict['postage_stamp_diff'] = dbtransient[0].postage_stamp_diff
-                    transientdict['postage_stamp_file_fits'] = dbtransient[0].postage_stamp_file_fits
-                    transientdict['postage_stamp_ref_fits'] = dbtransient[0].postage_stamp_ref_fits
-                    transientdict['postage_stamp_diff_fits'] = dbtransient[0].postage_stamp_diff_fits
-
-                dbtransient.update(**transientdict)
-                if 'tags' in transientkeys:
-                    for tag in transient['tags']:
-                        if not len(dbtransient[0].tags.filter(name=tag)):
-                            tagobj = TransientTag.objects.get(name=tag)
-                            dbtransient[0].tags.add(tagobj)
-                            dbtransient[0].save()
-                if 'internal_names' in transient.keys():
-                    for internal_name in transient['internal_names'].split(','):
-                        # see if exists
-                        alt = AlternateTransientNames.objects.filter(name=internal_name)
-                        if len(alt): continue
-
-                        # try to figure out the observation group (this isn't perfect)
-                        altgroup = ObservationGroup.objects.filter(name__startswith=internal_name.replace(' ','')[:3])
-                        if len(altgroup) != 1:
-                            altgroup = ObservationGroup.objects.filter(name='Unknown')
-
-                        # make the alternate transient name object
-                        AlternateTransientNames.objects.create(
-                            name=internal_name,obs_group=altgroup[0],
-                            created_by_id=user.id,modified_by_id=user.id,
-                            transient=dbtransient[0])
-
-                dbtransient = dbtransient[0]
-
-            #print('saved transient in %.1f sec'%(t4-t3))
-            #       dbtransient.tags.add(tagobj)
-            #   dbtransient.save()
-
-            #print('applied tags in %.1f sec'%(t5-t4))
-
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            print('Transient %s failed!'%transient['name'])
-            print("Sending email to: %s" % user.username)
-            html_msg = """Alert : YSE_PZ Failed to upload transient %s with error %s at line number %s"""
-
-            sendemail(from_addr, user.email, subject, html_msg%(transient['name'],e,exc_tb.tb_lineno),
-                      djangoSettings.SMTP_LOGIN, djangoSettings.SMTP_PASSWORD, smtpserver)
-            # sending SMS is too scary for now
-            #sendsms(from_addr, phone_email, subject, txt_msg%transient['name'],
-            #        djangoSettings.SMTP_LOGIN, djangoSettings.SMTP_PASSWORD, smtpserver)
-
-    Transient.objects.bulk_create(transient_entries)
-    for t in transient_entries:
-        dbt = Transient.objects.get(name=t.name)
-        transient = transient_data[t.name]
-        if 'tags' in transient.keys():
-            for tag in transient['tags']:
-                tagobj = TransientTag.objects.get(name=tag)
-                dbt.tags.add(tagobj)
-                dbt.save()
-        if 'internal_names' in transient.keys():
-            for internal_name in transient['internal_names'].split(','):
-                # see if exists
-                alt = AlternateTransientNames.objects.filter(name=internal_name)
-                if len(alt): continue
-
-                # try to figure out the observation group (this isn't perfect)
-                altgroup = ObservationGroup.objects.filter(name__startswith=internal_name.replace(' ','')[:3])
-                if len(altgroup) != 1:
-                    altgroup = ObservationGroup.objects.filter(name='Unknown')
-
-                # make the alternate transient name object
-                AlternateTransientNames.objects.create(
-                    name=internal_name,obs_group=altgroup[0],
-                    created_by_id=user.id,modified_by_id=user.id,
-                    transient=dbt)
-
-    # add photometry, spectra, hosts
-    phot_entries = []
-    for transientlistkey in transient_data.keys():
-        if transientlistkey == 'noupdatestatus': continue
-        if transientlistkey == 'TNS': continue
-        transient = transient_data[transientlistkey]
-        transientkeys = transient.keys()
-
-        dbtransient = Transient.objects.filter(name=transient['name'])
-        if not len(dbtransient):
-            dbtransient = AlternateTransientNames.objects.filter(name=transient['name'])[0].transient
-        else: dbtransient = dbtransient[0]
-
-        if 'transientphotometry' in transientkeys:
-            # do photometry
-            response,transientphot = add_transient_phot_util(
-                transient['transientphotometry'],dbtransient,user,do_photdata=False)
-            for t in transientphot:
-                phot_entries.append(t)
-
-        if 'transientspectra' in transientkeys:
-            # spectrum
-            add_transient_spec_util(transient['transientspectra'],dbtransient,user)
+    """ Add or update transients, with their photometry, spectra and hosts
 
-        if 'host' in transientkeys:
-            # host galaxy
-            add_transient_host_util(transient['host'],dbtransient,user)
-
-    TransientPhotometry.objects.bulk_create(phot_entries)
+    See transient_ingest.upsert_transients()
+    """
+    transient_data = JSONParser().parse(request)
 
-    # add photdata
-    photdata_entries = []
-    for transientlistkey in transient_data.keys():
-        if transientlistkey == 'noupdatestatus': continue
-        if transientlistkey == 'TNS': continue
-        transient = transient_data[transientlistkey]
-        transientkeys = transient.keys()
+    try:
+        results = transient_ingest.upsert_transients(transient_data, request.user)
+    except IOError as e:
+        return_dict = {"message":str(e)}
+        return JsonResponse(return_dict)
 
-        dbtransient = Transient.objects.filter(name=transient['name'])
-        if not len(dbtransient):
-            dbtransient = AlternateTransientNames.objects.filter(name=transient['name'])[0].transient
-        else: dbtransient = dbtransient[0]
-
-        if 'transientphotometry' in transientkeys:
-            # do photometry
-            response,transientphot = add_transient_phot_util(
-                transient['transientphotometry'],dbtransient,user,do_photdata=True)
-            for t in transientphot:
-                phot_entries.append(t)
-    
-    TransientPhotometry.objects.bulk_create(photdata_entries)
-    
-    return_dict = {"message":"success"}
+    return_dict = {"message":"success", "results":results}
     return JsonResponse(return_dict)
 
 @csrf_exempt
@@ -768,98 +523,144 @@ def add_transient_phot_util(photdict,transient,user,do_photdata=True):
                 created_by_id=user.id, modified_by_id=user.id)
             transientphot_entries += [transientphot]
         else: transientphot = transientphot[0]
-        existingphot = TransientPhotData.objects.filter(photometry=transientphot)
         if do_photdata:
-            for k in photometry['photdata']:
-                p = photometry['photdata'][k]
-                pmjd = Time(p['obs_date'],format='isot').mjd
-
-                band = PhotometricBand.objects.filter(name=p['band']).filter(instrument__name=photometry['instrument'])
-                if len(band): band = band[0]
-                else: band = PhotometricBand.objects.filter(name='Unknown')[0]
-                obsExists = False
-
-                for idx,e in enumerate(existingphot):
-                    if e.photometry.id == transientphot.id:
-                        if e.band == band:
-                            try:
-                                mjd = Time(e.obs_date.isoformat().split('+')[0],format='isot').mjd
-                            except:
-                                mjd = Time(e.obs_date,format='isot').mjd
-
-                            if np.abs(mjd - pmjd) < photdict['mjdmatchmin']:
-                                obsExists = True
-                                if photdict['clobber']:
-
-                                    dq = None
-                                    if p['data_quality']:
-                                        dq = DataQuality.objects.filter(name=p['data_quality'])
-                                        if not dq:
-                                            dq = DataQuality.objects.filter(name='Bad')
-                                        dq = dq[0]
-
-                                    e.obs_date = p['obs_date']
-                                    e.flux = p['flux']
-                                    e.flux_err = p['flux_err']
-                                    e.flux_zero_point = p['flux_zero_point']
-                                    e.mag = p['mag']
-                                    e.mag_err = p['mag_err']
-                                    e.forced = p['forced']
-                                    e.diffim = p['diffim']
-
-                                    # Because we're in CLOBBER mode, remove existing dq flags and add the one passed here.
-                                    data_quality_flags = e.data_quality.all()
-                                    for _dq in data_quality_flags:
-                                        e.data_quality.remove(_dq)
-                                    e.data_quality.add(dq)
-
-                                    e.photometry = transientphot
-                                    e.discovery_point = p['discovery_point']
-                                    e.band = band
-                                    e.modified_by_id = user.id
-                                    e.save()
-
-                                if 'diffimg' in p.keys():
-                                    existing_diff = TransientDiffImage.objects.filter(phot_data=e)
-                                    p['diffimg']['created_by_id'] = user.id
-                                    p['diffimg']['modified_by_id'] = user.id
-                                    p['diffimg']['phot_data_id'] = e.id
-                                    if not len(existing_diff):
-                                        TransientDiffImage.objects.create(**p['diffimg'])
-                                    else:
-                                        existing_diff.update(**p['diffimg'])
-
-
-                if not obsExists:
-                    dq = None
-                    if p['data_quality']:
-                        dq = DataQuality.objects.filter(name=p['data_quality'])
-                        if not dq:
-                            dq = DataQuality.objects.filter(name='Bad')
-                        dq = dq[0]
-
-                    e = TransientPhotData.objects.create(
-                        obs_date=p['obs_date'],flux=p['flux'],flux_err=p['flux_err'],
-                        mag=p['mag'],mag_err=p['mag_err'],forced=p['forced'],
-                        diffim=p['diffim'],
-                        photometry=transientphot,
-                        flux_zero_point=p['flux_zero_point'],
-                        discovery_point=p['discovery_point'],band=band,
-                        created_by_id=user.id,modified_by_id=user.id)
-
-                    if dq is not None:
-                        # Set operator needs a list...
-                        e.data_quality.set([dq])
-                        e.save()
-                    if 'diffimg' in p.keys():
-                        p['diffimg']['created_by_id'] = user.id
-                        p['diffimg']['modified_by_id'] = user.id
-                        p['diffimg']['phot_data_id'] = e.id
-                        TransientDiffImage.objects.create(**p['diffimg'])
+            add_photdata_util(photometry,transientphot,photdict,user)
 
     return_dict = {"message":"successfully added phot data"}
     return JsonResponse(return_dict),transientphot_entries
 
+def add_photdata_util(photometry,transientphot,photdict,user):
+    """ Merge the photdata of one photometry entry into the
+    TransientPhotData of its TransientPhotometry
+
+    An incoming point matches the existing points of the same band
+    within photdict['mjdmatchmin'] days;  the matches are found with
+    a binary search on the sorted MJDs of each band, so the merge is
+    O((N+M) log N) with one query per table.  Matched points are
+    updated if photdict['clobber'], the others are created.
+
+    Args:
+        photometry (dict): instrument, obs_group and photdata
+        transientphot (TransientPhotometry): the saved photometry
+        photdict (dict): with clobber and mjdmatchmin
+        user (User): user adding the data
+
+    Returns:
+        tuple: number of points created, number of points updated
+    """
+    points = list(photometry['photdata'].values())
+    if len(points) == 0:
+        return 0, 0
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    # Existing points:  sorted MJDs per band
+    existing = list(TransientPhotData.objects.filter(
+        photometry=transientphot).values_list('id','band_id','obs_date'))
+    ex_ids = np.array([e[0] for e in existing], dtype=int)
+    ex_bands = np.array([e[1] for e in existing], dtype=int)
+    ex_mjds = np.array([e[2].timestamp() for e in existing])/86400. + 40587.
+    order = np.lexsort((ex_mjds, ex_bands))
+    ex_ids, ex_bands, ex_mjds = ex_ids[order], ex_bands[order], ex_mjds[order]
+
+    # Incoming points
+    pmjds = np.atleast_1d(Time([p['obs_date'] for p in points],format='isot').mjd)
+    bands = {band.name:band for band in PhotometricBand.objects.filter(
+        name__in=set([p['band'] for p in points])).filter(
+            instrument__name=photometry['instrument']).order_by('-pk')}
+    if any([p['band'] not in bands for p in points]):
+        unknown_band = PhotometricBand.objects.filter(name='Unknown')[0]
+    dq_names = set([p['data_quality'] for p in points if p['data_quality']])
+    dqs = {}
+    if len(dq_names):
+        dqs = {dq.name:dq for dq in DataQuality.objects.filter(
+            name__in=dq_names | {'Bad'}).order_by('-pk')}
+    band_ids = np.array([bands[p['band']].id if p['band'] in bands else unknown_band.id
+                         for p in points], dtype=int)
+
+    # Matches:  existing points of the band within mjdmatchmin (exclusive)
+    tol = photdict['mjdmatchmin']
+    start = np.searchsorted(ex_bands, band_ids, side='left')
+    stop = np.searchsorted(ex_bands, band_ids, side='right')
+    lo, hi = np.zeros(len(points), dtype=int), np.zeros(len(points), dtype=int)
+    for band_id in np.unique(band_ids):
+        idx = band_ids == band_id
+        b0, b1 = start[idx][0], stop[idx][0]
+        lo[idx] = b0 + np.searchsorted(ex_mjds[b0:b1], pmjds[idx]-tol, side='right')
+        hi[idx] = b0 + np.searchsorted(ex_mjds[b0:b1], pmjds[idx]+tol, side='left')
+
+    clobbered, new_entries, new_points, diff_points = {}, [], [], []
+    for ii, p in enumerate(points):
+        dq = None
+        if p['data_quality']:
+            dq = dqs.get(p['data_quality'], dqs.get('Bad'))
+        if hi[ii] > lo[ii]:
+            for e_id in ex_ids[lo[ii]:hi[ii]]:
+                if photdict['clobber']:
+                    # The last incoming point wins
+                    clobbered[int(e_id)] = (TransientPhotData(
+                        id=int(e_id), obs_date=p['obs_date'], flux=p['flux'],
+                        flux_err=p['flux_err'], flux_zero_point=p['flux_zero_point'],
+                        mag=p['mag'], mag_err=p['mag_err'], forced=p['forced'],
+                        diffim=p['diffim'], photometry=transientphot,
+                        discovery_point=p['discovery_point'], band_id=band_ids[ii],
+                        modified_by_id=user.id, modified_date=now), dq)
+                if 'diffimg' in p.keys():
+                    diff_points.append((int(e_id), p['diffimg']))
+        else:
+            new_entries.append(TransientPhotData(
+                obs_date=p['obs_date'],flux=p['flux'],flux_err=p['flux_err'],
+                mag=p['mag'],mag_err=p['mag_err'],forced=p['forced'],
+                diffim=p['diffim'],
+                photometry=transientphot,
+                flux_zero_point=p['flux_zero_point'],
+                discovery_point=p['discovery_point'],band_id=band_ids[ii],
+                created_by_id=user.id,modified_by_id=user.id))
+            new_points.append((dq, p))
+
+    with transaction.atomic():
+        # Clobber
+        if len(clobbered):
+            TransientPhotData.objects.bulk_update(
+                [e for e,dq in clobbered.values()],
+                ['obs_date','flux','flux_err','flux_zero_point','mag','mag_err',
+                 'forced','diffim','photometry','discovery_point','band',
+                 'modified_by','modified_date'], batch_size=1000)
+
+        # New
+        TransientPhotData.objects.bulk_create(new_entries, batch_size=1000)
+        if len(new_entries) and new_entries[0].pk is None and \
+           any([dq is not None or 'diffimg' in p.keys() for dq,p in new_points]):
+            # MySQL does not return the ids;  the rows were inserted in order
+            new_ids = TransientPhotData.objects.filter(photometry=transientphot).filter(
+                id__gt=int(ex_ids.max()) if len(ex_ids) else 0).order_by('pk').values_list('id', flat=True)
+            for e, e_id in zip(new_entries, new_ids):
+                e.id = e_id
+
+        # Data quality flags:  replaced on the clobbered points
+        DQThrough = TransientPhotData.data_quality.through
+        DQThrough.objects.filter(transientphotdata_id__in=list(clobbered.keys())).delete()
+        dq_entries = [DQThrough(transientphotdata_id=e_id, dataquality_id=dq.id)
+                      for e_id,(e,dq) in clobbered.items() if dq is not None]
+        dq_entries += [DQThrough(transientphotdata_id=e.id, dataquality_id=dq.id)
+                       for e,(dq,p) in zip(new_entries, new_points) if dq is not None]
+        DQThrough.objects.bulk_create(dq_entries, batch_size=1000)
+
+        # Difference images
+        diff_points += [(e.id, p['diffimg']) for e,(dq,p) in zip(new_entries, new_points)
+                        if 'diffimg' in p.keys()]
+        existing_diffs = set(TransientDiffImage.objects.filter(
+            phot_data_id__in=[e_id for e_id,_ in diff_points]).values_list('phot_data_id', flat=True))
+        diff_entries = []
+        for e_id, diffimg in diff_points:
+            diffimg = dict(diffimg, created_by_id=user.id, modified_by_id=user.id, phot_data_id=e_id)
+            if e_id in existing_diffs:
+                TransientDiffImage.objects.filter(phot_data_id=e_id).update(**diffimg)
+            else:
+                diff_entries.append(TransientDiffImage(**diffimg))
+        TransientDiffImage.objects.bulk_create(diff_entries, batch_size=1000)
+
+    return len(new_entries), len(clobbered)
+
 def add_transient_spec_util(specdict,transient,user):
 
     for k in specdict.keys():
@@ -956,148 +757,19 @@ def add_transient_spec_util(specdict,transient,user):
 @csrf_exempt
 @login_or_basic_auth_required
 def add_transient_phot(request):
-    phot_data = JSONParser().parse(request)
-
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
-
-    if 'header' in phot_data.keys() and 'transient' in phot_data.keys() and 'photheader' in phot_data.keys():
-        hd = phot_data['header']
-        tr = phot_data['transient']
-        ph = phot_data['photheader']
-    else:
-        return_dict = {"message":"header, transient, and photheader keys are required"}
-        return JsonResponse(return_dict)
-
-    # get all the foreign keys we need
-    instrument = Instrument.objects.filter(name=ph['instrument'])
-    if not len(instrument):
-        instrument = Instrument.objects.filter(name='Unknown')
-    instrument = instrument[0]
+    """ Add the photometry of a transient
 
-    obs_group = ObservationGroup.objects.filter(name=ph['obs_group'])
-    if not len(obs_group):
-        obs_group = ObservationGroup.objects.filter(name='Unknown')
-    obs_group = obs_group[0]
+    See transient_ingest.add_photometry()
+    """
+    phot_data = JSONParser().parse(request)
 
-    status = TransientStatus.objects.filter(name=tr['status'])
-    if not len(status):
-        return_dict = {"message":"status %s is not in DB"%tr['status']}
+    try:
+        transient_ingest.add_photometry(phot_data, request.user)
+    except IOError as e:
+        return_dict = {"message":str(e)}
         return JsonResponse(return_dict)
-    status = status[0]
-
-    allgroups = []
-    if ph['groups']:
-        for photgroup in ph['groups'].split(','):
-            group = Group.objects.filter(name=photgroup)
-            if not len(group):
-                return_dict = {"message":"group %s is not in DB"%ph['groups']}
-                return JsonResponse(return_dict)
-            group = group[0]
-            allgroups += [group]
-
-    # get or create transient
-    transient = Transient.objects.filter(name=tr['name'])
-    if not len(transient):
-        transient = Transient.objects.create(name=tr['name'],ra=tr['ra'],dec=tr['dec'],
-                                             status=status,created_by_id=user.id,
-                                             obs_group=obs_group,
-                                             modified_by_id=user.id)
-    else: transient = transient[0]
-    # get all existing photometry
-    transientphot = TransientPhotometry.objects.filter(transient=transient).filter(instrument=instrument).filter(obs_group=obs_group)
-    if not len(transientphot):
-        transientphot = TransientPhotometry.objects.create(
-            instrument=instrument,obs_group=obs_group,transient=transient,
-            created_by_id=user.id,modified_by_id=user.id)
-    else:
-        transientphot = transientphot[0]
-        if hd['clobber']:
-            transientphot.instrument = instrument
-            transientphot.obs_group = obs_group
-            transientphot.modified_by_id = user.id
-            transientphot.save()
-
-    if len(allgroups):
-        for group in allgroups:
-            if group not in transientphot.groups.all():
-                transientphot.groups.add(group)
-                transientphot.save()
-
-    existingphot = TransientPhotData.objects.filter(photometry=transientphot)
-
-    # loop through new, comp against existing
-    for k in phot_data.keys():
-        if k == 'header' or k == 'transient' or k == 'photheader': continue
-        p = phot_data[k]
-        pmjd = Time(p['obs_date'],format='isot').mjd
-        band = PhotometricBand.objects.filter(name=p['band']).filter(instrument__name=ph['instrument'])
-        if len(band): band = band[0]
-        else: band = PhotometricBand.objects.filter(name='Unknown')[0]
-
-        obsExists = False
-        for e in existingphot:
-            if e.photometry.id == transientphot.id:
-                if e.band == band:
-                    try:
-                        mjd = Time(e.obs_date.isoformat().split('+')[0],format='isot').mjd
-                    except:
-                        mjd = Time(e.obs_date,format='isot').mjd
-                    if np.abs(mjd - pmjd) < hd['mjdmatchmin']:
-                        obsExists = True
-                        if hd['clobber']:
-
-                            dq = None
-                            if p['data_quality']:
-                                dq = DataQuality.objects.filter(name=p['data_quality'])
-                                if not dq:
-                                    dq = DataQuality.objects.filter(name='Bad')
-                                dq = dq[0]
-
-                            e.obs_date = p['obs_date']
-                            e.flux = p['flux']
-                            e.flux_err = p['flux_err']
-                            e.flux_zero_point = p['flux_zero_point']
-                            e.mag = p['mag']
-                            e.mag_err = p['mag_err']
-                            e.forced = p['forced']
-                            e.diffim = p['diffim']
-
-                            # Because we're in CLOBBER mode, remove existing dq flags and add the one passed here.
-                            data_quality_flags = e.data_quality.all()
-                            for _dq in data_quality_flags:
-                                e.data_quality.remove(_dq)
-                            e.data_quality.add(dq)
-
-                            e.photometry = transientphot
-                            e.discovery_point = p['discovery_point']
-                            e.band = band
-                            e.modified_by_id = user.id
-                            e.save()
-
-        if not obsExists:
-            dq = None
-            if p['data_quality']:
-                dq = DataQuality.objects.filter(name=p['data_quality'])
-                if not dq:
-                    dq = DataQuality.objects.filter(name='Bad')
-                dq = dq[0]
-            tpd = TransientPhotData.objects.create(obs_date=p['obs_date'],flux=p['flux'],flux_err=p['flux_err'],
-                                                   mag=p['mag'],mag_err=p['mag_err'],forced=p['forced'],
-                                                   diffim=p['diffim'],
-                                                   photometry=transientphot,
-                                                   flux_zero_point=p['flux_zero_point'],
-                                                   discovery_point=p['discovery_point'],band=band,
-                                                   created_by_id=user.id,modified_by_id=user.id)
-            if dq is not None:
-                # Set operator needs a list...
-                tpd.data_quality.set([dq])
-                tpd.save()
 
     return_dict = {"message": "success"}
-
     return JsonResponse(return_dict)
 
 @csrf_exempt
@@ -1238,28 +910,18 @@ def get_rising_transients(request,ndays):
 
     return JsonResponse(return_dict)
 
-def find_separation(host_queryset, query_coord, sep_threshold):
-
-    ra,dec = [],[]
-    for host in host_queryset:
-        ra += [host.ra]; dec += [host.dec]
-    host_coords = SkyCoord(ra, dec, unit=(u.deg, u.deg))
-    sep = host_coords.separation(query_coord)
-    for idx in np.where(sep.arcminute <= sep_threshold)[0]:
-        yield host_queryset[int(idx)],sep.arcminute[idx]
-
 @login_or_basic_auth_required       
 def get_host(request, ra, dec, sep):
 
-    query_coord = SkyCoord(ra,dec,unit=(u.deg, u.deg))
-    host_candidates = find_separation(Host.objects.all(), query_coord, float(sep))
+    host_candidates = healpix.cone_search(
+        Host.objects.all(), float(ra), float(dec), float(sep)/60.)
 
     serialized_hosts = []
-    for host,sep in host_candidates:
+    for host,hsep in host_candidates:
         serialized_hosts.append(
             {"host_ra":host.ra,"host_dec":host.dec,
              "host_name":host.name,"host_id":host.id,
-             "host_sep":sep}
+             "host_sep":hsep*60.}
         )
 
     return_dict = {"requested ra":float(ra),
@@ -1269,12 +931,55 @@ def get_host(request, ra, dec, sep):
 
     return JsonResponse(return_dict)
 
+@login_or_basic_auth_required       
+def cone_search(request, table, ra, dec, sep):
+    """ Objects of a table within a cone, nearest first
+
+    Uses the HEALPix index (see common.healpix)
+
+    Args:
+        table (str): host, transient, frbgalaxy or frbtransient
+        ra (str): RA of the center [deg]
+        dec (str): Dec of the center [deg]
+        sep (str): radius [arcmin]
+
+    Returns:
+        JsonResponse: name, id, ra, dec and separation [arcmin] of the objects
+    """
+    tables = dict(host=Host, transient=Transient, 
+                  frbgalaxy=FRBGalaxy, frbtransient=FRBTransient)
+    if table not in tables:
+        return JsonResponse({"message":f"Bad table: {table}.  Allowed: {list(tables.keys())}"},
+                            status=400)
+
+    objs = healpix.cone_search(tables[table].objects.all(),
+                               float(ra), float(dec), float(sep)/60.)
+    serialized = [{"name":obj.name,"id":obj.id,"ra":obj.ra,"dec":obj.dec,
+                   "sep":osep*60.} for obj,osep in objs]
+
+    return_dict = {"requested ra":float(ra),
+                   "requested dec":float(dec),
+                   "requested sep":float(sep),
+                   "table":table,
+                   "objects":serialized }
+
+    return JsonResponse(return_dict)
+
+@login_or_basic_auth_required
+def request_metrics(request):
+    """ Latency percentiles, DB queries and response sizes per view
+    of the recent requests handled by this server process
+
+    ?force=true recomputes the aggregate now
+    """
+    force = request.GET.get('force', 'false').lower() == 'true'
+    return JsonResponse(request_logger.summary(force=force))
+
 @login_or_basic_auth_required       
 def get_rising_transients_box(request, ra, dec, ra_width, dec_width):
 
     qs = recent_rising_transient_queryset(ndays=5)
-    ramin,ramax,decmin,decmax = getRADecBox(float(ra),float(dec),float(ra_width),float(dec_width))
-    qs = qs.filter(ra__gt=ramin).filter(ra__lt=ramax).filter(dec__gt=decmin).filter(dec__lt=decmax).filter(~Q(status__name='Ignore')).filter(
+    qs = qs.filter(healpix.box_q(float(ra),float(dec),float(ra_width),float(dec_width))).filter(~Q(status__name='Ignore')).filter(
         Q(status__name='New') | Q(status__name='Watch') | Q(status__name='FollowupRequested') |
         Q(status__name='Following') | Q(status__name='Interesting') |
         ~Q(tags__name='YSE')).filter(disc_date__gt=datetime.datetime.utcnow()-datetime.timedelta(10))
@@ -1296,8 +1001,7 @@ def get_rising_transients_box(request, ra, dec, ra_width, dec_width):
 def get_new_transients_box(request, ra, dec, ra_width, dec_width):
 
     qs = Transient.objects.all() #filter(disc_date__gte=datetime.datetime.utcnow()-datetime.timedelta(5)) #.filter(~Q(TNS_spec_class__isnull=True))
-    ramin,ramax,decmin,decmax = getRADecBox(float(ra),float(dec),float(ra_width),float(dec_width))
-    qs = qs.filter(ra__gt=ramin).filter(ra__lt=ramax).filter(dec__gt=decmin).filter(dec__lt=decmax).filter(
+    qs = qs.filter(healpix.box_q(float(ra),float(dec),float(ra_width),float(dec_width))).filter(
         Q(status__name='Watch') | Q(status__name='FollowupRequested') | Q(status__name='Following') | Q(status__name='Interesting') |
         ~Q(tags__name='YSE')).filter(disc_date__gt=datetime.datetime.utcnow()-datetime.timedelta(10))
 
@@ -1318,8 +1022,7 @@ def get_new_transients_box(request, ra, dec, ra_width, dec_width):
 def get_all_transients_box(request, ra, dec, ra_width, dec_width):
 
     qs = Transient.objects.all() #filter(disc_date__gte=datetime.datetime.utcnow()-datetime.timedelta(5)) #.filter(~Q(TNS_spec_class__isnull=True))
-    ramin,ramax,decmin,decmax = getRADecBox(float(ra),float(dec),float(ra_width),float(dec_width))
-    qs = qs.filter(ra__gt=ramin).filter(ra__lt=ramax).filter(dec__gt=decmin).filter(dec__lt=decmax)
+    qs = qs.filter(healpix.box_q(float(ra),float(dec),float(ra_width),float(dec_width)))
 
     serialized_transients = []
     for t in qs:
@@ -1376,34 +1079,24 @@ def query_api(request,query_name):
 @csrf_exempt
 @login_or_basic_auth_required
 def box_search(request,ra,dec,radius):
+    """ Recent YSE transients within a cone, nearest first
 
-    qs = None
-
-    ra,dec,radius = float(ra),float(dec),float(radius)
-
-    d = float(dec)*np.pi/180
-    width_corr = float(radius)/np.abs(np.cos(d))
-
-    ra_offset = cd.Angle(width_corr, unit=u.deg)
-    dec_offset = cd.Angle(radius, unit=u.deg)
-
-    query= """SELECT t.name, ACOS(SIN(t.dec*3.14159/180)*SIN(%s*3.14159/180)+COS(t.dec*3.14159/180)*COS(%s*3.14159/180)*COS((t.ra-%s)*3.14159/180))*180/3.14159 as sep
-FROM YSE_App_transient t
-WHERE t.ra > %s AND t.ra < %s AND t.dec > %s AND t.dec < %s
-HAVING sep < 3.3
-""" % (
-    dec, dec, ra, ra-radius,ra+radius,
-    dec-radius,dec+radius)
-    cursor = connections['explorer'].cursor()
-    cursor.execute(query, ())
+    Args:
+        ra (str): RA of the center [deg]
+        dec (str): Dec of the center [deg]
+        radius (str): radius [deg]
+    """
 
-    qs = Transient.objects.filter(created_date__gte=datetime.datetime.utcnow()-datetime.timedelta(90)).filter(name__in=(x[0] for x in cursor))
+    qs = Transient.objects.filter(
+        created_date__gte=datetime.datetime.utcnow()-datetime.timedelta(90)).filter(
+            tags__name='YSE').distinct()
 
     serialized_transients = []
-    for t in qs.filter(Q(tags__name='YSE')):
+    for t,sep in healpix.cone_search(qs,float(ra),float(dec),float(radius)):
         serialized_transients.append(
             {"transient_ra":t.ra,"transient_dec":t.dec,
-             "transient_name":t.name,"transient_id":t.id}
+             "transient_name":t.name,"transient_id":t.id,
+             "transient_sep":sep}
         )
 
     return_dict = {"transients":serialized_transients }
@@ -1465,10 +1158,8 @@ def add_frb_galaxy(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Serialize the user and we are all set
     #data['created_by'] = user
@@ -1501,10 +1192,8 @@ def rm_frb_galaxy(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Serialize the user and we are all set
     #data['created_by'] = user
@@ -1541,7 +1230,7 @@ class IngestPathView(APIView):
     """
     API endpoint for ingesting PATH results, with full debug output.
     """
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = [CachedHeaderAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request, format=None):
@@ -1625,6 +1314,88 @@ class IngestPathView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class IngestPathBulkView(APIView):
+    """
+    API endpoint for ingesting the PATH results of many FRBs at once.
+
+    The request data is {'entries': [...]} with each entry holding the 
+    keys of IngestPathView.  All of the entries are ingested in a single 
+    transaction (see galaxies.path.ingest_path_results_bulk)
+
+    With 'async': true the validated entries are queued as a job
+    and its job_id is returned (see frb_jobs)
+    """
+    authentication_classes = [CachedHeaderAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    allowed_keys = ['transient_name', 'table', 'F', 'instrument', 'obs_group', 
+                    'P_Ux', 'bright_star', 'new_tags', 'telescope_name']
+    required_fields = ['table', 'F', 'instrument', 'obs_group', 'P_Ux', 'bright_star']
+
+    def post(self, request, format=None):
+        return self.handle_ingestion(request)
+
+    def put(self, request, format=None):
+        return self.handle_ingestion(request)
+
+    def handle_ingestion(self, request):
+        entries = request.data.get('entries')
+        if not entries:
+            return Response({"error": "Missing 'entries' field."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Validate
+        all_data = []
+        for ii, entry in enumerate(entries):
+            data = {key: entry.get(key) for key in self.allowed_keys}
+            if not data['transient_name']:
+                return Response({"error": f"Entry {ii}: missing 'transient_name' field."}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+            missing = [field for field in self.required_fields if data.get(field) is None]
+            if len(missing) > 0:
+                return Response({"error": f"{data['transient_name']}: missing fields: {', '.join(missing)}"}, 
+                                status=status.HTTP_400_BAD_REQUEST)
+            all_data.append(data)
+        names = [data['transient_name'] for data in all_data]
+        if len(set(names)) != len(names):
+            return Response({"error": "Duplicate transient_name entries."}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Transients
+        transients = FRBTransient.objects.in_bulk(names, field_name='name')
+        missing = [name for name in names if name not in transients]
+        if len(missing) > 0:
+            return Response({"error": f"Transients not found: {', '.join(missing)}"}, 
+                            status=status.HTTP_404_NOT_FOUND)
+
+        # Queue?
+        if request.data.get('async', False):
+            job = frb_jobs.submit('ingest_path', dict(entries=all_data), request.user)
+            return Response({"message": f"Queued job {job.id}", "job_id": job.id},
+                            status=status.HTTP_202_ACCEPTED)
+
+        # Build the entries
+        try:
+            path_entries = [dict(transient=transients[data['transient_name']],
+                                 candidates=pandas.DataFrame(data['table']),
+                                 Filter=data['F'], inst_name=data['instrument'],
+                                 obs_group=data['obs_group'], P_Ux=data['P_Ux'],
+                                 telescope_name=data['telescope_name'],
+                                 bright_star=data['bright_star'],
+                                 new_tags=data['new_tags']) for data in all_data]
+        except Exception:
+            return Response({"error": "Invalid table JSON."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Ingest
+        try:
+            npath = path.ingest_path_results_bulk(path_entries, request.user,
+                                                  remove_previous=True)
+        except Exception as e:
+            return Response({"error": f"Ingestion failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({"message": f"Ingestion successful: {len(path_entries)} FRBs, {npath} PATH entries."}, 
+                        status=status.HTTP_200_OK)
+
+
 @csrf_exempt
 @login_or_basic_auth_required
 def targets_from_frb_followup_resource(request):
@@ -1648,14 +1419,8 @@ def targets_from_frb_followup_resource(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    try:
-        auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-        credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-        username, password = credentials.split(':', 1)
-        user = auth.authenticate(username=username, password=password)
-    except:
-        return JsonResponse({"message":f"Bad user authentication in DB"}, status=401)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab the FollowUpResource
     try:
@@ -1699,11 +1464,8 @@ def ingest_obsplan(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Prep 
     obs_tbl = pandas.read_json(data['table'])
@@ -1748,11 +1510,8 @@ def ingest_obslog(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Prep 
     obs_tbl = pandas.read_json(data['table'])
@@ -1783,11 +1542,8 @@ def release_pending(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab the resource
     try:
@@ -1797,14 +1553,13 @@ def release_pending(request):
         return JsonResponse({"message":f"{msg}"}, status=405)
 
     # Do it
-    all_pending = FRBFollowUpRequest.objects.filter(
-        resource=resource)
-    for pending in all_pending:
-        transient = pending.transient
-        # Delete
-        pending.delete()
+    with transaction.atomic():
+        all_pending = FRBFollowUpRequest.objects.filter(
+            resource=resource)
+        affected = set(all_pending.values_list('transient_id', flat=True))
+        all_pending.delete()
         # Update status
-        frb_status.set_status(transient)
+        frb_status.set_status_bulk(FRBTransient.objects.filter(id__in=affected))
 
     # Return
     return JsonResponse({'message': "All done"}, status=200)
@@ -1824,12 +1579,9 @@ def add_frb_followup_resource(request):
     
     data = JSONParser().parse(request)
 
-    # Authenticate
+    # Authenticated by login_or_basic_auth_required
     # TODO -- SHOULD RESTRICT TO ADMIN
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    user = request.user
 
     # Run
     code, msg = frb_utils.addmodify_obj(FRBFollowUpResource, data, user)
@@ -1867,11 +1619,8 @@ def ingest_z(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Prep
     z_tbl = pandas.read_json(data['table'])
@@ -1902,11 +1651,8 @@ def remove_z(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Prep
     try:
@@ -1945,6 +1691,9 @@ def ingest_frbs(request):
             DM (float) -- Dispersion Measure of the FRB
             tags (str, optional) -- Tag(s) for the FRB.  comma separated
       - delete (bool): Delete FRBs first?
+      - bulk (bool, optional): Insert in bulk (see frb_init.bulk_add_df_to_db)
+      - async (bool, optional): Queue the ingestion as a job and return
+            its job_id (see frb_jobs and frb_job_status)
 
     Args:
         request (requests.request): 
@@ -1957,18 +1706,23 @@ def ingest_frbs(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
+
+    # Queue?
+    if data.get('async', False):
+        job = frb_jobs.submit('ingest_frbs', dict(table=data['table'],
+                                                  delete=data['delete']), user)
+        return JsonResponse({"message": f"Queued job {job.id}", 
+                             "job_id": job.id}, status=202)
 
     # Prep
     frb_tbl = pandas.read_json(data['table'])
 
     # Run
     code, msg = frb_init.add_df_to_db(frb_tbl, user,
-                                      delete_existing=data['delete'])
+                                      delete_existing=data['delete'],
+                                      bulk=data.get('bulk', False))
 
     # Return
     return JsonResponse({"message":f"{msg}"}, status=code)
@@ -1994,6 +1748,8 @@ def modify_frbs(request):
             DM (float) -- Dispersion Measure of the FRB
             repeater (bool) -- Repeater flag for the FRB
       - delete (bool): Delete FRBs first?
+      - async (bool, optional): Queue the E(B-V)/DM_ISM and status
+            updates of the modified FRBs as a job and return its job_id
 
     Args:
         request (requests.request): 
@@ -2006,15 +1762,13 @@ def modify_frbs(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Prep
     frb_tbl = pandas.read_json(data['table'])
     msg = ''
+    modified = []
 
     # Loop me
     for ss in range(len(frb_tbl)):
@@ -2032,11 +1786,16 @@ def modify_frbs(request):
         # Modify
         _ = frb_utils.addmodify_obj(FRBTransient, idict, user)
         msg += f"Modified {ifrb['name']}\n"
+        modified.append(frb.id)
 
         # Remove PATH?
         if data['remove_path']:
             path.delete_path_entries(frb)
         
+    # Queue the enrichment?
+    if data.get('async', False):
+        job = frb_jobs.submit('enrich', dict(ids=modified, force=True), user)
+        return JsonResponse({"message":f"{msg}", "job_id": job.id}, status=202)
 
     # Return
     return JsonResponse({"message":f"{msg}"}, status=201)
@@ -2066,11 +1825,8 @@ def addmodify_criteria(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Run
     code, msg = frb_utils.addmodify_obj(FRBSampleCriteria, data, user)
@@ -2103,11 +1859,8 @@ def add_band(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab the telescope and instrument
     try:
@@ -2148,15 +1901,13 @@ def rm_frb(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Check on root
-    if username != 'root':
+    if user.username != 'root':
         msg = 'Not authorized!'
         return JsonResponse({"message":f"m{msg}"}, status=401)
-    user = auth.authenticate(username=username, password=password)
 
     # Grab it
     try:
@@ -2188,60 +1939,126 @@ def frb_update_status(request):
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
+
+    # Grab the FRBs
+    frbs = FRBTransient.objects.filter(name__in=data['names'])
+    found = set(frbs.values_list('name', flat=True))
+    for name in data['names']:
+        if name not in found:
+            return JsonResponse({"message": f'FRB {name} not in DB'}, status=401)
 
     # Run
+    all_status = frb_status.set_status_bulk(frbs)
     log_message = ''
     for name in data['names']:
-        print(f"Working on status of: {name}")
-        # Grab the FRB
-        try:
-            frb=FRBTransient.objects.get(name=name)
-        except ObjectDoesNotExist:
-            return JsonResponse({"message": f'FRB {name} not in DB'}, status=401)
-        log = frb_status.set_status(frb)
-        log_message += f"{name}: {log}, status={frb.status.name}\n"
+        log_message += f"{name}: status={all_status[name]}\n"
 
     # Return
     return JsonResponse({"message": f"All good! {log_message}"}, status=200)
 
 
+@csrf_exempt
+@login_or_basic_auth_required
+def frb_job_status(request):
+    """
+    Return the status of a queued FRB job (see frb_jobs)
+
+    The request must include:
+      - job_id (int): id returned by the endpoint that queued the job
+
+    Args:
+        request (requests.request): 
+            Request from outside FFFF-PZ
+
+    Only the user who queued the job, or staff, may see it;  to
+    others it does not exist
+
+    Returns:
+        JsonResponse: status, result and error of the job
+    """
+    
+    # Parse the data into a dict
+    data = JSONParser().parse(request)
+
+    # Grab it
+    try:
+        job = FRBJob.objects.get(id=data['job_id'])
+    except ObjectDoesNotExist:
+        job = None
+    if job is None or not (request.user.is_staff or 
+                           job.created_by_id == request.user.id):
+        return JsonResponse({"message": f"Job {data['job_id']} does not exist!"}, status=404)
+
+    # Return
+    return JsonResponse(job.as_dict(), status=200)
+
+
 @csrf_exempt
 @login_or_basic_auth_required
 def get_frb_table(request):
     """
     Grab and return a table of all FRBs in FFFF-PZ
 
-    The request must include the following items
+    The table is served from the FRBSummary table
+
+    The request may include the following items
      in its data (all in JSON, of course; 
      data types refer to those after parsing the JSON):
 
+      - columns (list, optional): columns to return
+      - filters (dict, optional): Django lookups on the columns,
+            e.g. {"status": "NeedImage", "DM__gt": 500}
+      - limit (int, optional): return one page of this many FRBs
+            as {"table": ..., "next_cursor": ...}
+      - cursor (int, optional): next_cursor of the previous page
+      - format (str, optional): stream the table as 'ndjson', 
+            'arrow' (IPC stream) or 'parquet' (see frb_export)
+
     Args:
         request (requests.request): 
             Request from outside FFFF-PZ
 
     Returns:
-        JsonResponse:  Table of information
+        JsonResponse or StreamingHttpResponse:  Table of information
     """
     
     # Parse the data into a dict
     data = JSONParser().parse(request)
 
-    # Deal with credentials
-    try:
-        auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-        credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-        username, password = credentials.split(':', 1)
-        user = auth.authenticate(username=username, password=password)
-    except:
-        return JsonResponse({"message":f"Bad user authentication in DB"}, status=401)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
+
+    # Stream?
+    fmt = data.get('format', 'json')
+    if fmt != 'json':
+        try:
+            chunks, columns = frb_tables.summary_chunks(
+                columns=data.get('columns'), filters=data.get('filters'),
+                after=data.get('cursor'))
+            schema = None if fmt == 'ndjson' else frb_export.arrow_schema(
+                FRBSummary, columns, list_types=frb_tables.summary_list_types)
+            content = frb_export.stream(chunks, fmt, schema=schema)
+        except ValueError as e:
+            return JsonResponse({"message":f"{e}"}, status=400)
+        except ImportError:
+            return JsonResponse({"message":f"pyarrow is required for format={fmt}"}, status=400)
+        return StreamingHttpResponse(content, status=200,
+                                     content_type=frb_export.content_types[fmt])
 
     # Grab
-    frbs = frb_tables.summary_table()
+    try:
+        if data.get('limit') is not None:
+            frbs, next_cursor = frb_tables.summary_page(
+                columns=data.get('columns'), filters=data.get('filters'),
+                cursor=data.get('cursor'), limit=int(data['limit']))
+            return JsonResponse({"table": frbs.to_dict(), 
+                                 "next_cursor": next_cursor}, status=201)
+        frbs = frb_tables.summary_table(columns=data.get('columns'),
+                                        filters=data.get('filters'))
+    except ValueError as e:
+        return JsonResponse({"message":f"{e}"}, status=400)
     
     # Return
     return JsonResponse(frbs.to_dict(), status=201)
@@ -2265,11 +2082,8 @@ def get_frb_path_table(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab it
     try:
@@ -2285,10 +2099,13 @@ def get_frb_path_table(request):
 @csrf_exempt
 @login_or_basic_auth_required
 def get_criteria(request):
-    """ Return a table of the PATH info for a given FRB
+    """ Return a table of the criteria for a given FRB
 
     Input data includes:
         - name (str): TNS Name of the FRBTransient
+        - names (list, optional): TNS Names of several FRBTransients.
+            If provided, one (N_frb, N_sample) table is returned
+            per criterion
 
     Args:
         request (_type_): _description_
@@ -2299,11 +2116,18 @@ def get_criteria(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
-    user = auth.authenticate(username=username, password=password)
+    # Many?
+    if data.get('names') is not None:
+        frbs = FRBTransient.objects.filter(name__in=data['names']).order_by('name')
+        cmatrix = frb_tags.chk_all_criteria_bulk(frbs)
+        tables = {}
+        for key in ['member']+frb_tags.criteria_keys:
+            tables[key] = pandas.DataFrame(cmatrix[key], index=cmatrix['frb'],
+                                           columns=cmatrix['sample']).to_dict()
+        return JsonResponse(dict(criteria=tables, message=''), status=201)
 
     # Grab it
     msg = ''
@@ -2337,11 +2161,8 @@ def chk_frb(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab it
     msg = ''
@@ -2387,11 +2208,8 @@ def get_path(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab it
     msg = ''
@@ -2436,11 +2254,8 @@ def update_tags(request):
     
     data = JSONParser().parse(request)
 
-    auth_method, credentials = request.META['HTTP_AUTHORIZATION'].split(' ', 1)
-    credentials = base64.b64decode(credentials.strip()).decode('utf-8')
-    username, password = credentials.split(':', 1)
-
-    user = auth.authenticate(username=username, password=password)
+    # Authenticated by login_or_basic_auth_required
+    user = request.user
 
     # Grab it
     msg = ''
@@ -2455,8 +2270,11 @@ def update_tags(request):
             obj.frb_tags.clear()
             print(f"Removed all tags from {data['name']}")
         # Add the new tags
-        frb_tags.add_frb_tags(obj, data['tags'], user)
+        frb_tags.add_frb_tags(obj, data['tags'], user, set_status=False)
         # Update status
+        if data.get('async', False):
+            job = frb_jobs.submit('status', dict(ids=[obj.id]), user)
+            return JsonResponse({"message": 'Success!', "job_id": job.id}, status=202)
         frb_status.set_status(obj)
 
     return JsonResponse({"message": 'Success!'}, status=201)
\ No newline at end of file
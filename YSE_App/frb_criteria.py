@@ -0,0 +1,116 @@
+""" In-process registry of the FRBSampleCriteria
+
+All of the FRBSampleCriteria are loaded once into a column-oriented
+structure (one numpy array per criterion) keyed by name.
+The registry is invalidated by the post_save/post_delete signals
+on FRBSampleCriteria (see frbsample_models.py)
+
+Note that the invalidation is per-process;  other workers
+pick up an edit on their next reload
+"""
+
+import threading
+
+import numpy as np
+
+# Columns held as numpy arrays
+#  None is stored as np.nan for the floats and False for the booleans
+float_cols = ['weight', 'min_POx', 'max_EBV', 'max_mr', 'max_PUx',
+              'min_DM', 'max_DM', 'max_a']
+bool_cols = ['use_top_two', 'run_public_path', 'apply_bright_star',
+             'skip_need_image']
+
+_registry = None
+_lock = threading.Lock()
+
+
+class SampleRegistry:
+    """ Column-oriented view of the FRBSampleCriteria table
+
+    Attributes:
+        names (np.ndarray): names of the samples
+        index (dict): row index keyed by name
+        samples (dict): FRBSampleCriteria objects keyed by name
+        weight, min_POx, etc. (np.ndarray): one array per criterion
+    """
+
+    def __init__(self, samples:list):
+        samples = sorted(samples, key=lambda sample: sample.name)
+        self.names = np.array([sample.name for sample in samples])
+        self.index = {sample.name: ii for ii, sample in enumerate(samples)}
+        self.samples = {sample.name: sample for sample in samples}
+
+        for col in float_cols:
+            setattr(self, col, np.array(
+                [np.nan if getattr(sample, col) is None else getattr(sample, col)
+                 for sample in samples], dtype=float))
+        for col in bool_cols:
+            setattr(self, col, np.array(
+                [bool(getattr(sample, col)) for sample in samples], dtype=bool))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name:str):
+        return name in self.index
+
+    def indices(self, names:list):
+        """ Row indices for a list of sample names
+
+        Names without a FRBSampleCriteria are skipped
+
+        Args:
+            names (list): sample (tag) names
+
+        Returns:
+            np.ndarray: integer indices into the columns
+        """
+        return np.array([self.index[name] for name in names if name in self.index],
+                        dtype=int)
+
+    def values(self, key:str, names:list):
+        """ Grab the values of one criterion for a list of samples
+
+        Args:
+            key (str): criterion, e.g. 'weight'
+            names (list): sample (tag) names
+
+        Returns:
+            list: values, skipping None
+        """
+        vals = []
+        for name in names:
+            if name not in self.index:
+                continue
+            value = getattr(self.samples[name], key)
+            if value is not None:
+                vals.append(value)
+        return vals
+
+
+def get_registry():
+    """ Grab the registry, loading it from the DB if needed
+
+    Returns:
+        SampleRegistry: the registry
+    """
+    global _registry
+    registry = _registry
+    if registry is None:
+        # Hiding here to avoid circular import
+        from YSE_App.models import FRBSampleCriteria
+        with _lock:
+            if _registry is None:
+                _registry = SampleRegistry(list(FRBSampleCriteria.objects.all()))
+            registry = _registry
+    return registry
+
+
+def invalidate(*args, **kwargs):
+    """ Drop the registry;  it is reloaded on next use
+
+    Signature allows direct use as a signal receiver
+    """
+    global _registry
+    with _lock:
+        _registry = None
@@ -0,0 +1,151 @@
+""" Closed-form ephemeris items for FRB targeting
+
+Vectorized, low-precision formulae for the sidereal time, the Sun
+and precession.  These are accurate to ~0.01 deg which is plenty
+for an airmass cut and avoid the astropy frame machinery
+and the iterative twilight root finding of astroplan.
+
+References:
+  Meeus, Astronomical Algorithms (2nd ed.), Ch. 12, 21
+  Astronomical Almanac, low-precision formulae for the Sun
+"""
+
+import numpy as np
+
+jd_J2000 = 2451545.0
+
+# Astronomical twilight
+twilight_alt = -18.  # deg
+# Sampling used to locate the twilights (days)
+twilight_step = 2./60/24
+
+
+def gmst(jd):
+    """ Greenwich mean sidereal time (IAU 1982)
+
+    Args:
+        jd (float or np.ndarray): Julian date (UT)
+
+    Returns:
+        float or np.ndarray: GMST [rad]
+    """
+    dd = np.asarray(jd) - jd_J2000
+    T = dd / 36525.
+    theta = 280.46061837 + 360.98564736629*dd + 0.000387933*T**2 - T**3/38710000.
+    return np.deg2rad(np.mod(theta, 360.))
+
+
+def lst(jd, longitude:float):
+    """ Local mean sidereal time
+
+    Args:
+        jd (float or np.ndarray): Julian date (UT)
+        longitude (float): East longitude [deg]
+
+    Returns:
+        float or np.ndarray: LST [rad]
+    """
+    return np.mod(gmst(jd) + np.deg2rad(longitude), 2*np.pi)
+
+
+def sun_radec(jd):
+    """ Position of the Sun (mean equinox of date)
+
+    Args:
+        jd (float or np.ndarray): Julian date
+
+    Returns:
+        tuple: RA, Dec [rad]
+    """
+    n = np.asarray(jd) - jd_J2000
+    L = np.deg2rad(280.460 + 0.9856474*n)
+    g = np.deg2rad(357.528 + 0.9856003*n)
+    lam = L + np.deg2rad(1.915*np.sin(g) + 0.020*np.sin(2*g))
+    eps = np.deg2rad(23.439 - 0.0000004*n)
+    ra = np.arctan2(np.cos(eps)*np.sin(lam), np.cos(lam))
+    dec = np.arcsin(np.sin(eps)*np.sin(lam))
+    return ra, dec
+
+
+def altitude(ra, dec, lst_rad, latitude:float):
+    """ Altitude from the hour angle
+
+    Args:
+        ra (float or np.ndarray): RA [rad]
+        dec (float or np.ndarray): Dec [rad]
+        lst_rad (float or np.ndarray): Local sidereal time [rad]
+        latitude (float): Latitude [deg]
+
+    Returns:
+        float or np.ndarray: altitude [rad]
+    """
+    lat = np.deg2rad(latitude)
+    sin_alt = np.sin(dec)*np.sin(lat) + np.cos(dec)*np.cos(lat)*np.cos(lst_rad - ra)
+    return np.arcsin(np.clip(sin_alt, -1., 1.))
+
+
+def sun_altitude(jd, longitude:float, latitude:float):
+    """ Altitude of the Sun
+
+    Args:
+        jd (float or np.ndarray): Julian date (UT)
+        longitude (float): East longitude [deg]
+        latitude (float): Latitude [deg]
+
+    Returns:
+        float or np.ndarray: altitude [deg]
+    """
+    ra, dec = sun_radec(jd)
+    return np.rad2deg(altitude(ra, dec, lst(jd, longitude), latitude))
+
+
+def twilights(jd_start:float, jd_stop:float, longitude:float, latitude:float,
+              alt:float=twilight_alt):
+    """ Times the Sun crosses a given altitude
+
+    The Sun altitude is sampled every 2 minutes and the
+    crossings are linearly interpolated
+
+    Args:
+        jd_start (float): Start Julian date
+        jd_stop (float): End Julian date
+        longitude (float): East longitude [deg]
+        latitude (float): Latitude [deg]
+        alt (float, optional): Altitude [deg]. Defaults to -18 (astronomical)
+
+    Returns:
+        tuple: np.ndarray of the morning (rising) and evening (setting)
+            Julian dates
+    """
+    jd = np.arange(jd_start, jd_stop+twilight_step, twilight_step)
+    dalt = sun_altitude(jd, longitude, latitude) - alt
+    idx = np.where(np.sign(dalt[:-1]) != np.sign(dalt[1:]))[0]
+    # Interpolate
+    frac = dalt[idx] / (dalt[idx] - dalt[idx+1])
+    crossings = jd[idx] + frac*twilight_step
+    rising = dalt[idx+1] > dalt[idx]
+    return crossings[rising], crossings[~rising]
+
+
+def precess(ra, dec, jd):
+    """ Precess J2000 coordinates to the mean equinox of date (IAU 1976)
+
+    Args:
+        ra (np.ndarray): RA [deg]
+        dec (np.ndarray): Dec [deg]
+        jd (float): Julian date of the equinox
+
+    Returns:
+        tuple: RA, Dec [rad]
+    """
+    ra0, dec0 = np.deg2rad(ra), np.deg2rad(dec)
+    t = (jd - jd_J2000) / 36525.
+    arcsec = np.pi / 180. / 3600.
+    zeta = (2306.2181*t + 0.30188*t**2 + 0.017998*t**3) * arcsec
+    z = (2306.2181*t + 1.09468*t**2 + 0.018203*t**3) * arcsec
+    theta = (2004.3109*t - 0.42665*t**2 - 0.041833*t**3) * arcsec
+
+    A = np.cos(dec0)*np.sin(ra0+zeta)
+    B = np.cos(theta)*np.cos(dec0)*np.cos(ra0+zeta) - np.sin(theta)*np.sin(dec0)
+    C = np.sin(theta)*np.cos(dec0)*np.cos(ra0+zeta) + np.cos(theta)*np.sin(dec0)
+    return np.mod(np.arctan2(A, B) + z, 2*np.pi), np.arcsin(np.clip(C, -1., 1.))
@@ -0,0 +1,189 @@
+""" Paginated and streaming export of the FRB tables
+
+The rows are read in chunks by keyset pagination on an ordered,
+unique key (MySQL does not stream result sets, so a plain
+QuerySet.iterator() would still buffer all of them) and
+encoded incrementally as
+
+  ndjson  -- one JSON object per line
+  arrow   -- Arrow IPC stream, one record batch per chunk
+  parquet -- Parquet file, one row group per chunk
+
+so the server memory is set by the chunk size, not the table size,
+and the first rows go out as soon as the first chunk is read.
+
+arrow and parquet require pyarrow
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Rows per query / record batch
+chunk_size = 2000
+
+# Content types of the streaming formats
+content_types = dict(ndjson='application/x-ndjson',
+                     arrow='application/vnd.apache.arrow.stream',
+                     parquet='application/vnd.apache.parquet')
+
+
+def iter_chunks(qs, key:str='pk', chunk:int=chunk_size, after=None):
+    """ Iterate on a QuerySet in chunks, by keyset pagination
+
+    Args:
+        qs (QuerySet): rows to export;  if a .values() QuerySet
+            it must include key
+        key (str, optional): unique field to page on. Defaults to 'pk'.
+        chunk (int, optional): rows per query. Defaults to 2000.
+        after (optional): only rows with key > after. Defaults to None.
+
+    Yields:
+        list: the rows (dicts or model instances) of one chunk
+    """
+    qs = qs.order_by(key)
+    while True:
+        iqs = qs if after is None else qs.filter(**{f'{key}__gt': after})
+        rows = list(iqs[:chunk])
+        if len(rows) == 0:
+            return
+        yield rows
+        if len(rows) < chunk:
+            return
+        last = rows[-1]
+        after = last[key] if isinstance(last, dict) else getattr(last, key)
+
+def page(qs, key:str='pk', limit:int=chunk_size, after=None):
+    """ One page of a QuerySet, by keyset pagination
+
+    Args:
+        qs (QuerySet): rows to export (see iter_chunks())
+        key (str, optional): unique field to page on. Defaults to 'pk'.
+        limit (int, optional): rows per page. Defaults to 2000.
+        after (optional): cursor returned for the previous page.
+            Defaults to None (first page).
+
+    Returns:
+        tuple: list of rows, cursor of the next page (None if this is the last)
+    """
+    rows = next(iter_chunks(qs, key=key, chunk=limit, after=after), [])
+    if len(rows) < limit:
+        return rows, None
+    last = rows[-1]
+    return rows, last[key] if isinstance(last, dict) else getattr(last, key)
+
+
+# #########################################################
+# Encoders
+# #########################################################
+
+def ndjson_stream(chunks):
+    """ Encode chunks of rows as NDJSON
+
+    Args:
+        chunks (iterable): lists of dicts
+
+    Yields:
+        str: the lines of a chunk
+    """
+    for rows in chunks:
+        yield ''.join([json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows])
+
+def arrow_schema(model, columns:list, list_types:dict=None):
+    """ Arrow schema for a set of fields of a model
+
+    Args:
+        model (django model): model holding the fields
+        columns (list): field names
+        list_types (dict, optional): element type (float or str)
+            of the JSONFields holding lists, keyed by field name.
+            Other JSONFields are exported as JSON strings.
+
+    Returns:
+        pyarrow.Schema: the schema
+    """
+    import pyarrow as pa
+
+    types = dict(FloatField=pa.float64(), IntegerField=pa.int64(),
+                 BigIntegerField=pa.int64(), AutoField=pa.int64(),
+                 BigAutoField=pa.int64(), ForeignKey=pa.int64(),
+                 OneToOneField=pa.int64(), BooleanField=pa.bool_(),
+                 CharField=pa.string(), TextField=pa.string(),
+                 SlugField=pa.string(), JSONField=pa.string(),
+                 DateTimeField=pa.timestamp('us', tz='UTC'))
+    elements = {float: pa.float64(), str: pa.string()}
+    list_types = {} if list_types is None else list_types
+
+    fields = []
+    for column in columns:
+        if column in list_types:
+            fields.append(pa.field(column, pa.list_(elements[list_types[column]])))
+        else:
+            itype = model._meta.get_field(column).get_internal_type()
+            fields.append(pa.field(column, types.get(itype, pa.string())))
+    return pa.schema(fields)
+
+class _Sink:
+    """ File-like object collecting what pyarrow writes until drained """
+    def __init__(self):
+        self.buffers = []
+        self.closed = False
+
+    def write(self, data):
+        self.buffers.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.buffers = b''.join(self.buffers), []
+        return data
+
+def arrow_stream(chunks, schema, fmt:str='arrow'):
+    """ Encode chunks of rows as an Arrow IPC stream or a Parquet file
+
+    Args:
+        chunks (iterable): lists of dicts
+        schema (pyarrow.Schema): see arrow_schema()
+        fmt (str, optional): 'arrow' or 'parquet'. Defaults to 'arrow'.
+
+    Yields:
+        bytes: the encoded record batch (row group) of a chunk
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    json_cols = [field.name for field in schema if field.type == pa.string()]
+    sink = _Sink()
+    writer = pa.ipc.new_stream(sink, schema) if fmt == 'arrow' else \
+        pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        for row in rows:
+            for col in json_cols:
+                if row[col] is not None and not isinstance(row[col], str):
+                    row[col] = json.dumps(row[col], cls=DjangoJSONEncoder)
+        writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def stream(chunks, fmt:str, schema=None):
+    """ Encode chunks of rows in one of the streaming formats
+
+    Args:
+        chunks (iterable): lists of dicts
+        fmt (str): 'ndjson', 'arrow' or 'parquet'
+        schema (pyarrow.Schema, optional): required for arrow and parquet
+
+    Returns:
+        generator: of str or bytes
+    """
+    if fmt not in content_types:
+        raise ValueError(f"Bad format: {fmt}.  Allowed: {list(content_types.keys())}")
+    if fmt == 'ndjson':
+        return ndjson_stream(chunks)
+    return arrow_stream(chunks, schema, fmt=fmt)
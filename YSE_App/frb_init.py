@@ -1,7 +1,11 @@
 """ Methods to init the DB """
 
+import numpy as np
 import pandas
 
+from django.conf import settings as djangoSettings
+from django.db import transaction
+
 from YSE_App.models import TransientStatus
 from YSE_App.models import ObservationGroup
 from YSE_App.models import FRBSurvey
@@ -12,7 +16,11 @@ from YSE_App import frb_status
 from YSE_App import frb_utils
 from YSE_App.models import FRBTransient
 from YSE_App import frb_tags
+from YSE_App import frb_ism
+from YSE_App import frb_tables
+from YSE_App.common import healpix
 from YSE_App.models import FRBSampleCriteria
+from YSE_App.models import FRBTag
 
 from YSE_App.serializers import FRBSampleCriteriaSerializer
 
@@ -60,8 +68,13 @@ def init_surveys(user):
                         dict(name=survey), {}, user)
 
 
+# Columns of the input table that are not FRBTransient fields
+skip_keys = ['transientphotometry', 'transientspectra', 'host', 'tags',
+             'gw', 'non_detect_instrument', 'internal_names']
+
+
 def add_df_to_db(df_frbs:pandas.DataFrame, user, 
-                 delete_existing:bool=False):
+                 delete_existing:bool=False, bulk:bool=False):
     """ Add a pandas DataFrame of FRBs to the database
 
     Args:
@@ -69,6 +82,8 @@ def add_df_to_db(df_frbs:pandas.DataFrame, user,
         user (_type_): autheticated user
         delete_existing (bool, optional): If True, delete any
             existing FRBs with the same TNS first. Defaults to False.
+        bulk (bool, optional): If True, use bulk_add_df_to_db().
+            Defaults to False.
 
     Raises:
         IOError: _description_
@@ -76,6 +91,8 @@ def add_df_to_db(df_frbs:pandas.DataFrame, user,
     Returns:
         list: list of the Transient objects added to the database
     """
+    if bulk:
+        return bulk_add_df_to_db(df_frbs, user, delete_existing=delete_existing)
 
     # TNS names
     tns_names = [t.name for t in FRBTransient.objects.all()]
@@ -103,13 +120,7 @@ def add_df_to_db(df_frbs:pandas.DataFrame, user,
                          'modified_by_id':user.id}
 
         for transientkey in transientkeys:
-            if transientkey == 'transientphotometry' or \
-                transientkey == 'transientspectra' or \
-                transientkey == 'host' or \
-                transientkey == 'tags' or \
-                transientkey == 'gw' or \
-                transientkey == 'non_detect_instrument' or \
-                transientkey == 'internal_names': continue
+            if transientkey in skip_keys: continue
             if not isinstance(FRBTransient._meta.get_field(transientkey), ForeignKey):
                 if transient[transientkey] is not None: transientdict[transientkey] = transient[transientkey]
             else:
@@ -126,12 +137,17 @@ def add_df_to_db(df_frbs:pandas.DataFrame, user,
         # Set null status
         dbtransient.status = TransientStatus.objects.get(name='Unassigned')
 
-        # Save me!
-        dbtransient.save()
+        # E(B-V) and DM_ISM left to an 'enrich' job?  It sets the status
+        #  once they are filled, after the tags are committed
+        async_enrich = getattr(djangoSettings, 'FRB_ASYNC_ENRICH', False)
+        with transaction.atomic():
+            # Save me!
+            dbtransient.save()
 
-        # Tags
-        if hasattr(transient, 'tags'):
-            frb_tags.add_frb_tags(dbtransient, transient['tags'], user)
+            # Tags
+            if hasattr(transient, 'tags'):
+                frb_tags.add_frb_tags(dbtransient, transient['tags'], user,
+                                      set_status=not async_enrich)
 
         # Add to list
         dbtransients.append(dbtransient)
@@ -140,3 +156,111 @@ def add_df_to_db(df_frbs:pandas.DataFrame, user,
     # Return
     return 200, 'All clear!'
 
+
+def bulk_add_df_to_db(df_frbs:pandas.DataFrame, user, 
+                      delete_existing:bool=False, batch_size:int=1000):
+    """ Add a pandas DataFrame of FRBs to the database in bulk
+
+    The FRBTransients and their tag links are inserted with 
+    bulk_create (no post_save signal is fired), E(B-V) and 
+    DM_ISM are calculated for all the FRBs at once (see frb_ism) 
+    and the statuses are set in a single pass at the end
+
+    Args:
+        df_frbs (pandas.DataFrame): pandas DataFrame of FRBs
+        user (_type_): autheticated user
+        delete_existing (bool, optional): If True, delete any
+            existing FRBs with the same TNS first. Defaults to False.
+        batch_size (int, optional): Rows per INSERT. Defaults to 1000.
+
+    Returns:
+        tuple: status code, message
+    """
+    # Existing
+    existing = set(FRBTransient.objects.filter(
+        name__in=list(df_frbs['name'])).values_list('name', flat=True))
+    if len(existing) > 0:
+        if delete_existing:
+            FRBTransient.objects.filter(name__in=existing).delete()
+        else:
+            print(f"Skipping {len(existing)} FRBTransients already in the database")
+            df_frbs = df_frbs[~df_frbs['name'].isin(existing)]
+    if len(df_frbs) == 0:
+        return 200, 'All clear!'
+
+    unassigned = TransientStatus.objects.get(name='Unassigned')
+
+    # Build the FRBTransients
+    fk_cache = {}
+    dbtransients = []
+    for transient in df_frbs.to_dict('records'):
+        transientdict = {'created_by_id':user.id,
+                         'modified_by_id':user.id}
+        for transientkey, value in transient.items():
+            if transientkey in skip_keys: continue
+            field = FRBTransient._meta.get_field(transientkey)
+            if not isinstance(field, ForeignKey):
+                if value is not None: transientdict[transientkey] = value
+            else:
+                if (transientkey, value) not in fk_cache:
+                    fk_cache[(transientkey, value)] = field.remote_field.model.objects.filter(
+                        name=value).first()
+                if fk_cache[(transientkey, value)] is None:
+                    print(f'Bad key: {transientkey}')
+                else:
+                    transientdict[transientkey] = fk_cache[(transientkey, value)]
+        dbtransient = FRBTransient(**transientdict)
+        dbtransient.status = unassigned
+        dbtransients.append(dbtransient)
+
+    # Galactic foreground -- Needs to come before the status
+    ras = np.array([frb.ra for frb in dbtransients])
+    decs = np.array([frb.dec for frb in dbtransients])
+    for frb, ebv, DM_ISM in zip(dbtransients, frb_ism.mw_ebv(ras, decs),
+                                 frb_ism.dm_ism(ras, decs)):
+        frb.mw_ebv = float(ebv)
+        frb.DM_ISM = float(DM_ISM)
+
+    # Tags
+    tags_by_name = {}
+    if 'tags' in df_frbs.keys():
+        for frb_tags_str in df_frbs['tags']:
+            if not isinstance(frb_tags_str, str):
+                continue
+            for tag_name in frb_tags_str.split(','):
+                if tag_name not in tags_by_name:
+                    tags_by_name[tag_name] = add_or_grab_obj(
+                        FRBTag, dict(name=tag_name), {}, user)
+
+    # Spatial index (bulk_create skips pre_save)
+    healpix.assign(dbtransients)
+
+    with transaction.atomic():
+        FRBTransient.objects.bulk_create(dbtransients, batch_size=batch_size)
+
+        # Grab the ids (not set by bulk_create on MySQL)
+        ids = dict(FRBTransient.objects.filter(
+            name__in=[frb.name for frb in dbtransients]).values_list('name', 'id'))
+
+        if len(tags_by_name) > 0:
+            Through = FRBTransient.frb_tags.through
+            links = []
+            for name, frb_tags_str in zip(df_frbs['name'], df_frbs['tags']):
+                if not isinstance(frb_tags_str, str):
+                    continue
+                for tag_name in set(frb_tags_str.split(',')):
+                    links.append(Through(frbtransient_id=ids[name],
+                                         frbtag_id=tags_by_name[tag_name].id))
+            Through.objects.bulk_create(links, batch_size=batch_size,
+                                        ignore_conflicts=True)
+
+    # Status;  in one transaction so the summary is refreshed once
+    with transaction.atomic():
+        new_frbs = FRBTransient.objects.filter(id__in=list(ids.values()))
+        frb_status.set_status_bulk(new_frbs)
+
+        # bulk_create skips the signals
+        frb_tables.mark_summary_dirty(list(ids.values()))
+
+    # Return
+    return 200, 'All clear!'
@@ -0,0 +1,228 @@
+""" Galactic foreground (E(B-V) and DM_ISM) for sets of FRBs
+
+Batch versions of the calculations made in
+frbtransient_models.execute_after_save() for a single FRB
+
+When the local files are configured (settings.FRB_SFD_MAP and
+settings.FRB_NE2001_GRID) both quantities are looked up offline:
+
+  E(B-V) -- SFD map in HEALPix (RING) format, memory-mapped
+  DM_ISM -- NE2001 pre-computed on a grid in (l,b) and
+            bilinearly interpolated (see build_ne2001_grid())
+
+Otherwise IRSA and NE2001 are queried directly.
+The local files are loaded once per process
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+
+from YSE_App.common.healpix import ang2pix_ring
+
+# Number of simultaneous queries to IRSA
+irsa_threads = 8
+# IRSA's 'ext SandF mean' is Schlafly & Finkbeiner (2011),
+#  i.e. a recalibration of SFD
+sf11_scale = 0.86
+# Default distance for NE2001 [kpc]
+ne2001_distance = 100.
+
+
+def _local_file(key:str):
+    from django.conf import settings
+    path = getattr(settings, key, None)
+    if path and os.path.isfile(path):
+        return path
+    return None
+
+def _galactic(ras, decs):
+    gcoords = SkyCoord(ra=np.atleast_1d(ras), dec=np.atleast_1d(decs),
+                       unit='deg').transform_to('galactic')
+    return gcoords.l.deg, gcoords.b.deg
+
+
+# #########################################################
+# E(B-V)
+# #########################################################
+
+def mw_ebv(ras, decs):
+    """ Galactic E(B-V) (Schlafly & Finkbeiner)
+
+    Uses the local SFD map if configured, otherwise IRSA
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+
+    Returns:
+        np.ndarray: E(B-V)
+    """
+    sfd_file = _local_file('FRB_SFD_MAP')
+    if sfd_file is None:
+        return mw_ebv_irsa(ras, decs)
+    l, b = _galactic(ras, decs)
+    return sf11_scale * sfd_lookup(sfd_file, l, b)
+
+def mw_ebv_irsa(ras, decs, nthreads:int=irsa_threads):
+    """ Galactic E(B-V) (Schlafly & Finkbeiner) from IRSA
+
+    The queries are made concurrently
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+        nthreads (int, optional): Number of simultaneous queries.
+
+    Returns:
+        np.ndarray: E(B-V)
+    """
+    from astroquery import irsa_dust
+
+    coords = SkyCoord(ra=np.atleast_1d(ras), dec=np.atleast_1d(decs), unit='deg')
+    if len(coords) == 0:
+        return np.zeros(0)
+
+    def query(coord):
+        return irsa_dust.IrsaDust.get_query_table(coord)['ext SandF mean'][0]
+
+    with ThreadPoolExecutor(max_workers=nthreads) as pool:
+        ebvs = list(pool.map(query, coords))
+    return np.array(ebvs, dtype=float)
+
+@lru_cache(maxsize=2)
+def load_sfd(sfd_file:str):
+    """ Memory-map a HEALPix SFD map
+
+    Args:
+        sfd_file (str): FITS file with the map in the first
+            column of the first extension;  RING ordering
+
+    Returns:
+        tuple: nside (int), map (np.ndarray)
+    """
+    hdul = fits.open(sfd_file, memmap=True)
+    header = hdul[1].header
+    if header.get('ORDERING', 'RING').upper() != 'RING':
+        raise IOError(f"{sfd_file} must be in RING ordering")
+    hmap = hdul[1].data.field(0).ravel()
+    nside = int(header.get('NSIDE', np.sqrt(hmap.size/12)))
+    return nside, hmap
+
+def sfd_lookup(sfd_file:str, l, b):
+    """ SFD E(B-V) at a set of Galactic coordinates
+
+    Args:
+        sfd_file (str): HEALPix map (see load_sfd())
+        l (np.ndarray): Galactic longitude [deg]
+        b (np.ndarray): Galactic latitude [deg]
+
+    Returns:
+        np.ndarray: E(B-V) (SFD)
+    """
+    nside, hmap = load_sfd(sfd_file)
+    pix = ang2pix_ring(nside, np.deg2rad(90.-np.asarray(b)), np.deg2rad(l))
+    return np.asarray(hmap[pix], dtype=float)
+
+
+# #########################################################
+# DM_ISM
+# #########################################################
+
+def dm_ism(ras, decs):
+    """ Galactic DM_ISM from NE2001
+
+    Uses the local grid if configured, otherwise NE2001 itself
+
+    Args:
+        ras (np.ndarray): RA [deg]
+        decs (np.ndarray): Dec [deg]
+
+    Returns:
+        np.ndarray: DM_ISM [pc/cm^3]
+    """
+    grid_file = _local_file('FRB_NE2001_GRID')
+    l, b = _galactic(ras, decs)
+    if grid_file is None:
+        return dm_ism_ne2001(l, b)
+    return ne2001_lookup(grid_file, l, b)
+
+def dm_ism_ne2001(l, b, distance:float=ne2001_distance):
+    """ DM_ISM from NE2001, one sightline at a time
+
+    Args:
+        l (np.ndarray): Galactic longitude [deg]
+        b (np.ndarray): Galactic latitude [deg]
+        distance (float, optional): Distance to integrate to [kpc].
+            Defaults to 100.
+
+    Returns:
+        np.ndarray: DM_ISM [pc/cm^3]
+    """
+    from ne2001 import density
+
+    ne = density.ElectronDensity()
+    return np.array([ne.DM(il, ib, distance).value for il, ib in
+                     zip(np.atleast_1d(l), np.atleast_1d(b))], dtype=float)
+
+def build_ne2001_grid(outfile:str, dl:float=1., db:float=0.5,
+                      distance:float=ne2001_distance):
+    """ Pre-compute NE2001 on a grid in (l,b)
+
+    This is slow (one NE2001 integration per grid point)
+    and is meant to be run once
+
+    Args:
+        outfile (str): Output .npz file
+        dl (float, optional): Step in l [deg]. Defaults to 1.
+        db (float, optional): Step in b [deg]. Defaults to 0.5.
+        distance (float, optional): Distance to integrate to [kpc].
+    """
+    l = np.arange(0., 360.+dl/2, dl)
+    b = np.arange(-90., 90.+db/2, db)
+    ll, bb = np.meshgrid(l[:-1], b, indexing='ij')
+    DM = dm_ism_ne2001(ll.ravel(), bb.ravel(), distance=distance).reshape(ll.shape)
+    # Wrap in l
+    DM = np.concatenate([DM, DM[:1]], axis=0)
+    np.savez(outfile, l=l, b=b, DM=DM, distance=distance)
+
+@lru_cache(maxsize=2)
+def load_ne2001_grid(grid_file:str):
+    """ Load a grid written by build_ne2001_grid()
+
+    Args:
+        grid_file (str): .npz file
+
+    Returns:
+        tuple: l, b, DM (np.ndarray)
+    """
+    data = np.load(grid_file)
+    return data['l'], data['b'], data['DM']
+
+def ne2001_lookup(grid_file:str, l, b):
+    """ Bilinear interpolation of the NE2001 grid
+
+    Args:
+        grid_file (str): .npz file (see build_ne2001_grid())
+        l (np.ndarray): Galactic longitude [deg]
+        b (np.ndarray): Galactic latitude [deg]
+
+    Returns:
+        np.ndarray: DM_ISM [pc/cm^3]
+    """
+    lgrid, bgrid, DM = load_ne2001_grid(grid_file)
+    l = np.mod(np.atleast_1d(l), 360.)
+    b = np.clip(np.atleast_1d(b), bgrid[0], bgrid[-1])
+
+    il = np.clip(np.searchsorted(lgrid, l, side='right') - 1, 0, len(lgrid)-2)
+    ib = np.clip(np.searchsorted(bgrid, b, side='right') - 1, 0, len(bgrid)-2)
+    fl = (l - lgrid[il]) / (lgrid[il+1] - lgrid[il])
+    fb = (b - bgrid[ib]) / (bgrid[ib+1] - bgrid[ib])
+
+    return (DM[il, ib]*(1-fl)*(1-fb) + DM[il+1, ib]*fl*(1-fb) +
+            DM[il, ib+1]*(1-fl)*fb + DM[il+1, ib+1]*fl*fb)
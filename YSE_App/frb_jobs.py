@@ -0,0 +1,311 @@
+""" DB-backed queue of background jobs for the FRBs
+
+Slow work (E(B-V)/DM_ISM enrichment, status recomputation,
+bulk FRB and PATH ingestion) is submitted as a FRBJob and the endpoints
+return the job id immediately.  The jobs are run by a pool
+of local worker processes:
+
+    python manage.py frb_worker --processes 4
+
+which claim the queued jobs with SELECT ... FOR UPDATE SKIP LOCKED,
+so no external broker is required.  Poll a job with the
+frb_job_status endpoint.
+"""
+
+import datetime
+import multiprocessing
+import os
+import time
+import traceback
+
+import numpy as np
+import pandas
+
+# Number of tries before a job is marked failed
+max_attempts = 3
+# Wait before the first retry of a failed job [s];  doubled at each retry
+retry_wait = 60.
+# Running jobs older than this are considered orphaned [s]
+stale_after = 3600.
+
+handlers = {}
+
+
+def handler(kind:str):
+    """ Register the handler of a kind of job
+
+    The handler is called as handler(payload, user) and returns
+    a JSON-serializable result
+
+    Args:
+        kind (str): name of the job kind
+    """
+    def register(func):
+        handlers[kind] = func
+        return func
+    return register
+
+
+# #########################################################
+# Handlers
+# #########################################################
+
+@handler('enrich')
+def enrich(payload:dict, user=None):
+    """ Galactic E(B-V) and DM_ISM, then the statuses
+
+    Args:
+        payload (dict):
+            ids (list) -- FRBTransient ids
+            force (bool, optional) -- Recompute even if already set
+
+    Returns:
+        dict: number of FRBs enriched and the statuses
+    """
+    from django.db import transaction
+    from django.db.models import Q
+    from YSE_App.models import FRBTransient
+    from YSE_App import frb_ism
+    from YSE_App import frb_status
+    from YSE_App import frb_tables
+
+    frbs = FRBTransient.objects.filter(id__in=payload['ids'])
+    todo = list(frbs) if payload.get('force', False) else \
+        list(frbs.filter(Q(mw_ebv__isnull=True) | Q(DM_ISM__isnull=True)))
+    if len(todo) > 0:
+        ras = np.array([frb.ra for frb in todo])
+        decs = np.array([frb.dec for frb in todo])
+        for frb, ebv, DM_ISM in zip(todo, frb_ism.mw_ebv(ras, decs),
+                                     frb_ism.dm_ism(ras, decs)):
+            frb.mw_ebv = float(ebv)
+            frb.DM_ISM = float(DM_ISM)
+
+    # One transaction:  the summary is refreshed once
+    with transaction.atomic():
+        if len(todo) > 0:
+            FRBTransient.objects.bulk_update(todo, ['mw_ebv', 'DM_ISM'], batch_size=1000)
+            # bulk_update skips the signals
+            frb_tables.mark_summary_dirty([frb.id for frb in todo])
+        all_status = frb_status.set_status_bulk(frbs)
+    return dict(enriched=len(todo), status=all_status)
+
+@handler('status')
+def status(payload:dict, user=None):
+    """ Recompute the statuses
+
+    Args:
+        payload (dict):
+            ids (list, optional) -- FRBTransient ids;  all if not provided
+
+    Returns:
+        dict: the statuses
+    """
+    from YSE_App.models import FRBTransient
+    from YSE_App import frb_status
+
+    frbs = FRBTransient.objects.all()
+    if payload.get('ids') is not None:
+        frbs = frbs.filter(id__in=payload['ids'])
+    return dict(status=frb_status.set_status_bulk(frbs))
+
+@handler('ingest_frbs')
+def ingest_frbs(payload:dict, user=None):
+    """ Bulk ingestion of a table of FRBs (see frb_init.bulk_add_df_to_db)
+
+    Args:
+        payload (dict):
+            table (str) -- JSON table of the FRBs
+            delete (bool) -- Delete existing FRBs first
+
+    Returns:
+        dict: code and message
+    """
+    from YSE_App import frb_init
+
+    frb_tbl = pandas.read_json(payload['table'])
+    code, msg = frb_init.bulk_add_df_to_db(frb_tbl, user,
+                                           delete_existing=payload['delete'])
+    return dict(code=code, message=msg)
+
+@handler('ingest_path')
+def ingest_path(payload:dict, user=None):
+    """ Bulk ingestion of PATH results (see path.ingest_path_results_bulk)
+
+    Args:
+        payload (dict):
+            entries (list) -- validated entries of IngestPathBulkView,
+                keyed by transient_name
+
+    Returns:
+        dict: number of FRBs and of Path entries
+    """
+    from YSE_App.models import FRBTransient
+    from YSE_App.galaxies import path
+
+    entries = payload['entries']
+    transients = FRBTransient.objects.in_bulk(
+        [entry['transient_name'] for entry in entries], field_name='name')
+    path_entries = [dict(transient=transients[entry['transient_name']],
+                         candidates=pandas.DataFrame(entry['table']),
+                         Filter=entry['F'], inst_name=entry['instrument'],
+                         obs_group=entry['obs_group'], P_Ux=entry['P_Ux'],
+                         telescope_name=entry.get('telescope_name'),
+                         bright_star=entry.get('bright_star'),
+                         new_tags=entry.get('new_tags')) for entry in entries]
+    npath = path.ingest_path_results_bulk(path_entries, user, remove_previous=True)
+    return dict(nfrb=len(path_entries), npath=npath)
+
+
+# #########################################################
+# Queue
+# #########################################################
+
+def submit(kind:str, payload:dict, user=None):
+    """ Add a job to the queue
+
+    Args:
+        kind (str): kind of job;  must have a handler
+        payload (dict): input of the handler (JSON-serializable)
+        user (User, optional): user submitting the job
+
+    Returns:
+        FRBJob: the queued job
+    """
+    from YSE_App.models import FRBJob
+
+    if kind not in handlers:
+        raise IOError(f"No handler for job kind: {kind}")
+    return FRBJob.objects.create(kind=kind, payload=payload, created_by=user)
+
+def claim(worker:str=''):
+    """ Claim the oldest queued job that is not waiting for a retry
+
+    Args:
+        worker (str, optional): name of the worker
+
+    Returns:
+        FRBJob or None: the claimed job, now running
+    """
+    from django.db import transaction
+    from django.db.models import Q
+    from django.utils import timezone
+    from YSE_App.models import FRBJob
+
+    with transaction.atomic():
+        job = FRBJob.objects.select_for_update(skip_locked=True).filter(
+            status=FRBJob.QUEUED).filter(
+                Q(run_after__isnull=True) | Q(run_after__lte=timezone.now())).order_by(
+                    'id').first()
+        if job is None:
+            return None
+        job.status = FRBJob.RUNNING
+        job.started_date = timezone.now()
+        job.attempts += 1
+        job.worker = worker
+        job.save(update_fields=['status', 'started_date', 'attempts', 'worker'])
+    return job
+
+def run(job):
+    """ Run a claimed job and record the outcome
+
+    A failed job is re-queued until it has been tried max_attempts times,
+    and waits retry_wait seconds (doubled at each retry) before the next
+
+    Args:
+        job (FRBJob): the job
+    """
+    from django.utils import timezone
+    from YSE_App.models import FRBJob
+
+    try:
+        job.result = handlers[job.kind](job.payload, user=job.created_by)
+        job.status = FRBJob.DONE
+        job.error = ''
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < max_attempts:
+            job.status = FRBJob.QUEUED
+            job.run_after = timezone.now() + datetime.timedelta(
+                seconds=retry_wait * 2**(job.attempts-1))
+        else:
+            job.status = FRBJob.FAILED
+    job.finished_date = timezone.now()
+    job.save(update_fields=['result', 'status', 'error', 'run_after', 'finished_date'])
+
+def requeue_stale(seconds:float=stale_after):
+    """ Put back on the queue the jobs of dead workers
+
+    Those already tried max_attempts times are marked failed
+
+    Args:
+        seconds (float, optional): Age of a running job to be
+            considered orphaned
+
+    Returns:
+        int: number of jobs re-queued
+    """
+    from django.utils import timezone
+    from YSE_App.models import FRBJob
+
+    now = timezone.now()
+    stale = FRBJob.objects.filter(status=FRBJob.RUNNING,
+                                  started_date__lt=now - datetime.timedelta(seconds=seconds))
+    stale.filter(attempts__gte=max_attempts).update(
+        status=FRBJob.FAILED, error='Worker died', finished_date=now)
+    return stale.filter(attempts__lt=max_attempts).update(
+        status=FRBJob.QUEUED, run_after=now + datetime.timedelta(seconds=retry_wait))
+
+def work(worker:str='', poll:float=2., max_jobs:int=None,
+         exit_when_empty:bool=False):
+    """ Worker loop: claim and run jobs
+
+    Args:
+        worker (str, optional): name of the worker
+        poll (float, optional): Wait between checks of an empty queue [s]
+        max_jobs (int, optional): Stop after this many jobs
+        exit_when_empty (bool, optional): Stop when the queue is empty
+
+    Returns:
+        int: number of jobs run
+    """
+    from django.db import close_old_connections
+
+    njob = 0
+    while max_jobs is None or njob < max_jobs:
+        close_old_connections()
+        job = claim(worker=worker)
+        if job is None:
+            if exit_when_empty:
+                break
+            time.sleep(poll)
+            continue
+        run(job)
+        njob += 1
+    return njob
+
+def _work_process(ii:int, poll:float, exit_when_empty:bool):
+    import django
+    django.setup()
+    work(worker=f'{os.uname()[1]}:{os.getpid()}:{ii}', poll=poll,
+         exit_when_empty=exit_when_empty)
+
+def run_workers(nprocess:int=2, poll:float=2., exit_when_empty:bool=False):
+    """ Run a pool of worker processes until they exit
+
+    Args:
+        nprocess (int, optional): Number of processes. Defaults to 2.
+        poll (float, optional): Wait between checks of an empty queue [s]
+        exit_when_empty (bool, optional): Stop when the queue is empty
+    """
+    from django.db import connections
+
+    requeue_stale()
+    # The children open their own connections
+    connections.close_all()
+    procs = [multiprocessing.Process(target=_work_process,
+                                     args=(ii, poll, exit_when_empty))
+             for ii in range(nprocess)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
@@ -1,5 +1,10 @@
 """ Methods for dealing with FRB Observing """
 
+import operator
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone as du_timezone
 
 from YSE_App.models import FRBFollowUpRequest
@@ -11,6 +16,7 @@ from YSE_App.models import FRBTransient
 
 from YSE_App import frb_utils
 from YSE_App import frb_status
+from YSE_App import frb_tables
 
 
 import pandas
@@ -25,8 +31,16 @@ def ingest_obsplan(obsplan:pandas.DataFrame, user,
 
     This updates the transient status and adds to FRBFollowUpRequest
 
+    The FRBs and resources are grabbed with one query each,
+    everything is written in a single transaction (rolled back
+    on any error) and the statuses of all the affected FRBs 
+    are set in one pass at the end
+
     Args:
-        obsplan (pandas.DataFrame): _description_
+        obsplan (pandas.DataFrame): table of requests
+            -- TNS (str)
+            -- Resource (str)
+            -- mode (str)
         user (_type_): User who is ingesting the plan
         iresource (str): Name of the FRB Followup Resource
         override (bool, optional): If True, allow several of the
@@ -36,56 +50,72 @@ def ingest_obsplan(obsplan:pandas.DataFrame, user,
         tuple: (status, message) (int,str) 
     """
 
-    # Scrub previous entries with the same named resource
+    # Grab the resource
     try:
         resource=FRBFollowUpResource.objects.get(name=iresource)
-    except:
-        return 409, f"Resource {obsplan['Resource'].values[0]} not in DB"
-    all_pending = FRBFollowUpRequest.objects.filter(
-        resource=resource)
-    for pending in all_pending:
-        transient = pending.transient
-        # Delete
-        pending.delete()
-        # Update status
-        frb_status.set_status(transient)
-    
-    # Loop on rows to add
-    if len(obsplan) == 0:
-        return 200, "All good"
+    except FRBFollowUpResource.DoesNotExist:
+        return 409, f"Resource {iresource} not in DB"
+
+    with transaction.atomic():
+        # Scrub previous entries with the same named resource
+        all_pending = FRBFollowUpRequest.objects.filter(resource=resource)
+        affected = set(all_pending.values_list('transient_id', flat=True))
+        all_pending.delete()
         
-    for _, row in obsplan.iterrows():
-
-        # Grab the transient
-        try:
-            transient=FRBTransient.objects.get(name=row['TNS'])
-        except:
-            return 401, f"FRB {row['TNS']} not in DB"
-
-        # Check if the transient status is OK
-        if row['mode'] in ['imaging']:
-            if transient.status.name != 'NeedImage' and not override:
-                return 402, f"FRB {row['TNS']} not in NeedImage status" 
-        elif row['mode'] in ['longslit', 'mask']:
-            if transient.status.name != 'NeedSpectrum' and not override:
-                return 403, f"FRB {row['TNS']} not in NeedSpectrum status" 
-        else:
-            return 406, f"Mode {row['mode']} not allowed"
+        if len(obsplan) == 0:
+            frb_status.set_status_bulk(FRBTransient.objects.filter(id__in=affected))
+            return 200, "All good"
+
+        # The FRBs of the plan need their status without the scrubbed requests
+        names = set(obsplan['TNS'])
+        frb_status.set_status_bulk(FRBTransient.objects.filter(
+            id__in=affected, name__in=names))
+
+        # Grab the transients and resources
+        transients = FRBTransient.objects.select_related('status').in_bulk(
+            names, field_name='name')
+        resources = FRBFollowUpResource.objects.in_bulk(
+            set(obsplan['Resource']), field_name='name')
+
+        # Check the rows
+        keys = set()
+        for _, row in obsplan.iterrows():
+            # Grab the transient
+            if row['TNS'] not in transients:
+                transaction.set_rollback(True)
+                return 401, f"FRB {row['TNS']} not in DB"
+            transient = transients[row['TNS']]
+
+            # Check if the transient status is OK
+            code, msg = _chk_mode_status(row, transient, override,
+                                         'NeedImage', 'NeedSpectrum')
+            if code != 200:
+                transaction.set_rollback(True)
+                return code, msg
+
+            # Grab the resource
+            if row['Resource'] not in resources:
+                transaction.set_rollback(True)
+                return 405, f"Resource {row['Resource']} not in DB"
 
-        # Grab the resource
-        try:
-            resource=FRBFollowUpResource.objects.get(name=row['Resource'])
-        except:
-            return 405, f"Resource {row['Resource']} not in DB"
+            keys.add((transient.id, resources[row['Resource']].id, row['mode']))
 
         # Add to FRBFollowUpRequest if not already in there
-        req = frb_utils.add_or_grab_obj(
-            FRBFollowUpRequest,
-            dict(transient=transient, resource=resource, mode=row['mode']),
-            {}, user)
-                                   
+        existing = set(FRBFollowUpRequest.objects.filter(
+            transient_id__in=[key[0] for key in keys],
+            resource_id__in=[key[1] for key in keys]).values_list(
+                'transient_id', 'resource_id', 'mode'))
+        FRBFollowUpRequest.objects.bulk_create(
+            [FRBFollowUpRequest(transient_id=transient_id, resource_id=resource_id,
+                                mode=mode, created_by=user, modified_by=user)
+             for transient_id, resource_id, mode in keys - existing])
+        affected |= set([key[0] for key in keys])
+
         # Update transient status
-        frb_status.set_status(transient)
+        frb_status.set_status_bulk(FRBTransient.objects.filter(id__in=affected))
+
+        # bulk_create skips the signals
+        frb_tables.mark_summary_dirty(affected)
 
     return 200, "All good"
     
@@ -95,6 +125,11 @@ def ingest_obslog(obslog:pandas.DataFrame, user, override:bool=False,
 
     This updates the transient status and adds to FRBFollowUpObservation
 
+    The FRBs and resources are grabbed with one query each,
+    everything is written in a single transaction (rolled back
+    on any error) and the statuses of all the affected FRBs 
+    are set in one pass at the end
+
     Args:
         obslog (pandas.DataFrame): table of observations
             -- TNS (str)
@@ -108,42 +143,43 @@ def ingest_obslog(obslog:pandas.DataFrame, user, override:bool=False,
         override (bool, optional): If True, allow several of the
             checks to be over-ridden.  
         keep_pending (bool, optional): If True, keep any
-            FRBs not provided but in the Resource in the pending list.
+            FRBs not provided but in the Resource(s) in the pending list.
             Defaults to False.
 
     Returns:
         tuple: (status, message) (int,str) 
     """
-    # Loop on rows
+    # Grab the transients and resources
+    transients = FRBTransient.objects.select_related('status').in_bulk(
+        set(obslog['TNS']), field_name='name')
+    resources = FRBFollowUpResource.objects.in_bulk(
+        set(obslog['Resource']), field_name='name')
+
+    # Check the rows
+    observations = {}
     for _, row in obslog.iterrows():
 
         # Grab the transient
-        try:
-            transient=FRBTransient.objects.get(name=row['TNS'])
-        except:
+        if row['TNS'] not in transients:
             return 401, f"FRB {row['TNS']} not in DB"
+        transient = transients[row['TNS']]
 
         # Check if the transient status is OK
-        if row['mode'] in ['imaging']:
-            if transient.status.name != 'ImagePending' and not override:
-                return 402, f"FRB {row['TNS']} not in PendingImage status" 
-        elif row['mode'] in ['longslit', 'mask']:
-            if transient.status.name != 'SpectrumPending' and not override:
-                return 403, f"FRB {row['TNS']} not in PendingSpectrum status" 
-        else:
-            return 406, f"Mode {row['mode']} not allowed"
+        code, msg = _chk_mode_status(row, transient, override,
+                                     'ImagePending', 'SpectrumPending')
+        if code != 200:
+            return code, msg
 
         # Grab the resource
-        try:
-            resource=FRBFollowUpResource.objects.get(name=row['Resource'])
-        except:
+        if row['Resource'] not in resources:
             return 405, f"Resource {row['Resource']} not in DB"
+        resource = resources[row['Resource']]
 
         # Check we are after the stop date
         if resource.valid_stop > du_timezone.now() and not keep_pending:
             return 410, "This cannot be executed until after the valid_stop date!"
 
-        # Add to FRBFollowUpObservation if not already in there
+        # Keyed on the required fields;  the last one wins
         required = dict(
             transient=transient,
             resource=resource,
@@ -153,37 +189,67 @@ def ingest_obslog(obslog:pandas.DataFrame, user, override:bool=False,
             conditions=row['Conditions'],
             texp=row['texp'],
             success=row['success'])
+        key = (transient.id, resource.id, row['mode'], required['date'])
+        observations[key] = (required, extras)
 
-        # Find any matches to the required fields
-        existing=FRBFollowUpObservation.objects.filter(**required)
-        # Delete these
-        for obj in existing:
-            obj.delete()
-                                                                                  
-        # Add to the table
-        obs = frb_utils.add_or_grab_obj(
-            FRBFollowUpObservation, required, extras, user)
+    if len(observations) == 0:
+        return 200, "All good"
 
-        # Remove this FRB from Pending`
-        any_pending = FRBFollowUpRequest.objects.filter(
-            resource=resource, transient=transient)
-        for pending in any_pending:
-            pending.delete()
+    with transaction.atomic():
+        # Find any matches to the required fields and delete these
+        FRBFollowUpObservation.objects.filter(
+            reduce(operator.or_, [Q(**required) for required, _ in 
+                                  observations.values()])).delete()
+
+        # Add to the table
+        FRBFollowUpObservation.objects.bulk_create(
+            [FRBFollowUpObservation(**required, **extras, 
+                                    created_by=user, modified_by=user)
+             for required, extras in observations.values()])
+
+        # Remove these FRBs from Pending
+        if keep_pending:
+            any_pending = FRBFollowUpRequest.objects.filter(
+                reduce(operator.or_, [Q(resource_id=key[1], transient_id=key[0]) 
+                                      for key in observations.keys()]))
+        else:
+            # And the rest in the Resource(s)
+            any_pending = FRBFollowUpRequest.objects.filter(
+                resource_id__in=[key[1] for key in observations.keys()])
+        affected = set(any_pending.values_list('transient_id', flat=True))
+        any_pending.delete()
+        affected |= set([key[0] for key in observations.keys()])
 
         # Update transient status
-        frb_status.set_status(transient)
+        frb_status.set_status_bulk(FRBTransient.objects.filter(id__in=affected))
+
+        # bulk_create skips the signals
+        frb_tables.mark_summary_dirty(affected)
+
+    return 200, "All good"
+
+def _chk_mode_status(row, transient, override:bool, 
+                     img_status:str, spec_status:str):
+    """ Check the status of a transient is valid for the observing mode
 
-    # Remove the rest in the Resource from Pending`
-    if not keep_pending:
-        all_pending = FRBFollowUpRequest.objects.filter(
-            resource=resource)
-        for pending in all_pending:
-            transient = pending.transient
-            # Delete
-            pending.delete()
-            # Update status
-            frb_status.set_status(transient)
+    Args:
+        row (pandas.Series): row of the plan or log
+        transient (FRBTransient): the FRB
+        override (bool): If True, only the mode is checked
+        img_status (str): Required status for imaging
+        spec_status (str): Required status for spectroscopy
 
+    Returns:
+        tuple: (status, message) (int,str) 
+    """
+    if row['mode'] in ['imaging']:
+        if transient.status.name != img_status and not override:
+            return 402, f"FRB {row['TNS']} not in {img_status} status" 
+    elif row['mode'] in ['longslit', 'mask']:
+        if transient.status.name != spec_status and not override:
+            return 403, f"FRB {row['TNS']} not in {spec_status} status" 
+    else:
+        return 406, f"Mode {row['mode']} not allowed"
     return 200, "All good"
     
 def ingest_z(z_tbl:pandas.DataFrame):
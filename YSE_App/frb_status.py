@@ -4,6 +4,7 @@ import numpy as np
 
 
 from YSE_App import frb_tags
+from YSE_App import frb_criteria
 
 from IPython import embed
 
@@ -56,43 +57,36 @@ all_status = [\
 
 
 
-# Add all of the chime
-def set_status(frb):
-    """ Set the status of an FRB transient 
+def status_from_criteria(criteria:dict, has_host:bool, host_z,
+                         r_too_faint:bool,
+                         image_pending:bool, image_done:bool,
+                         spectrum_pending:bool, spectrum_done:bool):
+    """ Walk the decision tree for the status of a single FRB
 
-    The frb is modified and saved
+    No DB access is performed here; all of the inputs
+    are gathered by set_status() or set_status_bulk()
 
     Args:
-        frb (FRBTransient): FRBTransient instance
+        criteria (dict): Output of frb_tags.chk_all_criteria()
+        has_host (bool): True if the FRB has a host (i.e. PATH was run)
+        host_z (float): Redshift of the host; None if not measured
+        r_too_faint (bool): True if the top candidate is too faint
+            for the public survey
+        image_pending (bool): FRB in FRBFollowUpRequest with mode='imaging'
+        image_done (bool): FRB in FRBFollowUpObservation with
+            mode='imaging' and success
+        spectrum_pending (bool): FRB in FRBFollowUpRequest with
+            mode in ['longslit','mask']
+        spectrum_done (bool): FRB in FRBFollowUpObservation with
+            mode in ['longslit','mask'] and success
+
+    Returns:
+        str: name of the status;  None if none of the tags
+            of the FRB has criteria (the status is kept)
     """
-    log_message = ''
-
-    # Hide here for circular imports
-    from YSE_App.models import TransientStatus
-    from YSE_App.models import Path
-    from YSE_App.models import FRBFollowUpObservation
-    from YSE_App.models import FRBFollowUpRequest
-
-    # Check Criteria
-    criteria, msg = frb_tags.chk_all_criteria(frb)
-    log_message += msg
-    PATH_run = False if frb.host is None else True
-
-    # Is the top candidate too faint?
-    r_too_faint = False  
-    if frb.host is not None:
-        POx_values, galaxies, _ = frb.get_Path_values()
-        argsrt = np.argsort(POx_values)
-        pri_gal = galaxies[argsrt[-1]]  # Primary galaxy
-        # Check the top candidate magnitude
-        rfilter, mag = pri_gal.FilterMagString()
-        mag = float(mag)
-        if 'Blanco' in rfilter or 'DECam' in rfilter:
-            if mag > 23.0:
-                r_too_faint = True
-        elif 'Pan-STARRS' in rfilter:
-            if mag > 21.0:
-                r_too_faint = True
+    # No criteria to apply
+    if len(criteria['sample']) == 0:
+        return None
 
     # Run in reverse order of completion
 
@@ -101,32 +95,24 @@ def set_status(frb):
     # Bright star?
     # #########################################################
     if np.all(criteria['bright_star']):
-        frb.status = TransientStatus.objects.get(name='BrightStar')
-        frb.save()
-        return
+        return 'BrightStar'
 
     # #########################################################
     # #########################################################
     # Too Dusty??
     # #########################################################
     if np.all(np.invert(criteria['bright_star']) & np.invert(criteria['EBV'])):
-        frb.status = TransientStatus.objects.get(name='TooDusty')
-        frb.save()
-        return
+        return 'TooDusty'
 
     # #########################################################
     # Run Public PATH
     # #########################################################
     if np.any(np.invert(criteria['bright_star']) & criteria['EBV'] & \
         criteria['run_public_PATH']):
-        if not PATH_run:
-            frb.status = TransientStatus.objects.get(name='RunPublicPATH')
-            frb.save()
-            return
+        if not has_host:
+            return 'RunPublicPATH'
     else: # We have chosen not to proceed with this FRB; all items that follow require PATH
-        frb.status = TransientStatus.objects.get(name='Unassigned')
-        frb.save()
-        return
+        return 'Unassigned'
 
     # #########################################################
     # Grab the sample that satisfy the criteria so far
@@ -138,83 +124,54 @@ def set_status(frb):
     # #########################################################
     # Pending Image
     # #########################################################
-    if FRBFollowUpRequest.objects.filter(
-            transient=frb,
-            mode='imaging').exists():
-        frb.status = TransientStatus.objects.get(name='ImagePending')
-        frb.save()
-        return
+    if image_pending:
+        return 'ImagePending'
 
     # #########################################################
     # Need Image
     # #########################################################
-    if (np.any(criteria['PUx'][good_idx] & np.invert(criteria['skip_need_image'])) or (
+    if (np.any(criteria['PUx'][good_idx] & np.invert(criteria['skip_need_image'][good_idx])) or (
         r_too_faint & (not np.all(criteria['skip_need_image'])))) and (
-        not FRBFollowUpRequest.objects.filter(
-            transient=frb,
-            mode='imaging').exists()) and (
-        not FRBFollowUpObservation.objects.filter(
-            transient=frb,
-            success=True,
-            mode='imaging').exists()):
-
-        frb.status = TransientStatus.objects.get(name='NeedImage')
-        frb.save()
-        return
+        not image_pending) and (not image_done):
+        return 'NeedImage'
 
     # #########################################################
     # Run deep PATH
     # #########################################################
-    if FRBFollowUpObservation.objects.filter(
-            transient=frb,
-            success=True,
-            mode='imaging').exists() and (not criteria['ran_deep_PATH'][0]):
-        frb.status = TransientStatus.objects.get(name='RunDeepPATH')
-        frb.save()
-        return
+    if image_done and (not criteria['ran_deep_PATH'][0]):
+        return 'RunDeepPATH'
 
     # #########################################################
     # Unseen host
     # #########################################################
     # In PATH table?
     if np.any(criteria['PUx'][good_idx] & criteria['ran_deep_PATH'][good_idx]):
-        frb.status = TransientStatus.objects.get(
-                        name='UnseenHost')
-        frb.save()
-        return
+        return 'UnseenHost'
 
     # #########################################################
     # Ambiguous host
     # #########################################################
     if np.all(np.invert(criteria['POx'][good_idx])):
-        frb.status = TransientStatus.objects.get(name='AmbiguousHost')
-        frb.save()
-        return
+        return 'AmbiguousHost'
 
 
     # #########################################################
     # Redshift?
     # #########################################################
     flg_need_secondary = False
-    if frb.host is not None and frb.host.redshift is not None and \
+    if has_host and host_z is not None and \
         np.any(criteria['POx'][good_idx]):  # This last query is superfluous but it is here for clarity 
 
         # We have a redshift
         if np.any(criteria['z_done'][good_idx] & criteria['z_consistent'][good_idx]):
-            frb.status = TransientStatus.objects.get(name='Redshift')
-            frb.save()
-            return
+            return 'Redshift'
 
         # Amibiguous host
         if np.any(criteria['z_done'][good_idx] & np.invert(criteria['z_consistent'][good_idx])):
-            frb.status = TransientStatus.objects.get(name='AmbiguousHost')
-            frb.save()
-            return
+            return 'AmbiguousHost'
 
         # Secondary?
         if np.any(criteria['z_primary'][good_idx]): 
-            frb.status = TransientStatus.objects.get(name='NeedSecondary')
-            frb.save()
             flg_need_secondary = True
             # Do not return yet, we want to check for spectrum next
 
@@ -222,50 +179,186 @@ def set_status(frb):
     # #########################################################
     # Too Faint?
     # #########################################################
-    if frb.host is not None and np.all(criteria['too_faint'][good_idx]):
-        frb.status = TransientStatus.objects.get(name='TooFaint')
-        frb.save()
-        return
+    if has_host and np.all(criteria['too_faint'][good_idx]):
+        return 'TooFaint'
 
     # #########################################################
     # Pending Spectrum
     # #########################################################
-    if FRBFollowUpRequest.objects.filter(
-            transient=frb,
-            mode__in=['longslit','mask']).exists():
-        frb.status = TransientStatus.objects.get(name='SpectrumPending')
-        frb.save()
-        return
+    if spectrum_pending:
+        return 'SpectrumPending'
     
     # #########################################################
     # Good Spectrum
     # #########################################################
-    if FRBFollowUpObservation.objects.filter(
-            transient=frb,
-            success=True,
-            mode__in=['longslit','mask']).exists():
-        frb.status = TransientStatus.objects.get(name='GoodSpectrum')
-        frb.save()
-        return
+    if spectrum_done:
+        return 'GoodSpectrum'
 
     # #########################################################
     # Need Secondary?
     # #########################################################
     if flg_need_secondary:
-        return
+        return 'NeedSecondary'
 
     # #########################################################
     # Need Spectrum
     # #########################################################
-    if frb.host is not None and np.any(criteria['POx'][good_idx]):
-        frb.status = TransientStatus.objects.get(name='NeedSpectrum')
-        frb.save()
-        return
+    if has_host and np.any(criteria['POx'][good_idx]):
+        return 'NeedSpectrum'
 
     # #########################################################
     # Unassigned
     # #########################################################
     # If you get to here, you are unassigned
-    frb.status = TransientStatus.objects.get(name='Unassigned')
+    return 'Unassigned'
+
+
+def chk_r_too_faint(path_data:dict):
+    """ Is the top PATH candidate too faint for the public survey?
+
+    23.0 for Blanco/DECam, 21.0 for Pan-STARRS
+
+    Args:
+        path_data (dict): PATH info for one FRB from frb_tags.grab_path_data()
+
+    Returns:
+        bool: True if too faint
+    """
+    if len(path_data['POx']) == 0:
+        return False
+    ipri = np.argsort(path_data['POx'])[-1]  # Primary galaxy
+    # Check the top candidate magnitude
+    rfilter = path_data['filter'][ipri]
+    mag = path_data['filter_mag'][ipri]
+    if mag is None:
+        return False
+    if 'Blanco' in rfilter or 'DECam' in rfilter:
+        if mag > 23.0:
+            return True
+    elif 'Pan-STARRS' in rfilter:
+        if mag > 21.0:
+            return True
+    return False
+
+
+# Add all of the chime
+def set_status(frb):
+    """ Set the status of an FRB transient 
+
+    The frb is modified and saved
+
+    Args:
+        frb (FRBTransient): FRBTransient instance
+    """
+    # Hide here for circular imports
+    from YSE_App.models import TransientStatus
+    from YSE_App.models import FRBFollowUpObservation
+    from YSE_App.models import FRBFollowUpRequest
+
+    # PATH
+    path_data = None
+    r_too_faint = False  
+    if frb.host is not None:
+        path_data = frb_tags.grab_path_data([frb])[frb.id]
+        r_too_faint = chk_r_too_faint(path_data)
+
+    # Check Criteria
+    criteria, msg = frb_tags.chk_all_criteria(frb, path_data=path_data)
+
+    # Follow-up
+    fu_req = FRBFollowUpRequest.objects.filter(transient=frb)
+    fu_obs = FRBFollowUpObservation.objects.filter(transient=frb, success=True)
+
+    status_name = status_from_criteria(
+        criteria, frb.host is not None, 
+        frb.host.redshift if frb.host is not None else None,
+        r_too_faint,
+        fu_req.filter(mode='imaging').exists(),
+        fu_obs.filter(mode='imaging').exists(),
+        fu_req.filter(mode__in=['longslit','mask']).exists(),
+        fu_obs.filter(mode__in=['longslit','mask']).exists())
+    if status_name is None:
+        return
+
+    frb.status = TransientStatus.objects.get(name=status_name)
     frb.save()
-    return
\ No newline at end of file
+    return
+
+
+def set_status_bulk(frbs, debug:bool=False):
+    """ Set the status for a set of FRB transients
+
+    All of the inputs (tags, criteria, PATH, galaxy photometry,
+    follow-up requests and observations) are grabbed
+    in a handful of queries, the criteria are evaluated 
+    with frb_tags.chk_all_criteria_bulk() and only the FRBs 
+    whose status changed are written, with a single bulk_update
+
+    Note that bulk_update does not fire the post_save signals
+    nor the auditlog
+
+    Args:
+        frbs (QuerySet of FRBTransient): FRBs to update
+        debug (bool, optional): Print the status changes. Defaults to False.
+
+    Returns:
+        dict: status name keyed by FRB name
+    """
+    # Hide here for circular imports
+    from YSE_App.models import TransientStatus
+    from YSE_App.models import FRBFollowUpObservation
+    from YSE_App.models import FRBFollowUpRequest
+    from YSE_App.models import FRBTransient
+    from YSE_App import frb_tables
+
+    frbs = list(frbs.select_related('host', 'status').prefetch_related('frb_tags'))
+    if len(frbs) == 0:
+        return {}
+    frb_ids = [frb.id for frb in frbs]
+
+    # Prefetch
+    statuses = {status.name: status for status in TransientStatus.objects.all()}
+    registry = frb_criteria.get_registry()
+    path_data = frb_tags.grab_path_data(frbs)
+
+    fu_req = set(FRBFollowUpRequest.objects.filter(
+        transient_id__in=frb_ids).values_list('transient_id', 'mode'))
+    fu_obs = set(FRBFollowUpObservation.objects.filter(
+        transient_id__in=frb_ids, success=True).values_list('transient_id', 'mode'))
+
+    # Criteria for all of the FRBs
+    cmatrix = frb_tags.chk_all_criteria_bulk(frbs, registry=registry,
+                                             path_data=path_data)
+
+    # Loop on the FRBs
+    updated, all_status = [], {}
+    for ii, frb in enumerate(frbs):
+        has_host = frb.host is not None
+        criteria, _ = frb_tags.criteria_for_frb(cmatrix, ii)
+        status_name = status_from_criteria(
+            criteria, has_host, 
+            frb.host.redshift if has_host else None,
+            chk_r_too_faint(path_data[frb.id]) if has_host else False,
+            (frb.id, 'imaging') in fu_req,
+            (frb.id, 'imaging') in fu_obs,
+            (frb.id, 'longslit') in fu_req or (frb.id, 'mask') in fu_req,
+            (frb.id, 'longslit') in fu_obs or (frb.id, 'mask') in fu_obs)
+        if status_name is None:
+            # Keep the status
+            all_status[frb.name] = frb.status.name if frb.status is not None else None
+            continue
+        all_status[frb.name] = status_name
+        # Changed?
+        if frb.status_id != statuses[status_name].id:
+            if debug:
+                print(f"{frb.name}: {frb.status.name} -> {status_name}")
+            frb.status = statuses[status_name]
+            updated.append(frb)
+
+    # Write
+    FRBTransient.objects.bulk_update(updated, ['status'], batch_size=1000)
+
+    # bulk_update skips the signals
+    frb_tables.mark_summary_dirty([frb.id for frb in updated])
+
+    return all_status
\ No newline at end of file
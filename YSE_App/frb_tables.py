@@ -1,75 +1,300 @@
+import threading
+
 import numpy as np
 import pandas 
 
-from YSE_App.models import FRBTransient
+from django.core.exceptions import FieldError
+from django.db import transaction
+
+from YSE_App.models import FRBTransient, FRBSummary
+from YSE_App import frb_export
+from YSE_App import frb_tags
 
 from IPython import embed
 
 
-def summary_table():
+# Columns of the summary table, in order
+summary_cols = ['TNS', 'ra', 'dec', 'a_err', 'b_err', 'theta', 'DM', 'DM_ISM', 
+                'event_id', 'repeater', 'mw_ebv', 'frb_survey', 'status', 
+                'Tags', 'Resources', 'Host', 'Host_mag', 'POx', 
+                'z', 'z_qual', 'z_src', 
+                'cand_POx', 'cand_gal_names', 'cand_gal_redshifts']
+
+# Element types of the list columns (for Arrow/Parquet)
+summary_list_types = dict(cand_POx=float, cand_gal_names=str,
+                          cand_gal_redshifts=float)
+
+# FRBs awaiting a refresh of their summary (per thread)
+_dirty = threading.local()
+
+
+def summary_table(columns:list=None, filters:dict=None):
     """
     Generate a summary table of FRB transients.
 
+    Served from the denormalized FRBSummary table with one SELECT.
+    Any FRBs missing from it are refreshed first.
+
+    Args:
+        columns (list, optional): Columns to return (TNS is always included).
+            Defaults to all of summary_cols
+        filters (dict, optional): Django lookups on the summary columns,
+            e.g. {'status': 'NeedImage', 'DM__gt': 500.}
+
     Returns:
         pandas.DataFrame: A DataFrame containing the summary information of FRB transients.
     """
-    # Get it started
-    all_frbs = FRBTransient.objects.all()
-    all_tns = [frb.name for frb in all_frbs]
-    frbs = pandas.DataFrame()
-    frbs['TNS'] = all_tns
-
-    # Add basic columns
-    cols = ['ra', 'dec', 'a_err', 'b_err', 'theta', 'DM', 'DM_ISM', 'event_id', 'repeater', 'mw_ebv']
-    for col in cols:
-        frbs[col] = [getattr(frb, col) for frb in all_frbs]
-
-    # Foreign keys
-    fkeys = ['frb_survey', 'status']
-    for key in fkeys:
-        frbs[key] = [str(getattr(frb, key)) for frb in all_frbs]
-
-    # Host and other Strings
-    for col, key in zip(['Tags', 'Resources', 'Host'],
-                        ['FRBTagsString', 
-                         'FRBFollowUpResourcesString',
-                         'HostString', 
-                         ]):
-        frbs[col] = [getattr(frb, key)() for frb in all_frbs]
-
-    # Host 
-    mags = [frb.host.path_mag if frb.host else np.nan for frb in all_frbs]
-    frbs['Host_mag'] = mags
-    POx = [frb.host.P_Ox if frb.host else np.nan for frb in all_frbs]
-    frbs['POx'] = POx
-
-    # Redshifts
-    z = [frb.host.redshift if frb.host else np.nan for frb in all_frbs]
-    frbs['z'] = z
-
-    z_qual = [frb.host.redshift_quality if frb.host else -1 for frb in all_frbs]
-    z_qual = [-1 if item is None else item for item in z_qual]
-    frbs['z_qual'] = z_qual
-
-    z_src = [frb.host.redshift_source if frb.host else '' for frb in all_frbs]
-    z_src = ['' if item is None else item for item in z_src]
-    frbs['z_src'] = np.array(z_src)
-
-
-    # Top two candidates
-    cand_poxs = [get_top_two_pox_gal_attr(frb,attr="P_Ox") for frb in all_frbs]
-    frbs['cand_POx'] = cand_poxs
-
-    cand_gal_names = [get_top_two_pox_gal_attr(frb,attr="name") for frb in all_frbs]
-    frbs['cand_gal_names'] = cand_gal_names
-
-    cand_gal_redshifts = [get_top_two_pox_gal_attr(frb,attr="redshift") for frb in all_frbs]
-    frbs['cand_gal_redshifts'] = cand_gal_redshifts
+    qs, columns = summary_queryset(columns=columns, filters=filters)
 
     # Return
+    frbs = pandas.DataFrame(list(qs.order_by('transient_id').values_list(*columns)),
+                            columns=columns)
     return frbs
 
 
+def summary_queryset(columns:list=None, filters:dict=None):
+    """ Validated QuerySet and columns of the summary table
+
+    Any FRBs missing from the FRBSummary table are refreshed first
+
+    Args:
+        columns (list, optional): Columns to return (TNS is always included).
+            Defaults to all of summary_cols
+        filters (dict, optional): Django lookups on the summary columns
+
+    Returns:
+        tuple: QuerySet of FRBSummary, list of the columns
+
+    Raises:
+        ValueError: Bad column or filter
+    """
+    # Catch up on any FRBs not yet summarized
+    missing = FRBTransient.objects.filter(summary__isnull=True)
+    if missing.exists():
+        refresh_summary(missing)
+
+    # Columns
+    if columns is None:
+        columns = summary_cols
+    bad = [col for col in columns if col not in summary_cols]
+    if len(bad) > 0:
+        raise ValueError(f"Bad column(s): {bad}")
+    if 'TNS' not in columns:
+        columns = ['TNS'] + list(columns)
+
+    # Filter
+    qs = FRBSummary.objects.all()
+    if filters:
+        for key in filters.keys():
+            if key.split('__')[0] not in summary_cols:
+                raise ValueError(f"Bad filter: {key}")
+        # e.g. an unknown lookup (DM__foo)
+        try:
+            qs = qs.filter(**filters)
+        except FieldError as e:
+            raise ValueError(f"Bad filter: {e}")
+
+    return qs, list(columns)
+
+
+def summary_chunks(columns:list=None, filters:dict=None, after:int=None,
+                   chunk:int=None):
+    """ The summary table in chunks of rows, for streaming
+
+    Args:
+        columns (list, optional): Columns to return. See summary_queryset()
+        filters (dict, optional): Django lookups on the summary columns
+        after (int, optional): Only FRBs with transient_id > after
+        chunk (int, optional): Rows per chunk. Defaults to frb_export.chunk_size
+
+    Returns:
+        tuple: generator of lists of dicts, list of the columns
+    """
+    qs, columns = summary_queryset(columns=columns, filters=filters)
+    chunk = frb_export.chunk_size if chunk is None else chunk
+
+    def chunks():
+        for rows in frb_export.iter_chunks(qs.values('transient_id', *columns),
+                                           key='transient_id', chunk=chunk,
+                                           after=after):
+            yield [{col: row[col] for col in columns} for row in rows]
+    return chunks(), columns
+
+
+def summary_page(columns:list=None, filters:dict=None, cursor:int=None,
+                 limit:int=1000):
+    """ One page of the summary table
+
+    Args:
+        columns (list, optional): Columns to return. See summary_queryset()
+        filters (dict, optional): Django lookups on the summary columns
+        cursor (int, optional): next_cursor of the previous page
+        limit (int, optional): Rows per page. Defaults to 1000.
+
+    Returns:
+        tuple: pandas.DataFrame of the page, next_cursor (None on the last page)
+    """
+    qs, columns = summary_queryset(columns=columns, filters=filters)
+    rows, next_cursor = frb_export.page(qs.values('transient_id', *columns),
+                                        key='transient_id', limit=limit,
+                                        after=cursor)
+    frbs = pandas.DataFrame([{col: row[col] for col in columns} for row in rows],
+                            columns=columns)
+    return frbs, next_cursor
+
+
+def summary_rows(frbs):
+    """ Build the summary values for a set of FRBs
+
+    All of the inputs are grabbed in a handful of queries
+
+    Args:
+        frbs (QuerySet of FRBTransient): FRBs to summarize
+
+    Returns:
+        list: list of dicts, one per FRB, keyed by the FRBSummary fields
+    """
+    from YSE_App.models import Path, GalaxyPhotData
+    from YSE_App.models import FRBFollowUpRequest, FRBFollowUpObservation
+
+    frbs = list(frbs.select_related('frb_survey', 'status', 'host').prefetch_related('frb_tags'))
+    frb_ids = [frb.id for frb in frbs]
+
+    # Resources
+    resources = {}
+    for model in [FRBFollowUpRequest, FRBFollowUpObservation]:
+        for frb_id, rname in model.objects.filter(transient_id__in=frb_ids).values_list(
+                'transient_id', 'resource__name'):
+            resources.setdefault(frb_id, []).append(rname)
+
+    # PATH candidates
+    path_data = frb_tags.grab_path_data([frb for frb in frbs if frb.host is not None])
+
+    # Host P(O|x) and PATH mag;  see FRBGalaxy.P_Ox and FRBGalaxy.path_mag
+    host_ids = set([frb.host_id for frb in frbs if frb.host_id is not None])
+    host_paths = {}
+    for galaxy_id, P_Ox, band_id in Path.objects.filter(
+            galaxy_id__in=host_ids).values_list('galaxy_id', 'P_Ox', 'band_id'):
+        host_paths.setdefault(galaxy_id, []).append((P_Ox, band_id))
+    host_mags = {}
+    for galaxy_id, band_id, mag in GalaxyPhotData.objects.filter(
+            photometry__galaxy_id__in=host_ids).order_by('pk').values_list(
+                'photometry__galaxy_id', 'band_id', 'mag'):
+        host_mags.setdefault((galaxy_id, band_id), mag)
+
+    rows = []
+    for frb in frbs:
+        row = dict(transient_id=frb.id, TNS=frb.name)
+        # Basic columns
+        for col in ['ra', 'dec', 'a_err', 'b_err', 'theta', 'DM', 'DM_ISM', 
+                    'event_id', 'repeater', 'mw_ebv']:
+            row[col] = getattr(frb, col)
+        # Foreign keys
+        row['frb_survey'] = str(frb.frb_survey)
+        row['status'] = str(frb.status)
+
+        # Strings
+        row['Tags'] = ','.join([tag.name for tag in frb.frb_tags.all()])
+        fu_names = resources.get(frb.id, [])
+        row['Resources'] = 'None' if len(fu_names) == 0 else ','.join(np.unique(fu_names))
+        row['Host'] = frb.host.name if frb.host else ''
+
+        # Host
+        row['Host_mag'], row['POx'] = None, None
+        row['z'], row['z_qual'], row['z_src'] = None, -1, ''
+        row['cand_POx'], row['cand_gal_names'], row['cand_gal_redshifts'] = [], [], []
+        if frb.host is not None:
+            hpaths = host_paths.get(frb.host_id, [])
+            if len(hpaths) == 1:
+                row['POx'] = hpaths[0][0]
+                row['Host_mag'] = host_mags.get((frb.host_id, hpaths[0][1]))
+            row['z'] = frb.host.redshift
+            if frb.host.redshift_quality is not None:
+                row['z_qual'] = frb.host.redshift_quality
+            if frb.host.redshift_source is not None:
+                row['z_src'] = frb.host.redshift_source
+
+            # Top two candidates
+            pdata = path_data[frb.id]
+            top_two = np.argsort(pdata['POx'])[-2:][::-1]
+            row['cand_POx'] = [float(pdata['POx'][i]) for i in top_two]
+            row['cand_gal_names'] = [pdata['galaxy'][i].name for i in top_two]
+            row['cand_gal_redshifts'] = [pdata['galaxy'][i].redshift for i in top_two]
+        rows.append(row)
+
+    return rows
+
+
+def refresh_summary(frbs):
+    """ Refresh the FRBSummary rows for a set of FRBs
+
+    Args:
+        frbs (QuerySet of FRBTransient): FRBs to refresh
+    """
+    rows = summary_rows(frbs)
+    if len(rows) == 0:
+        return
+    frb_ids = [row['transient_id'] for row in rows]
+    existing = {summ.transient_id: summ for summ in 
+                FRBSummary.objects.filter(transient_id__in=frb_ids)}
+    fields = [col for col in summary_cols]
+
+    new, modified = [], []
+    for row in rows:
+        if row['transient_id'] in existing:
+            summ = existing[row['transient_id']]
+            for key in fields:
+                setattr(summ, key, row[key])
+            modified.append(summ)
+        else:
+            new.append(FRBSummary(**row))
+
+    with transaction.atomic():
+        FRBSummary.objects.bulk_update(modified, fields, batch_size=500)
+        FRBSummary.objects.bulk_create(new, batch_size=500)
+
+
+def rebuild_summary(chunk:int=2000):
+    """ Rebuild the full FRBSummary table
+
+    Args:
+        chunk (int, optional): Number of FRBs per refresh. Defaults to 2000.
+    """
+    FRBSummary.objects.exclude(
+        transient_id__in=FRBTransient.objects.values('id')).delete()
+    frb_ids = list(FRBTransient.objects.order_by('id').values_list('id', flat=True))
+    for kk in range(0, len(frb_ids), chunk):
+        refresh_summary(FRBTransient.objects.filter(id__in=frb_ids[kk:kk+chunk]))
+
+
+def mark_summary_dirty(frb_ids):
+    """ Flag FRBs for a refresh of their summary
+
+    The refreshes are coalesced and run once the current
+    transaction commits (immediately under autocommit)
+
+    A flush is registered on every call as the callbacks of a
+    rolled back transaction are discarded;  all but the
+    first to run are no-ops
+
+    Args:
+        frb_ids (iterable): FRBTransient ids
+    """
+    if not hasattr(_dirty, 'ids'):
+        _dirty.ids = set()
+    _dirty.ids.update([frb_id for frb_id in frb_ids if frb_id is not None])
+    if len(_dirty.ids) > 0:
+        transaction.on_commit(_flush_summary)
+
+
+def _flush_summary():
+    """ Refresh all of the FRBs flagged by mark_summary_dirty() """
+    frb_ids, _dirty.ids = getattr(_dirty, 'ids', set()), set()
+    if len(frb_ids) == 0:
+        return
+    refresh_summary(FRBTransient.objects.filter(id__in=frb_ids))
+
+
 def get_gal_attr_from_qs(qs,attr="name"):
     """
     Given a QuerySet of galaxies, return a list of their attributes.
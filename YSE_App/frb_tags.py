@@ -4,8 +4,9 @@ import numpy as np
 
 from YSE_App import frb_status
 from YSE_App import frb_utils
+from YSE_App import frb_criteria
 
-def add_frb_tags(frb, tags:str, user):
+def add_frb_tags(frb, tags:str, user, set_status:bool=True):
     """
     Adds tags to a Fast Radio Burst (FRB) object and updates its status.
 
@@ -17,6 +18,8 @@ def add_frb_tags(frb, tags:str, user):
         frb: The FRB object to which tags will be added.
         tags (str): A comma-separated string of tag names to be added to the FRB.
         user: The user performing the operation, used for creating or retrieving FRBTag objects.
+        set_status (bool, optional): If False, leave the status to the caller
+            (e.g. a 'status' job of frb_jobs). Defaults to True.
 
     Returns:
         None
@@ -33,7 +36,8 @@ def add_frb_tags(frb, tags:str, user):
         frb.frb_tags.add(tag)
 
     # Set status
-    frb_status.set_status(frb)
+    if set_status:
+        frb_status.set_status(frb)
 
     # Save me!
     frb.save()
@@ -42,6 +46,8 @@ def values_from_tags(frb, key:str, tag_names:list=None, debug:bool=False):
     """ Grab a list of values for a given key from the tags
       of a given FRB
 
+    Tags without a FRBSampleCriteria are skipped
+
     Args:
         frb (FRBTransient): FRBTransient instance
         key (str): key to grab
@@ -51,209 +57,305 @@ def values_from_tags(frb, key:str, tag_names:list=None, debug:bool=False):
     Returns:
         list: list of values for the key;  can be empty
     """
-    # Hiding here to avoid circular import (I hope)
-    from YSE_App.models import FRBSampleCriteria
-
     # Prep
     if tag_names is None:
         tag_names = [frb_tag.name for frb_tag in frb.frb_tags.all()]
     if debug:
         print(f"tag_names = {tag_names} for {frb.name} and key {key}")
 
-    # Get all samples with the frb survey
-    #samples = FRBSampleCriteria.objects.filter(
-    #    frb_survey=frb.frb_survey)
+    # Grab from the registry
+    return frb_criteria.get_registry().values(key, tag_names)
 
-    # Loop through
-    values = []
-    for tag_name in tag_names:
-        sample = frb_utils.add_or_grab_obj(
-            FRBSampleCriteria, dict(name=tag_name), {})
-        if getattr(sample,key) is not None:
-            values.append(getattr(sample,key))
+def grab_path_data(frbs):
+    """ Grab the PATH information needed for the criteria
+    and status of a set of FRBs in a handful of queries
 
-    return values
+    Each entry holds lists ordered as in FRBTransient.get_Path_values()
 
-def chk_all_criteria(frb):
-    from YSE_App.models import FRBSampleCriteria
+    Args:
+        frbs (QuerySet or list): FRBTransient objects
 
-    log_message = ''
-    # Good redshift sources
-    good_z_sources = ['FFFF', 'Keck', 'Lick', 'Gemini', 'MMT']
+    Returns:
+        dict: path_data[frb.id] = dict with keys
+            POx -- np.ndarray of P(O|x) values
+            galaxy -- list of FRBGalaxy objects
+            filter, filter_mag -- FilterMagString() of each galaxy
+            path_mag -- Path.galaxy_mag of each entry (None if missing)
+    """
+    # Hiding here to avoid circular import
+    from YSE_App.models import Path, GalaxyPhotometry, GalaxyPhotData
+    from YSE_App.models.frbgalaxy_models import filter_mag_from_phot_dict
+
+    frb_ids = [frb.id for frb in frbs]
+    paths = list(Path.objects.filter(transient_id__in=frb_ids).select_related(
+        'galaxy', 'band').order_by('pk'))
+    gal_ids = set([p.galaxy_id for p in paths])
+
+    # Photometry of the candidates
+    gphots = GalaxyPhotometry.objects.filter(galaxy_id__in=gal_ids).select_related(
+        'instrument__telescope').order_by('pk')
+    gpd_by_phot = {}
+    for gpd in GalaxyPhotData.objects.filter(
+            photometry__galaxy_id__in=gal_ids).select_related('band').order_by('pk'):
+        gpd_by_phot.setdefault(gpd.photometry_id, []).append(gpd)
+
+    # Mimic FRBGalaxy.phot_dict and Path.galaxy_mag
+    phot_dicts, inst_phot = {}, {}
+    for gp in gphots:
+        pdict = phot_dicts.setdefault(gp.galaxy_id, {})
+        top_key = f'{gp.instrument.tel_instr()}'
+        pdict[top_key] = {}
+        for gpd in gpd_by_phot.get(gp.id, []):
+            pdict[top_key][gpd.band.name] = gpd.mag
+        # First photometry per instrument
+        inst_phot.setdefault((gp.galaxy_id, gp.instrument_id), gp.id)
+
+    path_data = {}
+    for frb_id in frb_ids:
+        path_data[frb_id] = dict(POx=[], galaxy=[], filter=[],
+                                 filter_mag=[], path_mag=[])
+    for p in paths:
+        pdata = path_data[p.transient_id]
+        pdata['POx'].append(p.P_Ox)
+        pdata['galaxy'].append(p.galaxy)
+        # Filter and magnitude of the galaxy
+        fm = filter_mag_from_phot_dict(phot_dicts.get(p.galaxy_id, {}))
+        pdata['filter'].append(fm[0])
+        pdata['filter_mag'].append(None if fm == 'None' else float(fm[1]))
+        # PATH magnitude
+        path_mag = None
+        if p.band is not None:
+            gp_id = inst_phot.get((p.galaxy_id, p.band.instrument_id))
+            for gpd in gpd_by_phot.get(gp_id, []):
+                if gpd.band_id == p.band_id:
+                    path_mag = gpd.mag
+                    break
+        pdata['path_mag'].append(path_mag)
+
+    for pdata in path_data.values():
+        pdata['POx'] = np.array(pdata['POx'])
+
+    return path_data
+
+
+# Good redshift sources
+good_z_sources = ['FFFF', 'Keck', 'Lick', 'Gemini', 'MMT']
+
+# Criteria held in the (N_frb, N_sample) matrices
+criteria_keys = ['bright_star', # True if the FRB has a bright star and it is to be enforced
+    'EBV', # True if the FRB has a low enough MW E(B-V)
+    'POx', # True if the FRB has a high enough P(O|x)
+    'POx_primary', # True if the primary has a high enough P(O|x)
+    'run_public_PATH', # True if we intend to run public PATH
+    'ran_deep_PATH', # True if we ran PATH on deeper imaging
+    'z_done', # True if redshift is done for this tag
+    'z_consistent', # Redshifts of two galaxies are consistent
+    'z_primary', # True if redshift of primary is done
+    'N_POx', # Number of candidates considered for P(O|x)
+    'PUx', # True if P(U|x) > max_PUx;  used for NeedImage and Unseen
+    'too_faint', # True if mag of top P(O|x) > mr_max
+    'skip_need_image', # True if skip_need_image is set
+    ]
+
+
+def good_z_source(source:str):
+    """ Is the redshift from one of our good sources?
 
-    criteria = {}
-    criteria['sample'] = []
-    criteria['bright_star'] = [] # True if the FRB has a bright star and it is to be enforced
-    criteria['EBV'] = []  # True if the FRB has a low enough MW E(B-V)
-    criteria['POx'] = []  # True if the FRB has a high enough P(O|x)
-    criteria['POx_primary'] = []  # True if the primary has a high enough P(O|x)
-    criteria['run_public_PATH'] = []  # True if we intend to run public PATH
-    criteria['ran_deep_PATH'] = []  # True if we ran PATH on deeper imaging
-    criteria['z_done'] = []  # True if redshift is done for this tag
-    criteria['z_consistent'] = []  # Redshifts of two galaxies are consistent
-    criteria['z_primary'] = []  # True if redshift of primary is done
-    criteria['N_POx'] = []
-    criteria['PUx'] = [] # True if P(U|x) > max_PUx;  used for NeedImage and Unseen
-    criteria['too_faint'] = [] # True if mag of top P(O|x) > mr_max
-    criteria['skip_need_image'] = [] # True if skip_need_image is set
-
-    # Grab the Sample object
-    for frb_tag in frb.frb_tags.all():
-        # Grab the criteria
-        sample = frb_utils.add_or_grab_obj(
-            FRBSampleCriteria, dict(name=frb_tag.name), {})
-        criteria['sample'].append(sample.name)
-
-        # Bright star?
-        if sample.apply_bright_star and frb.bright_star is not None and frb.bright_star:
-            criteria['bright_star'].append(True)
-        else:
-            criteria['bright_star'].append(False)
-
-        # Dust
-        if frb.mw_ebv < sample.max_EBV:
-            criteria['EBV'].append(True)
-        else:
-            criteria['EBV'].append(False)
-
-        # Run Public PATH?
-        criteria['run_public_PATH'].append(sample.run_public_path)
-
-        # Skip need imaging?
-        if sample.skip_need_image is not None and sample.skip_need_image:
-            criteria['skip_need_image'].append(True)
-        else:
-            criteria['skip_need_image'].append(False)
-
-        # PATH and redshift items
-        if frb.host is not None:
-            POx_values, galaxies, path_objs = frb.get_Path_values()
-            argsrt = np.argsort(POx_values)
-            pri_gal = galaxies[argsrt[-1]]  # Primary galaxy
-            primary_POx = np.max(POx_values)
-
-            # P(O|x)
-            # Primary?
-            if primary_POx > sample.min_POx:
-                criteria['POx_primary'].append(True)
-            else:
-                criteria['POx_primary'].append(False)
-            # Top two?
-            if sample.use_top_two:
-                criteria['N_POx'].append(2)
-                if frb.sum_top_two_PATH > sample.min_POx:
-                    criteria['POx'].append(True)
-                else:
-                    criteria['POx'].append(False)
-            else:
-                criteria['N_POx'].append(1)
-                criteria['POx'].append(criteria['POx_primary'][-1])
+    Args:
+        source (str): redshift_source of the galaxy
 
-            # P(U|x)
-            if sample.max_PUx is not None and frb.P_Ux > sample.max_PUx:
-                criteria['PUx'].append(True)
-            else:
-                criteria['PUx'].append(False)
+    Returns:
+        bool: True if good
+    """
+    if source is None:
+        return False
+    return np.any([gd_source in source for gd_source in good_z_sources])
 
-            # Ran deep PATH?
-            rfilter = pri_gal.FilterMagString()[0]
-            log_message += rfilter
-            if 'Blanco' in rfilter or 'DECam' in rfilter or 'Pan-STARRS' in rfilter: # Public
-                criteria['ran_deep_PATH'].append(False)
-            else:
-                criteria['ran_deep_PATH'].append(True)
 
-            # Redshift satisfied?
-            # Items to loop over
-            if criteria['POx_primary'][-1]: # Primary galaxy
-                idxs = argsrt[-1:]  # Primary is the last one
-            else:
-                if len(galaxies) > 1:
-                    idxs = argsrt[-2:]  # Top 2
-                else:
-                    idxs = argsrt[-1:]  # Only one galaxy
+def chk_all_criteria_bulk(frbs, registry=None, path_data:dict=None):
+    """ Check a population of FRBs against the criteria of every sample
 
-            # Check just the primary
-            pri_gal = galaxies[argsrt[-1]]
-            path_obj = path_objs[argsrt[-1]]
+    The PATH items are evaluated once per FRB and the sample
+    criteria once per sample;  the criteria are then broadcast
+    to (N_frb, N_sample) matrices.  Entries for samples that 
+    are not a tag of the FRB are False (0 for N_POx)
 
-            if pri_gal.redshift is None:
-                criteria['z_primary'].append(False)
-            else:
-                # Check the redshift source
-                tmp_ok = False
-                for gd_source in good_z_sources:
-                    if gd_source in pri_gal.redshift_source:
-                        tmp_ok = True
-                if tmp_ok:
-                    criteria['z_primary'].append(True)
-                else:
-                    criteria['z_primary'].append(False)
-
-            # Too faint?
-            if sample.max_mr is not None and path_obj.galaxy_mag > sample.max_mr:
-                criteria['too_faint'].append(True)
+    Args:
+        frbs (QuerySet or list): FRBTransient objects
+        registry (frb_criteria.SampleRegistry, optional): 
+            Sample criteria. If None, the cached registry is used.
+        path_data (dict, optional): PATH info as generated by 
+            grab_path_data(). If None, it is queried.
+
+    Returns:
+        dict: 
+            frb -- np.ndarray of FRB names (rows)
+            sample -- np.ndarray of sample names (columns)
+            member -- bool matrix, True if the sample is a tag of the FRB
+            rfilter -- np.ndarray of the filter of the primary candidate
+            plus one matrix per entry in criteria_keys
+    """
+    if registry is None:
+        registry = frb_criteria.get_registry()
+    if hasattr(frbs, 'prefetch_related'):
+        frbs = frbs.select_related('host').prefetch_related('frb_tags')
+    frbs = list(frbs)
+    nfrb, nsample = len(frbs), len(registry)
+    if path_data is None:
+        path_data = grab_path_data([frb for frb in frbs if frb.host is not None])
+
+    # #########################################################
+    # Per-FRB items
+    # #########################################################
+    member = np.zeros((nfrb, nsample), dtype=bool)
+    bright_star = np.zeros(nfrb, dtype=bool)
+    mw_ebv = np.full(nfrb, np.nan)
+    P_Ux = np.full(nfrb, np.nan)
+    has_path = np.zeros(nfrb, dtype=bool)
+    primary_POx = np.full(nfrb, np.nan)
+    sum_top_two = np.full(nfrb, np.nan)
+    primary_mag = np.full(nfrb, np.nan)
+    ran_deep = np.zeros(nfrb, dtype=bool)
+    z_primary = np.zeros(nfrb, dtype=bool)
+    z_done_top = np.zeros(nfrb, dtype=bool)
+    z_consistent_top = np.zeros(nfrb, dtype=bool)
+    rfilter = np.array(['']*nfrb, dtype=object)
+
+    for ii, frb in enumerate(frbs):
+        member[ii, registry.indices([frb_tag.name for frb_tag in frb.frb_tags.all()])] = True
+        bright_star[ii] = bool(frb.bright_star)
+        if frb.mw_ebv is not None:
+            mw_ebv[ii] = frb.mw_ebv
+        if frb.P_Ux is not None:
+            P_Ux[ii] = frb.P_Ux
+
+        # PATH
+        if frb.host is None or frb.id not in path_data or len(path_data[frb.id]['POx']) == 0:
+            continue
+        pdata = path_data[frb.id]
+        has_path[ii] = True
+        argsrt = np.argsort(pdata['POx'])
+        ipri = argsrt[-1]  # Primary galaxy
+        primary_POx[ii] = pdata['POx'][ipri]
+        sum_top_two[ii] = np.sum(pdata['POx'][argsrt][-2:])
+        if pdata['path_mag'][ipri] is not None:
+            primary_mag[ii] = pdata['path_mag'][ipri]
+
+        # Ran deep PATH?
+        rfilter[ii] = pdata['filter'][ipri]
+        ran_deep[ii] = not ('Blanco' in rfilter[ii] or 'DECam' in rfilter[ii] or
+                            'Pan-STARRS' in rfilter[ii]) # Public
+
+        # Redshifts
+        z_ok = [gal.redshift is not None and good_z_source(gal.redshift_source)
+                for gal in pdata['galaxy']]
+        z_primary[ii] = z_ok[ipri]
+        # Top two (or the only one)
+        z_done_top[ii] = np.all([z_ok[idx] for idx in argsrt[-2:]])
+        if z_done_top[ii]:
+            if len(argsrt) == 1:
+                z_consistent_top[ii] = True
             else:
-                criteria['too_faint'].append(False)
-            
-
-            # Loop on the info
-            has_redshift = []
-            source_ok = []
-            for ss, idx in enumerate(idxs):
-                # Grab the galaxy
-                gal = galaxies[idx]
-                # Check redshift
-                if gal.redshift is None:
-                    has_redshift.append(False)
-                else:
-                    has_redshift.append(True)
-                # Check the redshift source
-                tmp_ok = False
-                for gd_source in good_z_sources:
-                    if gd_source in gal.redshift_source:
-                        tmp_ok = True
-                source_ok.append(tmp_ok)
-
-            # Time to set the status
-            if criteria['POx_primary'][-1]: # Primary galaxy
+                z_consistent_top[ii] = np.abs(pdata['galaxy'][argsrt[-1]].redshift - 
+                                          pdata['galaxy'][argsrt[-2]].redshift) <= 0.003
+
+    # #########################################################
+    # Broadcast against the samples
+    # #########################################################
+    col = lambda arr: arr[:, None]
+    path = col(has_path)
+    with np.errstate(invalid='ignore'):
+        criteria = {}
+        criteria['bright_star'] = registry.apply_bright_star[None, :] & col(bright_star)
+        criteria['EBV'] = col(mw_ebv) < registry.max_EBV[None, :]
+        criteria['run_public_PATH'] = np.broadcast_to(
+            registry.run_public_path[None, :], (nfrb, nsample))
+        criteria['skip_need_image'] = np.broadcast_to(
+            registry.skip_need_image[None, :], (nfrb, nsample))
+
+        # P(O|x)
+        criteria['POx_primary'] = path & (col(primary_POx) > registry.min_POx[None, :])
+        criteria['POx'] = path & np.where(registry.use_top_two[None, :],
+            col(sum_top_two) > registry.min_POx[None, :], criteria['POx_primary'])
+        criteria['N_POx'] = np.where(path, 
+            np.where(registry.use_top_two[None, :], 2, 1), 0)
+
+        # P(U|x) -- nan for a missing max_PUx is False
+        criteria['PUx'] = path & (col(P_Ux) > registry.max_PUx[None, :])
+        criteria['ran_deep_PATH'] = np.broadcast_to(col(has_path & ran_deep), (nfrb, nsample))
+
+        # Redshifts
+        criteria['z_primary'] = np.broadcast_to(col(has_path & z_primary), (nfrb, nsample))
+        criteria['z_done'] = path & np.where(criteria['POx_primary'],
+            col(z_primary), col(z_done_top))
+        criteria['z_consistent'] = path & np.where(criteria['POx_primary'],
+            True, col(z_done_top & z_consistent_top))
+
+        # Too faint? -- nan for a missing max_mr is False
+        criteria['too_faint'] = path & (col(primary_mag) > registry.max_mr[None, :])
+
+    # Mask out the samples not tagged
+    for key in criteria_keys:
+        criteria[key] = np.where(member, criteria[key], 
+                                 0 if key == 'N_POx' else False)
+
+    criteria['frb'] = np.array([frb.name for frb in frbs])
+    criteria['sample'] = registry.names
+    criteria['member'] = member
+    criteria['rfilter'] = rfilter
+
+    return criteria
+
+
+def criteria_for_frb(cmatrix:dict, ii:int):
+    """ Slice the criteria of a single FRB from the 
+    output of chk_all_criteria_bulk()
+
+    Args:
+        cmatrix (dict): Output of chk_all_criteria_bulk()
+        ii (int): Row of the FRB
+
+    Returns:
+        tuple: dict of np.ndarray (one entry per tag), str log message
+    """
+    tags = cmatrix['member'][ii]
+    criteria = {}
+    criteria['sample'] = cmatrix['sample'][tags]
+    for key in criteria_keys:
+        criteria[key] = cmatrix[key][ii][tags]
+
+    # Log
+    log_message = ''
+    if criteria['N_POx'].size > 0 and criteria['N_POx'][0] > 0:
+        for pox_primary, z_done in zip(criteria['POx_primary'], criteria['z_done']):
+            log_message += cmatrix['rfilter'][ii]
+            if pox_primary:
                 log_message += "I AM A PRIMARY-"
-                # Ok?
-                if np.all(has_redshift) and np.all(source_ok):
-                    criteria['z_done'].append(True)
-                else:
-                    criteria['z_done'].append(False)
-                # Dummy True
-                criteria['z_consistent'].append(True)
-            else: # Top 2
+            else:
                 log_message += "I AM NOT A PRIMARY-"
-                # Check the redshifts are nearly the same
-                if np.all(has_redshift) and np.all(source_ok):
-                    criteria['z_done'].append(True)
+                if z_done:
                     log_message += "I AM OK-"
-                    if np.abs(galaxies[argsrt[-1]].redshift - galaxies[argsrt[-2]].redshift) > 0.003:
-                        criteria['z_consistent'].append(False)
-                    else:
-                        criteria['z_consistent'].append(True)
-                else:
-                    criteria['z_done'].append(False)
-                    criteria['z_consistent'].append(False)
-
-        else:
-            criteria['POx'].append(False)
-            criteria['POx_primary'].append(False)
-            criteria['N_POx'].append(0)
-            criteria['PUx'].append(False)
-            criteria['ran_deep_PATH'].append(False)
-            criteria['z_done'].append(False)
-            criteria['z_consistent'].append(False)
-            criteria['z_primary'].append(False)
-            criteria['too_faint'].append(False)
-
-
-    # Convert to arrays
-    for key in criteria:
-        criteria[key] = np.array(criteria[key])
-
-    # Return
-    return criteria, log_message
\ No newline at end of file
+
+    return criteria, log_message
+
+
+def chk_all_criteria(frb, registry=None, path_data:dict=None):
+    """ Check the FRB against the criteria of each of its samples (tags)
+
+    Tags without a FRBSampleCriteria are skipped
+
+    Args:
+        frb (FRBTransient): FRBTransient instance
+        registry (frb_criteria.SampleRegistry, optional): 
+            Sample criteria. If None, the cached registry is used.
+        path_data (dict, optional): PATH info for this FRB as
+            generated by grab_path_data(). If None, it is queried.
+
+    Returns:
+        tuple: dict of np.ndarray (one entry per tag), str log message
+    """
+    if path_data is not None:
+        path_data = {frb.id: path_data}
+    cmatrix = chk_all_criteria_bulk([frb], registry=registry, 
+                                    path_data=path_data)
+    return criteria_for_frb(cmatrix, 0)
@@ -4,82 +4,34 @@ from YSE_App.models import *
 
 import pandas
 
-from astroplan import Observer
-from astropy.time import Time, TimeDelta
-from astropy.coordinates import SkyCoord, EarthLocation
-from astropy import units
-
 #from YSE_App.chime import tags as chime_tags
 from YSE_App import frb_tags
+from YSE_App import frb_criteria
+from YSE_App import frb_visibility
 
 from IPython import embed
 
-def calc_airmasses(frb_fu, gd_frbs,
+def calc_airmasses(frb_fu, gd_frbs, backend:str='astroplan',
                     debug:bool=False):
     """ Calulate the minimum AM for a set of FRBs
     tied to a FRBFollowupResource
 
-    Moved this code here to speed up development.  Could be
-    a method on FRBFollowupResource someday..
+    The night-time sampling of the resource period is cached
+    by frb_visibility, as are the results for a given set of FRBs
 
     Args:
-        frb_fu (FRBFollowupResource): _description_
-        gd_frbs (QuerySet of FRBTransient): _description_
-        debug (bool, optional): _description_. Defaults to False.
+        frb_fu (FRBFollowupResource): Follow-up resource
+        gd_frbs (QuerySet of FRBTransient): FRBs
+        backend (str, optional): Ephemeris backend, 'astroplan' or 'analytic'
+            (see frb_ephem). Defaults to 'astroplan'.
+        debug (bool, optional): Print the sample times. Defaults to False.
 
     Returns:
         np.ndarray: Minimum airmass values for the input FRBs
             during the observing period
     """
-                    
-    # Grab the telescope 
-    telescope = frb_fu.instrument.telescope
-    location = EarthLocation.from_geodetic(
-        telescope.longitude*units.deg,telescope.latitude*units.deg,
-        telescope.elevation*units.m)
-    tel = Observer(location=location, timezone="UTC")
-
-    nfrb = len(gd_frbs)
-
-    # Coords
-    ras = [frbt.ra for frbt in gd_frbs]
-    decs = [frbt.dec for frbt in gd_frbs]
-    frb_coords = SkyCoord(ra=ras, dec=decs, unit='deg')
-
-    min_AM = np.array([1e9]*nfrb)
-
-    # Loop on nights
-    this_time = Time(frb_fu.valid_start)
-    end_time = Time(frb_fu.valid_stop)
-    
-    # Loop on nights
-    while(this_time < end_time):
-        night_end = tel.twilight_morning_astronomical(this_time)
-        this_obs_time = this_time.copy()
-
-
-        # Loop on 30min intervals from 
-        while(this_obs_time < min(end_time,night_end)):
-            if debug:
-                print(this_obs_time.datetime)
-
-            # Calculate AM
-            altaz = tel.altaz(this_obs_time, frb_coords)
-            airmass = 1/np.cos((90.-altaz.alt.value)*np.pi/180.)
-            # Below horizon
-            airmass[altaz.alt.value < 0] = 1e9
-
-            # Save minimum AM
-            min_AM = np.minimum(min_AM, airmass)
-
-            # Increment by 30min
-            this_obs_time = this_obs_time + TimeDelta(1800, format='sec')
-
-        # Add a day -- Added to night_end to avoid infinite while loop
-        this_time = night_end + TimeDelta(1, format='jd')
-        this_time = tel.twilight_evening_astronomical(this_time, which='previous')
-
-    return min_AM
+    return frb_visibility.min_airmasses(frb_fu, gd_frbs, backend=backend,
+                                        debug=debug)
 
 def target_table_from_frbs(frbs, mode:str):
     """ Generate a pandas table of targets from a list or QuerySet of FRBs
@@ -182,6 +134,9 @@ def grab_targets_by_mode(frb_fu, frbs, include_secondary:bool=False):
       -- Longslit: The FRB must have a host and the host must have a P_Ox > frb_fu.min_POx
       -- Mask: Not implemented yet
 
+    The P_Ox and magnitude cuts are made in the DB
+    (see FRBTransientQuerySet.with_path_stats())
+
     Args:
         frb_fu (FRBFollowupResource): Follow-up resource
         frbs (QuerySet): List of FRBTransient objects
@@ -194,43 +149,29 @@ def grab_targets_by_mode(frb_fu, frbs, include_secondary:bool=False):
     # Imaging
     if frb_fu.num_targ_img > 0:
         #imaging_frbs = frbs.filter(host__isnull=True)
-        imaging_frbs = frbs.filter(
-            status=TransientStatus.objects.get(name='NeedImage'))
+        imaging_frbs = frbs.filter(status__name='NeedImage')
     else:
         imaging_frbs = FRBTransient.objects.none()
 
 
     # Longslit
     if frb_fu.num_targ_longslit > 0:
-        longslit_frbs = frbs.filter(
-            status=TransientStatus.objects.get(name='NeedSpectrum'))
+        statuses = ['NeedSpectrum']
         if include_secondary:
-            longslit_frbs = longslit_frbs | frbs.filter(
-                status=TransientStatus.objects.get(name='NeedSecondary'))
+            statuses.append('NeedSecondary')
+        longslit_frbs = frbs.filter(status__name__in=statuses).with_path_stats()
 
         # Cut on P_Ox?
         if frb_fu.min_POx:
-            gd_ids = []
-            for frb in longslit_frbs:
-                if frb.host.P_Ox is not None and frb.host.P_Ox > frb_fu.min_POx:
-                    gd_ids.append(frb.id)
-            longslit_frbs = longslit_frbs.filter(id__in=gd_ids)
+            longslit_frbs = longslit_frbs.filter(host_POx__gt=frb_fu.min_POx)
 
         # Cut on magnitude? -- bright
         if frb_fu.min_mag:
-            gd_ids = []
-            for frb in longslit_frbs:
-                if frb.host.path_mag is not None and frb.host.path_mag > frb_fu.min_mag:
-                    gd_ids.append(frb.id)
-            longslit_frbs = longslit_frbs.filter(id__in=gd_ids)
+            longslit_frbs = longslit_frbs.filter(host_path_mag__gt=frb_fu.min_mag)
 
         # Cut on magnitude? -- faint
         if frb_fu.max_mag:
-            gd_ids = []
-            for frb in longslit_frbs:
-                if frb.host.path_mag is not None and frb.host.path_mag < frb_fu.max_mag:
-                    gd_ids.append(frb.id)
-            longslit_frbs = longslit_frbs.filter(id__in=gd_ids)
+            longslit_frbs = longslit_frbs.filter(host_path_mag__lt=frb_fu.max_mag)
     else:
         longslit_frbs = FRBTransient.objects.none()
 
@@ -246,16 +187,43 @@ def grab_targets_by_mode(frb_fu, frbs, include_secondary:bool=False):
     # Return
     return targets_by_mode
 
-def select_with_priority(frb_fu, frbs_by_mode:dict):
+def weighted_sample(probs, num_targ:int, rng=None):
+    """ Draw num_targ items without replacement, weighted by probs
+
+    Single pass with the Efraimidis-Spirakis keys, log(u)/p.
+    Items with zero probability are never drawn so fewer than 
+    num_targ may be returned
+
+    Args:
+        probs (list or np.ndarray): Probabilities (weights)
+        num_targ (int): Number to draw
+        rng (np.random.Generator, optional): Random generator
+
+    Returns:
+        np.ndarray: indices of the drawn items
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    probs = np.asarray(probs, dtype=float)
+    rand = rng.uniform(0., 1., size=len(probs))
+    with np.errstate(divide='ignore'):
+        keys = np.where(probs > 0., np.log(rand) / probs, -np.inf)
+    srt = np.argsort(keys)[::-1][:num_targ]
+    return srt[np.isfinite(keys[srt])]
+
+def select_with_priority(frb_fu, frbs_by_mode:dict, seed:int=None):
     """ Select targets from the total set by priority
 
     Args:
         frb_fu (FRBFollowupResource): Follow-up resource
         frbs_by_mode (dict): Dictionary of QuerySets for each observing mode
+        seed (int, optional): Seed for the random draws; set for 
+            a reproducible selection. Defaults to None.
 
     Returns:
         dict: final dictionary of selected QuerySets for each observing mode
     """
+    rng = np.random.default_rng(seed)
 
     # Final product
     selected_frbs = {}
@@ -267,33 +235,16 @@ def select_with_priority(frb_fu, frbs_by_mode:dict):
         # Do we want any?
         if num_targ > 0:
             # Do we not have enough?
-            if num_targ >= len(frbs_by_mode[mode]):
+            if num_targ >= frbs_by_mode[mode].count():
                 selected_frbs[mode] = frbs_by_mode[mode]
             else:    
                 # Assign priorities
-                probs = assign_probs(frbs_by_mode[mode], mode)
-
-                # Init
-                keep = []
-                still_left = np.arange(len(frbs_by_mode[mode])).tolist()
-
-                # Loop until we have enough
-                while(len(keep) < num_targ):
-                    need = num_targ - len(keep)
-                    # Random numbers
-                    rand = np.random.uniform(0.,1.,size=len(still_left))
-                    left_probs = np.array(probs)[still_left]
-                    gd = np.where(rand < left_probs)[0]
-                    if len(gd) > need:
-                        gd = gd[:need]
-                    # List me
-                    new_keep = list(np.array(still_left)[gd])
-                    keep += new_keep
-                    # Remove
-                    for idx in new_keep:
-                        still_left.remove(idx)
-                # Finish
-                gd_ids = [frbs_by_mode[mode].all()[int(ii)].id for ii in keep]
+                frbs = list(frbs_by_mode[mode].order_by('id'))
+                probs = assign_probs(frbs, mode)
+
+                # Draw
+                keep = weighted_sample(probs, num_targ, rng=rng)
+                gd_ids = [frbs[ii].id for ii in keep]
                 selected_frbs[mode] = frbs_by_mode[mode].filter(id__in=gd_ids)
         else:
             # We don't want any
@@ -307,8 +258,9 @@ def assign_probs(frbs, mode:str):
     """
     Assigns probabilities to a list of Fast Radio Bursts (FRBs) based on their associated tags.
 
-    This function iterates through all FRBs and calculates the maximum probability 
-    associated with their tags by comparing them against a predefined set of samples.
+    The criteria of all the FRBs are evaluated at once with
+    frb_tags.chk_all_criteria_bulk() and the probability is the 
+    maximum weight of the tags that satisfy the criteria for the mode.
 
     Args:
         frbs (QuerySet): A QuerySet containing FRB objects. Each FRB object is expected 
@@ -318,15 +270,24 @@ def assign_probs(frbs, mode:str):
 
     Returns:
         list: A list of probabilities, where each probability corresponds to an FRB 
-              in the input QuerySet. If no matching tags are found for an FRB, a 
-              default probability of 0.1 is assigned.
+              in the input QuerySet. If no tags satisfy the criteria for an FRB,
+              0. is assigned;  otherwise the minimum is 0.1
     """
-    probs = []
-    for frb in frbs.all():
-        prob = assign_prob(frb, mode=mode)
-        probs.append(prob)
+    registry = frb_criteria.get_registry()
+    cmatrix = frb_tags.chk_all_criteria_bulk(frbs, registry=registry)
+
+    # Which tags are good?
+    good = cmatrix['member'] & np.invert(cmatrix['bright_star']) & cmatrix['EBV']
+    if mode != 'imaging':
+        good &= cmatrix['POx']
+
+    # Grab the weights
+    weights = np.where(good, registry.weight[None, :], -np.inf)
+    max_weight = np.max(weights, axis=1, initial=-np.inf)
+    probs = np.where(np.any(good, axis=1), np.maximum(0.1, max_weight), 0.)
+
     # Return
-    return probs
+    return probs.tolist()
 
 def assign_prob(frb, mode:str):
     """ Assign a probability to a single FRB based on its tags
@@ -338,25 +299,4 @@ def assign_prob(frb, mode:str):
     Returns:
         float: Probability of the FRB being selected for the given mode
     """
-    # Criteria
-    criteria, _ = frb_tags.chk_all_criteria(frb)
-    # Which tags are good?
-    good = np.invert(criteria['bright_star']) & criteria['EBV'] 
-    good_idx = np.where(good)[0]
-    if mode == 'imaging':
-        good_tags = criteria['sample'][good_idx]
-    else:
-        good_POx = criteria['POx'][good_idx]
-        if np.any(good_POx):
-            good_tags = criteria['sample'][good_idx][good_POx]
-        else:
-            good_tags = []
-
-    # Grab the weights
-    if len(good_tags) == 0:
-        return 0.
-    else:
-        weights = frb_tags.values_from_tags(frb, 'weight', 
-                                        tag_names=good_tags)
-    # Return 
-    return max(0.1, np.max(weights))
\ No newline at end of file
+    return assign_probs([frb], mode)[0]
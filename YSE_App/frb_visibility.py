@@ -0,0 +1,268 @@
+""" Visibility engine for FRB targeting
+
+For a FRBFollowUpResource, the night-time sampling of its run window
+(every 30min between astronomical twilights) and the local sidereal
+time at each sample are computed once and cached.  The minimum airmass
+of any set of FRBs is then one broadcast numpy calculation of the
+altitude from the hour angle.
+
+Two backends are offered for the twilights, sidereal time and
+precession:  'astroplan' (astroplan/astropy) and 'analytic'
+(the closed-form formulae of frb_ephem.py).  They agree to
+better than 0.01 in airmass (see chime/chime_test_ephem.py)
+
+The caches are keyed by the resource, its run window, the telescope
+location and the backend and are dropped when a resource is saved
+or deleted (see frbfollowup_models.py)
+"""
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+from astropy.time import Time, TimeDelta
+from astropy.coordinates import SkyCoord, EarthLocation, FK5
+from astropy import units
+
+from YSE_App import frb_ephem
+
+# Sampling of the nights
+step_sec = 1800.
+# Airmass flag for below the horizon
+below_horizon = 1e9
+# Maximum number of entries in each cache
+max_cache = 64
+# Number of FRBs per chunk of the broadcast
+chunk = 2000
+# Ephemeris backends
+backends = ['astroplan', 'analytic']
+
+_grids = OrderedDict()
+_min_AMs = OrderedDict()
+_lock = threading.Lock()
+
+
+class VisibilityGrid:
+    """ Night-time sampling of an observing run at one telescope
+
+    Attributes:
+        jd (np.ndarray): Julian dates of the samples
+        lst (np.ndarray): Local mean sidereal time of the samples [rad]
+        lat (float): Latitude of the telescope [rad]
+        equinox (Time): Equinox for the FRB coordinates
+    """
+
+    def __init__(self, longitude:float, latitude:float, elevation:float,
+                 valid_start, valid_stop, backend:str='astroplan',
+                 debug:bool=False):
+        """
+        Args:
+            longitude (float): Telescope longitude [deg]
+            latitude (float): Telescope latitude [deg]
+            elevation (float): Telescope elevation [m]
+            valid_start (datetime): Start of the run (UT)
+            valid_stop (datetime): End of the run (UT)
+            backend (str, optional): Ephemeris backend, 'astroplan' or
+                'analytic'. Defaults to 'astroplan'.
+            debug (bool, optional): Print the sample times. Defaults to False.
+        """
+        if backend not in backends:
+            raise IOError(f"Bad ephemeris backend: {backend}")
+        self.backend = backend
+
+        start_jd = Time(valid_start).jd
+        end_jd = Time(valid_stop).jd
+
+        if backend == 'astroplan':
+            from astroplan import Observer
+            location = EarthLocation.from_geodetic(
+                longitude*units.deg, latitude*units.deg, elevation*units.m)
+            tel = Observer(location=location, timezone="UTC")
+            morning = lambda jd: tel.twilight_morning_astronomical(
+                Time(jd, format='jd')).jd
+            evening = lambda jd: tel.twilight_evening_astronomical(
+                Time(jd, format='jd'), which='previous').jd
+        else:
+            rising, setting = frb_ephem.twilights(
+                start_jd-1.5, end_jd+2.5, longitude, latitude)
+            morning = lambda jd: rising[np.argmin(np.abs(rising-jd))]
+            evening = lambda jd: np.max(setting[setting < jd])
+
+        if backend == 'analytic' and (len(rising) == 0 or len(setting) == 0):
+            # No twilights (polar day or night);  keep the dark samples
+            jds = np.arange(start_jd, end_jd, step_sec/86400.)
+            times = list(jds[frb_ephem.sun_altitude(
+                jds, longitude, latitude) < frb_ephem.twilight_alt])
+        else:
+            times = self._sample_nights(start_jd, end_jd, morning, evening,
+                                        debug=debug)
+
+        self.jd = np.array(times)
+        self.lat = np.deg2rad(latitude)
+        self.equinox = Time(0.5*(start_jd + end_jd), format='jd')
+        if len(self.jd) == 0:
+            self.lst = np.zeros(0)
+        elif backend == 'astroplan':
+            self.lst = Time(self.jd, format='jd').sidereal_time(
+                'mean', longitude=longitude*units.deg).rad
+        else:
+            self.lst = frb_ephem.lst(self.jd, longitude)
+
+    @staticmethod
+    def _sample_nights(start_jd:float, end_jd:float, morning, evening,
+                       debug:bool=False):
+        """ Sample the nights every 30min
+
+        Args:
+            start_jd (float): Start of the run
+            end_jd (float): End of the run
+            morning (callable): Nearest morning twilight to a JD
+            evening (callable): Previous evening twilight to a JD
+            debug (bool, optional): Print the sample times. Defaults to False.
+
+        Returns:
+            list: Julian dates of the samples
+        """
+        times = []
+        step = step_sec / 86400.
+        this_jd = start_jd
+        while(this_jd < end_jd):
+            night_end = morning(this_jd)
+            this_obs_jd = this_jd
+            # Loop on 30min intervals
+            while(this_obs_jd < min(end_jd, night_end)):
+                if debug:
+                    print(Time(this_obs_jd, format='jd').datetime)
+                times.append(this_obs_jd)
+                this_obs_jd += step
+            # Add a day -- Added to night_end to avoid infinite while loop
+            this_jd = evening(night_end + 1.)
+        return times
+
+    def precess(self, ras, decs):
+        """ Precess J2000 coordinates to the equinox of the run
+
+        Args:
+            ras (np.ndarray): RA [deg]
+            decs (np.ndarray): Dec [deg]
+
+        Returns:
+            tuple: RA, Dec [rad]
+        """
+        if self.backend == 'analytic':
+            return frb_ephem.precess(ras, decs, self.equinox.jd)
+        coords = SkyCoord(ra=ras, dec=decs, unit='deg').transform_to(
+            FK5(equinox=self.equinox))
+        return coords.ra.rad, coords.dec.rad
+
+    def min_airmass(self, ras, decs):
+        """ Minimum airmass of each target over the grid
+
+        Args:
+            ras (np.ndarray): RA [deg]
+            decs (np.ndarray): Dec [deg]
+
+        Returns:
+            np.ndarray: Minimum airmass;  1e9 if never above the horizon
+        """
+        ras, decs = np.atleast_1d(ras), np.atleast_1d(decs)
+        min_AM = np.full(len(ras), below_horizon)
+        if len(ras) == 0 or len(self.jd) == 0:
+            return min_AM
+        ra, dec = self.precess(ras, decs)
+
+        sin_lat, cos_lat = np.sin(self.lat), np.cos(self.lat)
+        for kk in range(0, len(ra), chunk):
+            sl = slice(kk, kk+chunk)
+            # Hour angle -- (N_frb, N_time)
+            ha = self.lst[None, :] - ra[sl, None]
+            sin_alt = np.sin(dec[sl, None])*sin_lat + \
+                np.cos(dec[sl, None])*cos_lat*np.cos(ha)
+            # Highest point is the minimum airmass
+            max_sin_alt = np.max(sin_alt, axis=1)
+            with np.errstate(divide='ignore'):
+                min_AM[sl] = np.where(max_sin_alt > 0., 1./max_sin_alt, below_horizon)
+        return min_AM
+
+
+def _resource_key(frb_fu, backend:str):
+    telescope = frb_fu.instrument.telescope
+    return (frb_fu.id, frb_fu.valid_start, frb_fu.valid_stop,
+            telescope.longitude, telescope.latitude, telescope.elevation,
+            backend)
+
+def _cache_put(cache:OrderedDict, key, value):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_cache:
+            cache.popitem(last=False)
+
+
+def get_grid(frb_fu, backend:str='astroplan', debug:bool=False):
+    """ Grab the VisibilityGrid of a FRBFollowUpResource,
+    building it if needed
+
+    Args:
+        frb_fu (FRBFollowUpResource): Follow-up resource
+        backend (str, optional): Ephemeris backend. Defaults to 'astroplan'.
+        debug (bool, optional): Print the sample times. Defaults to False.
+
+    Returns:
+        VisibilityGrid: the grid
+    """
+    key = _resource_key(frb_fu, backend)
+    grid = _grids.get(key)
+    if grid is None:
+        telescope = frb_fu.instrument.telescope
+        grid = VisibilityGrid(telescope.longitude, telescope.latitude,
+                              telescope.elevation,
+                              frb_fu.valid_start, frb_fu.valid_stop,
+                              backend=backend, debug=debug)
+        _cache_put(_grids, key, grid)
+    return grid
+
+
+def min_airmasses(frb_fu, frbs, backend:str='astroplan', debug:bool=False):
+    """ Minimum airmass of a set of FRBs during the
+    run of a FRBFollowUpResource
+
+    Args:
+        frb_fu (FRBFollowUpResource): Follow-up resource
+        frbs (QuerySet or list of FRBTransient): FRBs
+        backend (str, optional): Ephemeris backend. Defaults to 'astroplan'.
+        debug (bool, optional): Print the sample times. Defaults to False.
+
+    Returns:
+        np.ndarray: Minimum airmass values for the input FRBs
+            during the observing period
+    """
+    if hasattr(frbs, 'values_list'):
+        rows = list(frbs.values_list('id', 'ra', 'dec'))
+    else:
+        rows = [(frb.id, frb.ra, frb.dec) for frb in frbs]
+    key = (_resource_key(frb_fu, backend), tuple(rows))
+
+    min_AM = _min_AMs.get(key)
+    if min_AM is None:
+        grid = get_grid(frb_fu, backend=backend, debug=debug)
+        min_AM = grid.min_airmass(np.array([row[1] for row in rows], dtype=float),
+                                  np.array([row[2] for row in rows], dtype=float))
+        _cache_put(_min_AMs, key, min_AM)
+    return min_AM.copy()
+
+
+def invalidate(resource_id:int=None):
+    """ Drop the cached grids and airmasses
+
+    Args:
+        resource_id (int, optional): Only drop those of this
+            FRBFollowUpResource. Defaults to None (all).
+    """
+    with _lock:
+        for cache, getid in [(_grids, lambda key: key[0]),
+                             (_min_AMs, lambda key: key[0][0])]:
+            for key in list(cache.keys()):
+                if resource_id is None or getid(key) == resource_id:
+                    del cache[key]
@@ -6,7 +6,10 @@ import datetime
 
 from astropy.coordinates import SkyCoord
 
+from django.db.models import Q
+
 from YSE_App.common.utilities import getGalaxyname
+from YSE_App.common import healpix
 from YSE_App.models import FRBGalaxy, GalaxyPhotData 
 from YSE_App.models import GalaxyPhotometry, PhotometricBand
 from YSE_App.models import FRBTransient, Path
@@ -28,6 +31,47 @@ chime_priors['PU'] = 0.2
 chime_priors['survey'] = 'Pan-STARRS'
 chime_priors['scale'] = 0.5
 
+# Candidates within this radius of an existing galaxy are that
+# galaxy, whatever their name [deg]
+galaxy_match_radius = 0.5/3600
+
+def match_galaxies(cands:dict, radius:float=galaxy_match_radius):
+    """ Existing FRBGalaxy of each PATH candidate
+
+    By name, then by position:  the names are built from the
+    coordinates (getGalaxyname()), so a candidate whose position
+    moved slightly (e.g. another catalog) gets a new name.  The
+    positions are matched in one query on the HEALPix index.
+
+    Args:
+        cands (dict): (ra, dec) [deg] of each candidate, by name
+        radius (float, optional): match radius [deg]
+
+    Returns:
+        dict: FRBGalaxy of the matched candidates, by name
+    """
+    galaxies = FRBGalaxy.objects.in_bulk(list(cands.keys()), field_name='name')
+    unmatched = [name for name in cands if name not in galaxies]
+    if len(unmatched) == 0:
+        return galaxies
+
+    q = Q()
+    for name in unmatched:
+        q |= healpix.cone_q(cands[name][0], cands[name][1], radius)
+    nearby = list(FRBGalaxy.objects.filter(q).order_by('pk'))
+    if len(nearby) == 0:
+        return galaxies
+    gras = np.array([galaxy.ra for galaxy in nearby])
+    gdecs = np.array([galaxy.dec for galaxy in nearby])
+    # One instance per galaxy
+    by_id = {galaxy.id: galaxy for galaxy in galaxies.values()}
+    nearby = [by_id.get(galaxy.id, galaxy) for galaxy in nearby]
+    for name in unmatched:
+        seps = healpix.separation(cands[name][0], cands[name][1], gras, gdecs)
+        if np.min(seps) <= radius:
+            galaxies[name] = nearby[int(np.argmin(seps))]
+    return galaxies
+
 def ingest_path_results(itransient:FRBTransient,
                         candidates:pandas.DataFrame,
                         Filter:str,
@@ -80,9 +124,11 @@ def ingest_path_results(itransient:FRBTransient,
         print(f"ss: {ss}, ra: {icand.ra}, dec: {icand.dec}")
         # Add or grab the host candidates
         name = getGalaxyname(icand.ra, icand.dec)
-        galaxy = frb_utils.add_or_grab_obj(
-            FRBGalaxy, dict(name=name), dict(ra=icand.ra, dec=icand.dec, 
-                       ang_size=icand.ang_size), user=user)
+        galaxy = match_galaxies({name: (icand.ra, icand.dec)}).get(name)
+        if galaxy is None:
+            galaxy = frb_utils.add_or_grab_obj(
+                FRBGalaxy, dict(name=name), dict(ra=icand.ra, dec=icand.dec, 
+                           ang_size=icand.ang_size), user=user)
 
         # Add redshifts (these need not exist)
         if hasattr(icand, 'redshift_type') and icand.redshift_type == 'spectro-z':
@@ -167,30 +213,269 @@ def delete_path_entries(itransient):
     Deletes path entries associated with a given transient and performs cleanup 
     of related galaxy and candidate data.
 
+    See delete_path_entries_bulk()
+
     Args:
         itransient (FRBTransient): The transient object whose path entries 
                                    are to be deleted.
+    """
+    delete_path_entries_bulk([itransient])
+
+
+def delete_path_entries_bulk(itransients):
+    """
+    Deletes the path entries of a set of transients and the candidate
+    galaxies no longer tied to any transient, in a handful of queries
 
     Functionality:
-        1. Iterates through all Path objects linked to the given transient.
-        2. For each path:
-           - Retrieves the associated galaxy.
-           - Removes the galaxy from the transient's candidates.
-           - Checks if the galaxy is a candidate for any other transient.
-           - Deletes the galaxy if it is not associated with any other transient, 
-             including its photometry data.
-           - Deletes the path entry from the Path table.
+        1. Removes the galaxies of the Path entries from the 
+           candidates of the transients.
+        2. Deletes the Path entries.
+        3. Deletes the galaxies that are not a candidate of any other 
+           transient (one reverse-membership query), including their
+           photometry data.
+
+    Args:
+        itransients (list or QuerySet): FRBTransient objects
+
+    Returns:
+        int: Number of galaxies deleted
     """
-    for p in Path.objects.filter(transient=itransient):
-        galaxy = FRBGalaxy.objects.get(name=p.galaxy.name)
-        # Remove candidate
-        itransient.candidates.remove(galaxy)
-        # Remove galaxy altogether (likely)?
-        delete_galaxy = True
-        for t in FRBTransient.objects.all():
-            if galaxy in t.candidates.all():
-                delete_galaxy = False
-        if delete_galaxy:  # This also deletes the photometry
-            galaxy.delete()
-        # Delete from PATH table
-        p.delete()
\ No newline at end of file
+    from YSE_App import frb_tables
+
+    frb_ids = [itransient.id for itransient in itransients]
+    paths = Path.objects.filter(transient_id__in=frb_ids)
+    gal_ids = set(paths.values_list('galaxy_id', flat=True))
+
+    # Remove candidates
+    Through = FRBTransient.candidates.through
+    Through.objects.filter(frbtransient_id__in=frb_ids,
+                           frbgalaxy_id__in=gal_ids).delete()
+    # Delete from PATH table
+    paths.delete()
+
+    # Remove galaxies altogether (likely)?
+    still_candidates = set(Through.objects.filter(
+        frbgalaxy_id__in=gal_ids).values_list('frbgalaxy_id', flat=True))
+    orphans = gal_ids - still_candidates
+    if len(orphans) > 0:  # This also deletes the photometry
+        FRBGalaxy.objects.filter(id__in=orphans).delete()
+
+    # The candidate links skip the signals
+    frb_tables.mark_summary_dirty(frb_ids)
+
+    return len(orphans)
+
+
+def sweep_orphan_galaxies(dry_run:bool=False):
+    """ Remove the FRBGalaxy entries not referenced by any
+    FRBTransient (as host, candidate or in the Path table)
+    and the GalaxyPhotometry entries without any GalaxyPhotData
+
+    Args:
+        dry_run (bool, optional): If True, only count them. 
+            Defaults to False.
+
+    Returns:
+        tuple: Number of FRBGalaxy, GalaxyPhotometry entries (to be) removed
+    """
+    orphan_gals = FRBGalaxy.objects.filter(
+        frb__isnull=True, frb_candidates__isnull=True, 
+        path__isnull=True).values_list('id', flat=True).distinct()
+    orphan_gps = GalaxyPhotometry.objects.filter(
+        galaxyphotdata__isnull=True).values_list('id', flat=True).distinct()
+
+    gal_ids = list(orphan_gals)
+    # Photometry of these galaxies goes with them
+    gp_ids = list(GalaxyPhotometry.objects.filter(id__in=list(orphan_gps)).exclude(
+        galaxy_id__in=gal_ids).values_list('id', flat=True))
+
+    if not dry_run:
+        FRBGalaxy.objects.filter(id__in=gal_ids).delete()
+        GalaxyPhotometry.objects.filter(id__in=gp_ids).delete()
+
+    return len(gal_ids), len(gp_ids)
+
+
+def ingest_path_results_bulk(entries:list, user, remove_previous:bool=True,
+                             set_status:bool=True):
+    """ Ingest the PATH results of many FRBs in one transaction
+
+    Same as ingest_path_results() for each entry but the lookups
+    (instrument, band, obs group) are resolved once, the galaxies, 
+    photometry and Path rows are written with bulk_create/bulk_update
+    and the statuses are set in a single pass at the end
+
+    Args:
+        entries (list): list of dict, one per FRB, with keys
+            transient (FRBTransient), candidates (pandas.DataFrame),
+            Filter, inst_name, obs_group, P_Ux and optionally
+            telescope_name, bright_star, new_tags (comma separated)
+        user (django user object): user 
+        remove_previous (bool, optional): If True, remove any previous
+            entries related to PATH from the DB. Defaults to True.
+        set_status (bool, optional): If False, skip the status pass
+            (e.g. it is run as a job). Defaults to True.
+
+    Returns:
+        int: Number of Path entries added
+    """
+    from django.db import transaction
+    from YSE_App.models import FRBTag
+    from YSE_App import frb_tables
+
+    if user is None or not user.is_authenticated:
+        raise ValueError("User must be authenticated to ingest PATH results")
+    now = datetime.datetime.now()
+    transients = [entry['transient'] for entry in entries]
+
+    # Lookups, once each
+    instruments, obs_groups, bands = {}, {}, {}
+    for entry in entries:
+        ikey = (entry['inst_name'], entry.get('telescope_name'))
+        if ikey not in instruments:
+            idict = dict(name=entry['inst_name'])
+            if entry.get('telescope_name') is not None:
+                idict['telescope'] = Telescope.objects.get(name=entry['telescope_name'])
+            instruments[ikey] = Instrument.objects.get(**idict)
+        if entry['obs_group'] not in obs_groups:
+            obs_groups[entry['obs_group']] = ObservationGroup.objects.get(
+                name=entry['obs_group'])
+        bkey = (instruments[ikey].id, entry['Filter'])
+        if bkey not in bands:
+            bands[bkey] = PhotometricBand.objects.filter(
+                instrument=instruments[ikey]).get(name=entry['Filter'])
+        entry['_instrument'] = instruments[ikey]
+        entry['_band'] = bands[bkey]
+
+    # Candidates, by galaxy name
+    for entry in entries:
+        entry['_names'] = [getGalaxyname(ra, dec) for ra, dec in 
+                           zip(entry['candidates'].ra, entry['candidates'].dec)]
+
+    with transaction.atomic():
+        # Remove previous
+        if remove_previous:
+            delete_path_entries_bulk(transients)
+
+        # Galaxies
+        gal_rows = {}
+        for entry in entries:
+            for name, (_, icand) in zip(entry['_names'], entry['candidates'].iterrows()):
+                gal_rows[name] = icand
+        galaxies = match_galaxies({name: (icand.ra, icand.dec) 
+                                   for name, icand in gal_rows.items()})
+        new_gals = [FRBGalaxy(name=name, ra=icand.ra, dec=icand.dec,
+                              ang_size=icand.ang_size, 
+                              created_by=user, modified_by=user)
+                    for name, icand in gal_rows.items() if name not in galaxies]
+        healpix.assign(new_gals)
+        FRBGalaxy.objects.bulk_create(new_gals)
+        galaxies.update(FRBGalaxy.objects.in_bulk(
+            [galaxy.name for galaxy in new_gals], field_name='name'))
+
+        # Redshifts (these need not exist)
+        for name, icand in gal_rows.items():
+            galaxy = galaxies[name]
+            if hasattr(icand, 'redshift_type') and icand.redshift_type == 'spectro-z':
+                galaxy.redshift = icand.redshift
+                galaxy.redshift_err = icand.redshift_err
+                galaxy.redshift_source = icand.redshift_source
+                galaxy.redshift_quality = 1
+            elif hasattr(icand, 'z_phot_median'):
+                galaxy.photoz = icand.z_phot_median
+        # Two candidates may match one galaxy
+        unique_gals = {galaxy.id: galaxy for galaxy in galaxies.values()}
+        FRBGalaxy.objects.bulk_update(
+            list(unique_gals.values()), 
+            ['redshift', 'redshift_err', 'redshift_source', 'redshift_quality', 'photoz'])
+        gal_ids = list(unique_gals.keys())
+
+        # Photometry
+        def grab_gps():
+            return {(gp.galaxy_id, gp.instrument_id, gp.obs_group_id): gp for gp in
+                    GalaxyPhotometry.objects.filter(galaxy_id__in=gal_ids)}
+        gps = grab_gps()
+        new_gps = {}
+        for entry in entries:
+            for name in entry['_names']:
+                key = (galaxies[name].id, entry['_instrument'].id, 
+                       obs_groups[entry['obs_group']].id)
+                if key not in gps and key not in new_gps:
+                    new_gps[key] = GalaxyPhotometry(
+                        galaxy_id=key[0], instrument_id=key[1], obs_group_id=key[2],
+                        created_by=user, modified_by=user)
+        GalaxyPhotometry.objects.bulk_create(list(new_gps.values()))
+        gps = grab_gps()
+
+        gpds = {(gpd.photometry_id, gpd.band_id): gpd for gpd in
+                GalaxyPhotData.objects.filter(photometry__galaxy_id__in=gal_ids)}
+        new_gpds, upd_gpds = {}, {}
+        links, paths = [], {}
+        for entry in entries:
+            band = entry['_band']
+            for name, (_, icand) in zip(entry['_names'], entry['candidates'].iterrows()):
+                galaxy = galaxies[name]
+                gp = gps[(galaxy.id, entry['_instrument'].id, 
+                          obs_groups[entry['obs_group']].id)]
+                key = (gp.id, band.id)
+                # Update photometry (in case we are re-running and updating photometry)
+                if key in gpds:
+                    gpds[key].mag = icand.mag
+                    upd_gpds[key] = gpds[key]
+                else:
+                    new_gpds[key] = GalaxyPhotData(
+                        photometry=gp, band=band, mag=icand.mag, obs_date=now,
+                        created_by=user, modified_by=user)
+                # Candidates and PATH
+                links.append((entry['transient'].id, galaxy.id))
+                # Two candidates may match one galaxy;  keep the highest P_Ox
+                pkey = (entry['transient'].id, galaxy.id)
+                if pkey in paths and paths[pkey].P_Ox >= icand.P_Ox:
+                    continue
+                paths[pkey] = Path(transient=entry['transient'], galaxy=galaxy,
+                                   P_Ox=icand.P_Ox, band=band,
+                                   created_by=user, modified_by=user)
+        GalaxyPhotData.objects.bulk_create(list(new_gpds.values()))
+        GalaxyPhotData.objects.bulk_update(list(upd_gpds.values()), ['mag'])
+
+        Through = FRBTransient.candidates.through
+        Through.objects.bulk_create(
+            [Through(frbtransient_id=frb_id, frbgalaxy_id=gal_id) 
+             for frb_id, gal_id in set(links)], ignore_conflicts=True)
+        Path.objects.bulk_create(list(paths.values()))
+
+        # Tags
+        tag_links = []
+        for entry in entries:
+            if entry.get('new_tags') is None:
+                continue
+            for tag_name in entry['new_tags'].split(','):
+                tag = frb_utils.add_or_grab_obj(FRBTag, dict(name=tag_name), {}, user)
+                tag_links.append((entry['transient'].id, tag.id))
+        TagThrough = FRBTransient.frb_tags.through
+        TagThrough.objects.bulk_create(
+            [TagThrough(frbtransient_id=frb_id, frbtag_id=tag_id) 
+             for frb_id, tag_id in set(tag_links)], ignore_conflicts=True)
+
+        # P(U|x), bright star and host from the highest P_Ox
+        best = {}
+        for p in Path.objects.filter(transient__in=transients).order_by('-P_Ox', 'pk'):
+            best.setdefault(p.transient_id, p.galaxy_id)
+        for entry in entries:
+            itransient = entry['transient']
+            itransient.P_Ux = entry['P_Ux']
+            if entry.get('bright_star') is not None:
+                itransient.bright_star = bool(entry['bright_star'])
+            itransient.host_id = best.get(itransient.id)
+        FRBTransient.objects.bulk_update(transients, ['P_Ux', 'bright_star', 'host'])
+
+    # Set status
+    if set_status:
+        frb_status.set_status_bulk(FRBTransient.objects.filter(
+            id__in=[itransient.id for itransient in transients]))
+
+    # bulk_create/bulk_update skip the signals
+    frb_tables.mark_summary_dirty([itransient.id for itransient in transients])
+
+    return len(paths)
@@ -0,0 +1,21 @@
+""" Run the worker processes of the FRB job queue (see YSE_App/frb_jobs.py) """
+
+from django.core.management.base import BaseCommand
+
+from YSE_App import frb_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of workers for the FRB job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help='Number of worker processes')
+        parser.add_argument('--poll', type=float, default=2.,
+                            help='Seconds between checks of an empty queue')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        frb_jobs.run_workers(nprocess=options['processes'], poll=options['poll'],
+                             exit_when_empty=options['once'])
@@ -1,20 +1,189 @@
 # YSE_App/middleware/request_logger.py
+""" Request instrumentation
+
+RequestLoggingMiddleware times every request (streamed responses
+to their last byte) and records its view, method, status, latency,
+number of DB queries and response size in
+a ring buffer of the last REQUEST_METRICS_SIZE requests (one buffer
+per server process).  summary() aggregates the buffer into the
+p50/p95/p99 latencies per view;  the aggregate is recomputed at most
+every REQUEST_METRICS_INTERVAL seconds and served by the metrics
+endpoint.
+
+Request bodies are only printed for a random fraction
+REQUEST_LOG_SAMPLE of the requests (0 by default), truncated to
+REQUEST_LOG_BODY_MAX bytes.
+"""
+
+import collections
+import contextlib
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from django.conf import settings as djangoSettings
+from django.db import connections
+
+# Fraction of the requests whose body is printed
+sample_rate = getattr(djangoSettings, 'REQUEST_LOG_SAMPLE', 0.)
+# Bytes of a sampled body to print
+body_max = getattr(djangoSettings, 'REQUEST_LOG_BODY_MAX', 1000)
+# Requests kept in the ring buffer
+buffer_size = getattr(djangoSettings, 'REQUEST_METRICS_SIZE', 10000)
+# Seconds between aggregations of the buffer
+interval = getattr(djangoSettings, 'REQUEST_METRICS_INTERVAL', 30.)
+
+Record = collections.namedtuple(
+    'Record', ['time', 'view', 'method', 'status', 'latency', 'nquery', 'size'])
+
+_records = collections.deque(maxlen=buffer_size)
+_summary = dict(time=None, data=None)
+_lock = threading.Lock()
+
+
+class _QueryCounter:
+    """ DB execute wrapper counting the queries """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def record(view:str, method:str, status:int, latency:float,
+           nquery:int=0, size:int=None):
+    """ Add a request to the ring buffer
+
+    Args:
+        view (str): view name of the URL
+        method (str): HTTP method
+        status (int): HTTP status of the response
+        latency (float): time to the last byte of the response [s]
+        nquery (int, optional): number of DB queries
+        size (int, optional): response size [bytes]
+    """
+    with _lock:
+        _records.append(Record(time.time(), view, method, status,
+                               latency, nquery, size))
+
+def clear():
+    """ Empty the ring buffer """
+    with _lock:
+        _records.clear()
+        _summary['time'] = None
+
+def summary(force:bool=False):
+    """ Aggregate the ring buffer per view
+
+    Args:
+        force (bool, optional): Recompute even if the last aggregate
+            is more recent than `interval`
+
+    Returns:
+        dict: window of the buffer and, per view, the number of
+            requests, the p50/p95/p99 latencies [ms], the mean and
+            max number of DB queries, the mean response size
+            and the number of 4xx and 5xx responses
+    """
+    now = time.time()
+    with _lock:
+        if not force and _summary['time'] is not None and \
+                now - _summary['time'] < interval:
+            return _summary['data']
+        records = list(_records)
+
+    by_view = collections.defaultdict(list)
+    for rec in records:
+        by_view[rec.view].append(rec)
+
+    views = {}
+    for view, recs in sorted(by_view.items()):
+        latency = 1e3*np.array([rec.latency for rec in recs])
+        nquery = np.array([rec.nquery for rec in recs])
+        sizes = [rec.size for rec in recs if rec.size is not None]
+        status = np.array([rec.status for rec in recs])
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        views[view] = dict(
+            count=len(recs), p50=float(p50), p95=float(p95), p99=float(p99),
+            mean_queries=float(np.mean(nquery)), max_queries=int(np.max(nquery)),
+            mean_size=float(np.mean(sizes)) if len(sizes) > 0 else None,
+            n4xx=int(np.sum((status >= 400) & (status < 500))),
+            n5xx=int(np.sum(status >= 500)))
+
+    data = dict(pid=os.getpid(), nrequest=len(records),
+                start=records[0].time if len(records) > 0 else None,
+                end=records[-1].time if len(records) > 0 else None,
+                views=views)
+    with _lock:
+        _summary['time'], _summary['data'] = now, data
+    return data
+
 
 class RequestLoggingMiddleware:
     """
-    Middleware to log incoming requests BEFORE Django parses them.
+    Middleware timing every request into the ring buffer, and
+    printing a sample of the request bodies BEFORE Django parses them.
     """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        print("\n=== Incoming Request ===")
-        print(f"METHOD: {request.method}")
+        if sample_rate > 0. and random.random() < sample_rate:
+            self.print_body(request)
+
+        counter = _QueryCounter()
+        t0 = time.perf_counter()
+        with self.count_queries(counter):
+            response = self.get_response(request)
+
+        # Streamed content is generated as it is sent;  record at its end
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, counter, t0)
+        else:
+            self.add_record(request, response, counter, t0, len(response.content))
+        return response
+
+    @staticmethod
+    def count_queries(counter):
+        """ Context counting the DB queries on all connections """
+        stack = contextlib.ExitStack()
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(counter))
+        return stack
+
+    def stream(self, content, request, response, counter, t0):
+        """ Pass the streamed content through, timing it to its last byte """
+        size = 0
+        try:
+            with self.count_queries(counter):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.add_record(request, response, counter, t0, size)
+
+    @staticmethod
+    def add_record(request, response, counter, t0, size):
+        latency = time.perf_counter() - t0
+        match = request.resolver_match
+        record(match.view_name if match is not None else 'unresolved',
+               request.method, response.status_code, latency,
+               nquery=counter.count, size=size)
+
+    @staticmethod
+    def print_body(request):
+        print("\n=== Incoming Request (sampled) ===")
+        print(f"METHOD: {request.method} PATH: {request.path}")
         print(f"CONTENT-TYPE: {request.content_type}")
         try:
-            body_text = request.body.decode('utf-8')
-            print(f"BODY RAW: {body_text}")
+            body = request.body
+            body_text = body[:body_max].decode('utf-8', errors='replace')
+            print(f"BODY RAW ({len(body)} bytes): {body_text}")
         except Exception as e:
-            print(f"BODY could not be decoded: {e}")
+            print(f"BODY could not be read: {e}")
         print("========================\n")
-        return self.get_response(request)
@@ -0,0 +1,46 @@
+# Generated by Django 4.0 on 2026-10-18 11:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YSE_App', '0010_frbsamplecriteria_apply_bright_star_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FRBSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('TNS', models.CharField(max_length=64, unique=True)),
+                ('ra', models.FloatField()),
+                ('dec', models.FloatField()),
+                ('a_err', models.FloatField(blank=True, null=True)),
+                ('b_err', models.FloatField(blank=True, null=True)),
+                ('theta', models.FloatField(blank=True, null=True)),
+                ('DM', models.FloatField()),
+                ('DM_ISM', models.FloatField(blank=True, null=True)),
+                ('event_id', models.IntegerField(blank=True, null=True)),
+                ('repeater', models.BooleanField(default=False)),
+                ('mw_ebv', models.FloatField(blank=True, null=True)),
+                ('frb_survey', models.CharField(max_length=64)),
+                ('status', models.CharField(db_index=True, max_length=64)),
+                ('Tags', models.CharField(blank=True, max_length=512)),
+                ('Resources', models.CharField(blank=True, max_length=512)),
+                ('Host', models.CharField(blank=True, max_length=64)),
+                ('Host_mag', models.FloatField(blank=True, null=True)),
+                ('POx', models.FloatField(blank=True, null=True)),
+                ('z', models.FloatField(blank=True, null=True)),
+                ('z_qual', models.IntegerField(default=-1)),
+                ('z_src', models.CharField(blank=True, max_length=64)),
+                ('cand_POx', models.JSONField(default=list)),
+                ('cand_gal_names', models.JSONField(default=list)),
+                ('cand_gal_redshifts', models.JSONField(default=list)),
+                ('refreshed_date', models.DateTimeField(auto_now=True)),
+                ('transient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='YSE_App.frbtransient')),
+            ],
+        ),
+    ]
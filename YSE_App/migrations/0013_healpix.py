@@ -0,0 +1,33 @@
+# Generated by Django 4.0 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YSE_App', '0012_frbjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frbgalaxy',
+            name='healpix',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='frbtransient',
+            name='healpix',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='healpix',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transient',
+            name='healpix',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.0 on 2026-10-18 11:55
+
+from django.db import migrations
+
+
+def backfill_healpix(apps, schema_editor):
+    from YSE_App.common import healpix
+    for name in ['Host', 'Transient', 'FRBGalaxy', 'FRBTransient']:
+        healpix.backfill(apps.get_model('YSE_App', name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YSE_App', '0013_healpix'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_healpix, migrations.RunPython.noop),
+    ]
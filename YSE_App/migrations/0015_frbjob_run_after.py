@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('YSE_App', '0014_healpix_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frbjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -24,4 +24,6 @@ from YSE_App.models.frbtransient_models import *
 from YSE_App.models.frbgalaxy_models import *
 from YSE_App.models.frbphot_models import *
 from YSE_App.models.frbfollowup_models import *
-from YSE_App.models.frbsample_models import *
\ No newline at end of file
+from YSE_App.models.frbsample_models import *
+from YSE_App.models.frbsummary_models import *
+from YSE_App.models.frbjob_models import *
\ No newline at end of file
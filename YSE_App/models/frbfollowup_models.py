@@ -13,6 +13,7 @@ from YSE_App.models.frbtransient_models import *
 from YSE_App.models.instrument_models import *
 from YSE_App.models.principal_investigator_models import *
 from YSE_App import frb_targeting
+from YSE_App import frb_visibility
 
 
 class FRBFollowUpResource(BaseModel):
@@ -111,11 +112,18 @@ class FRBFollowUpResource(BaseModel):
     def NMaskString(self):
         return f'{self.num_targ_mask}'
 
-    def get_frbs_by_mode(self, include_secondary:bool=False):
+    def get_frbs_by_mode(self, include_secondary:bool=False,
+                         backend:str='astroplan'):
         """ Generate a dict of valid FRBs for targeting by observing mode
 
         calls frb_targeting.grab_targets_by_mode()
 
+        Args:
+            include_secondary (bool, optional): If True, include NeedSecondary targets.
+                Defaults to False.
+            backend (str, optional): Ephemeris backend for the airmasses,
+                'astroplan' or 'analytic'. Defaults to 'astroplan'.
+
         Returns:
             dict: dict of FRBTransients by observing mode
         """
@@ -125,16 +133,14 @@ class FRBFollowUpResource(BaseModel):
         #  P(O|x)
         #  E(B-V)
         #  Bright star?
-        gd_frbs = frb_targeting.targetfrbs_for_fu(self)
+        gd_frbs = frb_targeting.targetfrbs_for_fu(self).order_by('id')
 
         # Caculate minimum airmasses during the Resource period
-        min_AM = frb_targeting.calc_airmasses(self, gd_frbs)
+        min_AM = frb_targeting.calc_airmasses(self, gd_frbs, backend=backend)
 
         # Parse on AM
-        keep_frbs = []
-        for ss in range(len(gd_frbs)):
-            if min_AM[ss] <= self.max_AM:
-                keep_frbs.append(gd_frbs[ss].id)
+        frb_ids = np.array(gd_frbs.values_list('id', flat=True))
+        keep_frbs = frb_ids[min_AM <= self.max_AM].tolist()
         gd_frbs = gd_frbs.filter(id__in=keep_frbs)
 
         # Now the various modes!
@@ -143,22 +149,29 @@ class FRBFollowUpResource(BaseModel):
 
         return frbs_by_mode
 
-    def generate_target_table(self, include_secondary:bool=False):
+    def generate_target_table(self, include_secondary:bool=False,
+                              backend:str='astroplan', seed:int=None):
         """ Generate a table of FRBTransients that are valid for this resource, 
         i.e. meet all the criteria including AM
 
         Args:
             include_secondary (bool, optional): If True, include NeedSecondary targets.
                 Defaults to False.
+            backend (str, optional): Ephemeris backend for the airmasses.
+                Defaults to 'astroplan'.
+            seed (int, optional): Seed for the selection by priority.
+                Defaults to None.
 
         Returns:
             pandas.DataFrame: table of FRBTransients for observing
         """
         # All FRBs by mode satisfying criteria
-        frbs_by_mode = self.get_frbs_by_mode(include_secondary=include_secondary)
+        frbs_by_mode = self.get_frbs_by_mode(include_secondary=include_secondary,
+                                             backend=backend)
 
         # Cut down by number requested and priority
-        final_targs_by_mode = frb_targeting.select_with_priority(self, frbs_by_mode)
+        final_targs_by_mode = frb_targeting.select_with_priority(
+            self, frbs_by_mode, seed=seed)
 
         # Table me
         tbls = []
@@ -174,6 +187,13 @@ class FRBFollowUpResource(BaseModel):
         return target_table
 
 
+@receiver(models.signals.post_save, sender=FRBFollowUpResource)
+@receiver(models.signals.post_delete, sender=FRBFollowUpResource)
+def reset_visibility(sender, instance, *args, **kwargs):
+    # Cached airmasses are now stale
+    frb_visibility.invalidate(instance.id)
+
+
 class FRBFollowUpRequest(BaseModel):
     """ FRBFollowUpRequest model
 
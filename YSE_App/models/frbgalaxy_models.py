@@ -1,9 +1,41 @@
 from django.db import models
+from django.dispatch import receiver
 
 from YSE_App.models.base import BaseModel
 from YSE_App import models as yse_models
 #from YSE_App.models.frbtransient_models import FRBTransient
 from YSE_App.common.utilities import GetSexigesimalString 
+from YSE_App.common import healpix
+
+def filter_mag_from_phot_dict(pdict:dict):
+    """ Return the filter and magnitude from a photometry dict
+    (see FRBGalaxy.phot_dict)
+
+    First preference is given to 'r/R' band
+    Then, anything goes..
+
+    Split out from FRBGalaxy.FilterMagString() so that
+    prefetched photometry can be used in bulk
+
+    Args:
+        pdict (dict): phot[instrument][band] = mag
+
+    Returns:
+        str, str: filter and magnitude for the galaxy
+            or 'None' if there is no photometry
+    """
+    if len(pdict) == 0:
+        return 'None'
+    # Take first 'r/R'-band if we have it
+    for inst_key in pdict.keys():
+        for ifilter in pdict[inst_key].keys():
+            if ifilter[-1] in ['r', 'R']:
+                return f'{inst_key}-{ifilter}', '%.2f'%(pdict[inst_key][ifilter])
+
+    # Take the first one we have
+    inst_key = list(pdict.keys())[0]
+    ifilter = list(pdict[inst_key].keys())[0]
+    return f'{inst_key}-{ifilter}', '%.2f'%(pdict[inst_key][ifilter])
 
 class FRBGalaxy(BaseModel):
     """django model for FRB host galaxy candidates
@@ -44,6 +76,9 @@ class FRBGalaxy(BaseModel):
     photoz_err = models.FloatField(null=True, blank=True)
     photoz_source = models.CharField(max_length=64, blank=True)
 
+    # HEALPix pixel of (ra,dec) for cone searches;  set on save
+    healpix = models.IntegerField(null=True, blank=True, db_index=True)
+
 
     # Angular size (in arcsec; typically half-light radius)
     ang_size = models.FloatField(null=True, blank=True)
@@ -84,19 +119,7 @@ class FRBGalaxy(BaseModel):
         Returns:
             str, str: filter and magnitude for the galaxy
         """
-        pdict = self.phot_dict
-        if len(pdict) == 0:
-            return 'None'
-        # Take first 'r/R'-band if we have it
-        for inst_key in pdict.keys():
-            for ifilter in pdict[inst_key].keys():
-                if ifilter[-1] in ['r', 'R']:
-                    return f'{inst_key}-{ifilter}', '%.2f'%(pdict[inst_key][ifilter])
-
-        # Take the first one we have
-        inst_key = list(pdict.keys())[0]
-        ifilter = pdict[inst_key].keys()[0]
-        return f'{inst_key}-{ifilter}', '%.2f'%(pdict[inst_key][ifilter])
+        return filter_mag_from_phot_dict(self.phot_dict)
 
     def POxString(self):
         """ Return the P_Ox for the galaxy as a string (for viewing)
@@ -197,3 +220,6 @@ class FRBGalaxy(BaseModel):
                 pdict[top_key][phot_data.band.name] = phot_data.mag
         return pdict
 
+@receiver(models.signals.pre_save, sender=FRBGalaxy)
+def set_frbgalaxy_healpix(sender, instance, *args, **kwargs):
+    healpix.set_healpix(sender, instance)
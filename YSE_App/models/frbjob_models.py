@@ -0,0 +1,56 @@
+""" Queue of background jobs for the FRBs (see frb_jobs.py) """
+
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class FRBJob(models.Model):
+    """ FRBJob model
+
+    One row per job;  the table is the queue.
+    Jobs are claimed by the workers of frb_jobs.run_workers()
+    """
+
+    # Job states
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = [(state, state) for state in [QUEUED, RUNNING, DONE, FAILED]]
+
+    # Kind of job, i.e. the key of its handler in frb_jobs.handlers
+    kind = models.CharField(max_length=64)
+    # Input of the handler
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=16, choices=STATES, default=QUEUED,
+                              db_index=True)
+    # Output of the handler or the traceback on failure
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    # Not claimed before this time (backoff of the retries)
+    run_after = models.DateTimeField(null=True, blank=True, db_index=True)
+    worker = models.CharField(max_length=64, blank=True)
+
+    created_by = models.ForeignKey(User, null=True, blank=True,
+                                   on_delete=models.SET_NULL,
+                                   related_name='frbjob_created_by')
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'FRBJob {self.id}: {self.kind} ({self.status})'
+
+    def as_dict(self):
+        """ Summary of the job for the polling endpoint
+
+        Returns:
+            dict: job_id, kind, status, attempts, result, error and dates
+        """
+        return dict(job_id=self.id, kind=self.kind, status=self.status,
+                    attempts=self.attempts, result=self.result, error=self.error,
+                    created_date=str(self.created_date),
+                    started_date=str(self.started_date) if self.started_date else None,
+                    finished_date=str(self.finished_date) if self.finished_date else None)
@@ -1,11 +1,13 @@
 """ Models for FRB Samples (also known, unfortunately, as tags)"""
 
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import receiver
 
 import pandas
 
 from YSE_App.models.base import BaseModel
 from YSE_App.models.frbtransient_models import *
+from YSE_App import frb_criteria
 
 
 class FRBSampleCriteria(BaseModel):
@@ -70,3 +72,11 @@ class FRBSampleCriteria(BaseModel):
 
     def NameString(self):
         return self.name
+
+
+@receiver(models.signals.post_save, sender=FRBSampleCriteria)
+@receiver(models.signals.post_delete, sender=FRBSampleCriteria)
+def reset_criteria_registry(sender, instance, *args, **kwargs):
+    # Cached criteria are stale once the change is committed;
+    #  dropping them earlier lets another thread cache the old rows again
+    transaction.on_commit(frb_criteria.invalidate)
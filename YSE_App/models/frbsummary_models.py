@@ -0,0 +1,161 @@
+""" Denormalized summary of the FRBTransients
+
+One row per FRBTransient holding the columns of
+frb_tables.summary_table().  The rows are refreshed by
+the signals below (see frb_tables.mark_summary_dirty())
+"""
+
+from django.db import models
+from django.db.models import Q
+from django.dispatch import receiver
+
+from YSE_App.models.frbtransient_models import FRBTransient, Path
+from YSE_App.models.frbgalaxy_models import FRBGalaxy
+from YSE_App.models.frbphot_models import GalaxyPhotData
+from YSE_App.models.frbfollowup_models import FRBFollowUpResource, FRBFollowUpRequest, FRBFollowUpObservation
+from YSE_App.models.enum_models import TransientStatus
+from YSE_App.models.tag_models import FRBTag
+
+
+class FRBSummary(models.Model):
+    """ FRBSummary model
+
+    Derived entirely from the other FRB tables;  never edit by hand.
+    Field names match the columns of frb_tables.summary_table()
+    """
+
+    transient = models.OneToOneField(FRBTransient, on_delete=models.CASCADE,
+                                     related_name='summary')
+
+    # FRBTransient
+    TNS = models.CharField(max_length=64, unique=True)
+    ra = models.FloatField()
+    dec = models.FloatField()
+    a_err = models.FloatField(null=True, blank=True)
+    b_err = models.FloatField(null=True, blank=True)
+    theta = models.FloatField(null=True, blank=True)
+    DM = models.FloatField()
+    DM_ISM = models.FloatField(null=True, blank=True)
+    event_id = models.IntegerField(null=True, blank=True)
+    repeater = models.BooleanField(default=False)
+    mw_ebv = models.FloatField(null=True, blank=True)
+    frb_survey = models.CharField(max_length=64)
+    status = models.CharField(max_length=64, db_index=True)
+
+    # Strings
+    Tags = models.CharField(max_length=512, blank=True)
+    Resources = models.CharField(max_length=512, blank=True)
+    Host = models.CharField(max_length=64, blank=True)
+
+    # Host
+    Host_mag = models.FloatField(null=True, blank=True)
+    POx = models.FloatField(null=True, blank=True)
+    z = models.FloatField(null=True, blank=True)
+    z_qual = models.IntegerField(default=-1)
+    z_src = models.CharField(max_length=64, blank=True)
+
+    # Top two candidates
+    cand_POx = models.JSONField(default=list)
+    cand_gal_names = models.JSONField(default=list)
+    cand_gal_redshifts = models.JSONField(default=list)
+
+    refreshed_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Summary: {self.TNS}'
+
+
+# #########################################################
+# Signals to keep the summary fresh
+# #########################################################
+
+def _frbs_with_galaxy(galaxy_id):
+    return FRBTransient.objects.filter(
+        Q(host_id=galaxy_id) | Q(candidates__id=galaxy_id)).values_list(
+            'id', flat=True).distinct()
+
+# FRBTransient fields held in the summary
+_frbtransient_fields = set(['name', 'ra', 'dec', 'a_err', 'b_err', 'theta',
+                            'DM', 'DM_ISM', 'event_id', 'repeater', 'mw_ebv',
+                            'frb_survey', 'status', 'host'])
+
+@receiver(models.signals.post_save, sender=FRBTransient)
+def summary_frbtransient_saved(sender, instance, update_fields=None, *args, **kwargs):
+    from YSE_App import frb_tables
+    if update_fields is not None and \
+            len(_frbtransient_fields.intersection(update_fields)) == 0:
+        return
+    frb_tables.mark_summary_dirty([instance.id])
+
+@receiver(models.signals.m2m_changed, sender=FRBTransient.frb_tags.through)
+@receiver(models.signals.m2m_changed, sender=FRBTransient.candidates.through)
+def summary_frbtransient_m2m(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    from YSE_App import frb_tables
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is the tag/galaxy
+        if pk_set:
+            frb_tables.mark_summary_dirty(pk_set)
+    else:
+        frb_tables.mark_summary_dirty([instance.id])
+
+@receiver(models.signals.post_save, sender=Path)
+@receiver(models.signals.post_delete, sender=Path)
+@receiver(models.signals.post_save, sender=FRBFollowUpRequest)
+@receiver(models.signals.post_delete, sender=FRBFollowUpRequest)
+@receiver(models.signals.post_save, sender=FRBFollowUpObservation)
+@receiver(models.signals.post_delete, sender=FRBFollowUpObservation)
+def summary_transient_fk(sender, instance, *args, **kwargs):
+    from YSE_App import frb_tables
+    frb_tables.mark_summary_dirty([instance.transient_id])
+
+@receiver(models.signals.post_save, sender=FRBGalaxy)
+def summary_frbgalaxy(sender, instance, *args, **kwargs):
+    from YSE_App import frb_tables
+    frb_tables.mark_summary_dirty(_frbs_with_galaxy(instance.id))
+
+@receiver(models.signals.post_save, sender=GalaxyPhotData)
+@receiver(models.signals.post_delete, sender=GalaxyPhotData)
+def summary_galaxyphotdata(sender, instance, *args, **kwargs):
+    from YSE_App import frb_tables
+    try:
+        galaxy_id = instance.photometry.galaxy_id
+    except Exception:  # Photometry already removed
+        return
+    frb_tables.mark_summary_dirty(_frbs_with_galaxy(galaxy_id))
+
+# The summary holds the names of the resources, tags and statuses
+
+@receiver(models.signals.pre_save, sender=FRBFollowUpResource)
+@receiver(models.signals.pre_save, sender=FRBTag)
+@receiver(models.signals.pre_save, sender=TransientStatus)
+def summary_name_before(sender, instance, *args, **kwargs):
+    # Name in the DB, to catch the renames
+    instance._summary_old_name = None if instance.pk is None else \
+        sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+@receiver(models.signals.post_save, sender=FRBFollowUpResource)
+@receiver(models.signals.post_save, sender=FRBTag)
+@receiver(models.signals.post_save, sender=TransientStatus)
+def summary_renamed(sender, instance, created, *args, **kwargs):
+    from YSE_App import frb_tables
+    if created or getattr(instance, '_summary_old_name', None) == instance.name:
+        return
+    if sender is FRBFollowUpResource:
+        frb_ids = set()
+        for model in [FRBFollowUpRequest, FRBFollowUpObservation]:
+            frb_ids.update(model.objects.filter(resource_id=instance.id).values_list(
+                'transient_id', flat=True))
+    elif sender is FRBTag:
+        frb_ids = FRBTransient.objects.filter(frb_tags=instance).values_list('id', flat=True)
+    else:
+        frb_ids = FRBTransient.objects.filter(status=instance).values_list('id', flat=True)
+    frb_tables.mark_summary_dirty(frb_ids)
+
+@receiver(models.signals.pre_delete, sender=FRBTag)
+def summary_frbtag_deleted(sender, instance, *args, **kwargs):
+    # The links go without m2m_changed;  the refresh runs after the commit
+    from YSE_App import frb_tables
+    frb_tables.mark_summary_dirty(
+        FRBTransient.objects.filter(frb_tags=instance).values_list('id', flat=True))
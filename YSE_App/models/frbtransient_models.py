@@ -1,7 +1,10 @@
 from autoslug import AutoSlugField
 from auditlog.registry import auditlog
 
-from django.db import models
+from django.conf import settings as djangoSettings
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Count, Case, When, Value
+from django.db.models.functions import Coalesce, Least
 from django.dispatch import receiver
 
 import numpy as np
@@ -12,17 +15,101 @@ from YSE_App.models.enum_models import *
 from YSE_App.models.tag_models import *
 from YSE_App.chime import tags as chime_tags
 from YSE_App.common.utilities import GetSexigesimalString, getSeparation
+from YSE_App.common import healpix
 from YSE_App.models.frbgalaxy_models import FRBGalaxy
 
 from YSE_App import frb_tags
 from YSE_App import frb_status
 from YSE_App import frb_utils
+from YSE_App import frb_ism
+from YSE_App import frb_jobs
 
-from astropy.coordinates import SkyCoord
-from astroquery import irsa_dust
+class FRBTransientQuerySet(models.QuerySet):
+    """ QuerySet for FRBTransient with the PATH quantities
+    available as annotations
+    """
+
+    def with_path_stats(self):
+        """ Annotate the PATH quantities of each FRB with subqueries
+
+        Columns (and the property they replace):
+            host_npath -- number of Path entries of the host
+            host_POx -- FRBGalaxy.P_Ox of the host
+            host_path_mag -- FRBGalaxy.path_mag of the host
+            path_count -- number of Path entries of the FRB
+            path_sum_top_two -- FRBTransient.sum_top_two_PATH
+            path_mag_top_two -- FRBTransient.mag_top_two_PATH
+            best_path_galaxy_id -- id of FRBTransient.best_Path_galaxy
+
+        Returns:
+            QuerySet: annotated QuerySet
+        """
+        from YSE_App.models import GalaxyPhotData
+        fl = models.FloatField()
+
+        # Host
+        host_paths = Path.objects.filter(galaxy=OuterRef('host')).order_by()
+        host_npath = Subquery(
+            host_paths.values('galaxy').annotate(n=Count('pk')).values('n'),
+            output_field=models.IntegerField())
+        host_POx = Subquery(host_paths.order_by('pk').values('P_Ox')[:1],
+                            output_field=fl)
+        band = Path.objects.filter(galaxy=OuterRef(OuterRef('host'))).order_by(
+            'pk').values('band')[:1]
+        host_path_mag = Subquery(GalaxyPhotData.objects.filter(
+            photometry__galaxy=OuterRef('host'), band=Subquery(band)).order_by(
+                'pk').values('mag')[:1], output_field=fl)
+
+        # Candidates, ranked by P(O|x)
+        galaxy_mag = Subquery(GalaxyPhotData.objects.filter(
+            photometry__galaxy=OuterRef('galaxy'),
+            photometry__instrument=OuterRef('band__instrument'),
+            band=OuterRef('band')).order_by('photometry', 'pk').values('mag')[:1],
+            output_field=fl)
+        ranked = Path.objects.filter(transient=OuterRef('pk')).annotate(
+            gmag=galaxy_mag).order_by('-P_Ox', 'pk')
+        path_count = Subquery(
+            Path.objects.filter(transient=OuterRef('pk')).order_by().values(
+                'transient').annotate(n=Count('pk')).values('n'),
+            output_field=models.IntegerField())
+        POx_1 = Subquery(ranked.values('P_Ox')[:1], output_field=fl)
+        POx_2 = Subquery(ranked.values('P_Ox')[1:2], output_field=fl)
+        mag_1 = Subquery(ranked.values('gmag')[:1], output_field=fl)
+        mag_2 = Subquery(ranked.values('gmag')[1:2], output_field=fl)
+
+        return self.annotate(
+            host_npath=host_npath, path_count=Coalesce(path_count, 0)).annotate(
+            host_POx=Case(When(host_npath=1, then=host_POx), default=None,
+                          output_field=fl),
+            host_path_mag=Case(When(host_npath=1, then=host_path_mag),
+                               default=None, output_field=fl),
+            path_sum_top_two=Coalesce(POx_1, Value(0.)) + Coalesce(POx_2, Value(0.)),
+            path_mag_top_two=Case(
+                When(path_count=0, then=Value(99.)),
+                default=Least(Coalesce(mag_1, mag_2), Coalesce(mag_2, mag_1)),
+                output_field=fl),
+            best_path_galaxy_id=Subquery(ranked.values('galaxy')[:1]),
+        )
+
+    def for_table(self):
+        """ Load everything shown by FRBTransientTable with
+        a fixed number of queries per page
+
+        Returns:
+            QuerySet: with the related objects joined or prefetched
+                and the PATH quantities annotated
+        """
+        from YSE_App.models.frbfollowup_models import FRBFollowUpRequest, FRBFollowUpObservation
+        qs = self.select_related('status', 'frb_survey', 'host').prefetch_related(
+            'frb_tags',
+            models.Prefetch('frbfollowuprequest_set',
+                            queryset=FRBFollowUpRequest.objects.select_related('resource')),
+            models.Prefetch('frbfollowupobservation_set',
+                            queryset=FRBFollowUpObservation.objects.select_related('resource')))
+        if 'host_POx' not in qs.query.annotations:
+            qs = qs.with_path_stats()
+        return qs
 
-# FRB items
-from ne2001 import density
 
 class FRBTransient(BaseModel):
     """ FRBTransient model
@@ -75,6 +162,9 @@ class FRBTransient(BaseModel):
     # S.N
     s2n = models.FloatField(null=True, blank=True)
 
+    # HEALPix pixel of (ra,dec) for cone searches;  set on save
+    healpix = models.IntegerField(null=True, blank=True, db_index=True)
+
     # Host -- defined as the Highest P(O|x) candidate
     #   set in YSE_App.galaxies.path.ingest_path_results()
     host = models.ForeignKey(
@@ -105,6 +195,8 @@ class FRBTransient(BaseModel):
 
     slug = AutoSlugField(null=True, default=None, unique=True, populate_from='name')
 
+    objects = FRBTransientQuerySet.as_manager()
+
     # The String methods are for viewing
     def CoordString(self):
         return GetSexigesimalString(self.ra, self.dec)
@@ -144,17 +236,24 @@ class FRBTransient(BaseModel):
         else:
             return ''
 
+    # The next two use the columns of with_path_stats(), if present
     def HostPOxString(self):
-        if self.host:
-            return self.host.POxString()
-        else:
+        if not self.host_id:
             return ''
+        elif hasattr(self, 'host_POx'):
+            return 'None' if self.host_POx is None else '%.2f'%(self.host_POx)
+        else:
+            return self.host.POxString()
 
     def HostMagString(self):
-        if self.host:
-            return self.host.MagString()
-        else:
+        if not self.host_id:
             return ''
+        elif hasattr(self, 'host_POx'):
+            if self.host_POx is None or self.host_path_mag is None:
+                return ''
+            return '%.1f'%(self.host_path_mag)
+        else:
+            return self.host.MagString()
 
     def HostzString(self):
         """ Redshift """
@@ -172,9 +271,9 @@ class FRBTransient(BaseModel):
 
     def FRBFollowUpResourcesString(self):
         """ Generate a comma-separated list of the FRBFollowUpResources for this transient"""
-        from YSE_App.models.frbfollowup_models import FRBFollowUpRequest, FRBFollowUpObservation
-        fu_req = FRBFollowUpRequest.objects.filter(transient=self)
-        fu_obs = FRBFollowUpObservation.objects.filter(transient=self)
+        # Reverse relations so that a prefetch (see for_table()) is used
+        fu_req = self.frbfollowuprequest_set.all()
+        fu_obs = self.frbfollowupobservation_set.all()
         fu_names = []
         fu_names += [item.ResourceName() for item in fu_req]
         fu_names += [item.ResourceName() for item in fu_obs]
@@ -199,19 +298,12 @@ class FRBTransient(BaseModel):
     def calc_DM_ISM(self):
         """ Calcualte DM_ISM from NE2001
 
+        See frb_ism.dm_ism()
+
         Returns:
             float: DM_ISM in pc/cm^3
         """
-
-        coord = SkyCoord(ra=self.ra, dec=self.dec,
-                        unit='deg')
-        gcoord = coord.transform_to('galactic')
-        l, b = gcoord.l.value, gcoord.b.value
-        
-        ne = density.ElectronDensity()#**PARAMS)
-        ismDM = ne.DM(l, b, 100.)
-
-        return ismDM.value
+        return float(frb_ism.dm_ism(self.ra, self.dec)[0])
 
 
     def get_Path_values(self):
@@ -237,6 +329,9 @@ class FRBTransient(BaseModel):
     def sum_top_two_PATH(self):
         """ Add the top two PATH P(O|x) values for the transient 
 
+        Also available as the path_sum_top_two column 
+        of FRBTransient.objects.with_path_stats()
+
         Returns:
             float: 0. if there is no PATH analysis
 
@@ -259,6 +354,9 @@ class FRBTransient(BaseModel):
         If there are more than 1, take the top two and 
         return the *brightest* magnitude
 
+        Also available as the path_mag_top_two column 
+        of FRBTransient.objects.with_path_stats()
+
         Returns:
             float: 99. if there is no PATH analysis
 
@@ -274,12 +372,15 @@ class FRBTransient(BaseModel):
             mags = np.array([obj.galaxy_mag for obj in path_objs])
             # Sort em
             mags = mags[argsrt]
-            return np.min(mags)
+            return np.min(mags[-2:])
 
     @property
     def best_Path_galaxy(self):
         """ Return the galaxy with the highest P(O|x) value
 
+        The id is available as the best_path_galaxy_id column 
+        of FRBTransient.objects.with_path_stats()
+
         Returns:
             FRBGalaxy: Galaxy with the highest P(O|x) value or None
         """
@@ -292,15 +393,24 @@ class FRBTransient(BaseModel):
 
 auditlog.register(FRBTransient)
 
+@receiver(models.signals.pre_save, sender=FRBTransient)
+def set_frbtransient_healpix(sender, instance, *args, **kwargs):
+    healpix.set_healpix(sender, instance)
+
 @receiver(models.signals.post_save, sender=FRBTransient)
 def execute_after_save(sender, instance, created, *args, **kwargs):
 
     # Add a few bits and pieces including tags
     if created:
 
+        # Leave it to the FRB job workers?
+        if getattr(djangoSettings, 'FRB_ASYNC_ENRICH', False):
+            transaction.on_commit(
+                lambda: frb_jobs.submit('enrich', dict(ids=[instance.id])))
+            return
+
         # Galactic E(B-V) -- Needs to come before tagging
-        c = SkyCoord(ra=instance.ra, dec=instance.dec, unit='deg')
-        instance.mw_ebv = irsa_dust.IrsaDust.get_query_table(c)['ext SandF mean'][0]
+        instance.mw_ebv = float(frb_ism.mw_ebv(instance.ra, instance.dec)[0])
 
         # DM ISM
         instance.DM_ISM = instance.calc_DM_ISM()
@@ -4,6 +4,8 @@ from YSE_App.models.enum_models import *
 from YSE_App.models.photometric_band_models import *
 from YSE_App.common.utilities import *
 from YSE_App import models as yse_models
+from YSE_App.common import healpix
+from django.dispatch import receiver
 
 class HostSED(BaseModel):
     ### Entity relationships ###
@@ -71,6 +73,8 @@ class Host(BaseModel):
     photo_z_source = models.CharField(max_length=64, null=True, blank=True)
     transient_host_rank = models.IntegerField(null=True, blank=True)
     panstarrs_objid = models.BigIntegerField(null=True, blank=True)
+    # HEALPix pixel of (ra,dec) for cone searches;  set on save
+    healpix = models.IntegerField(null=True, blank=True, db_index=True)
 
     def HostString(self):
         ra_str, dec_str = GetSexigesimalString(self.ra, self.dec)
@@ -94,3 +98,7 @@ class Host(BaseModel):
 
     def natural_key(self):
         return self.HostString()
+
+@receiver(models.signals.pre_save, sender=Host)
+def set_host_healpix(sender, instance, *args, **kwargs):
+    healpix.set_healpix(sender, instance)
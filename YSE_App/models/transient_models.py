@@ -12,6 +12,7 @@ from YSE_App.common.tess_obs import tess_obs
 from YSE_App.common.utilities import date_to_mjd
 from YSE_App import models as yse_models
 from django.dispatch import receiver
+from YSE_App.common import healpix
 from pytz import timezone
 from django.utils.text import slugify
 from autoslug import AutoSlugField
@@ -76,6 +77,9 @@ class Transient(BaseModel):
 	slug = AutoSlugField(null=True, default=None, unique=True, populate_from='name')
 
 	real_bogus_score = models.FloatField(null=True, blank=True)
+
+	# HEALPix pixel of (ra,dec) for cone searches;  set on save
+	healpix = models.IntegerField(null=True, blank=True, db_index=True)
 	
 	has_hst = models.BooleanField(null=True, blank=True)
 	has_spitzer = models.BooleanField(null=True, blank=True)
@@ -263,6 +267,10 @@ class Transient(BaseModel):
 
 auditlog.register(Transient)
 
+@receiver(models.signals.pre_save, sender=Transient)
+def set_transient_healpix(sender, instance, *args, **kwargs):
+	healpix.set_healpix(sender, instance)
+
 @receiver(models.signals.post_save, sender=Transient)
 def execute_after_save(sender, instance, created, *args, **kwargs):
 
@@ -0,0 +1,589 @@
+""" Bulk upsert of transients (see the add_transient endpoint)
+
+The brokers and survey pipelines upload hundreds of transients
+per call.  upsert_transients() processes them in stages, each with
+a number of queries that does not grow with the number of transients:
+
+  1. resolve the names of the foreign keys, one query per model
+  2. match the existing transients by name, alternate name and
+     position (one cone query on the HEALPix index for all)
+  3. bulk_create/bulk_update the Transient rows, alternate names
+     and tags, in one transaction
+  4. write the photometry in bulk (write_photometry()),
+     then the spectra and hosts
+
+and returns the outcome per transient.
+
+The cron jobs running in the server process call upload_transients()
+directly instead of POSTing their batches back to add_transient;
+the add_transient and add_transient_phot views wrap
+upsert_transients() and add_photometry().
+"""
+
+import collections
+import datetime
+import sys
+
+import dateutil.parser
+import numpy as np
+
+from YSE_App.common import healpix
+
+# Keys of the upload that are not Transient fields
+skip_keys = ['transientphotometry', 'transientspectra', 'host', 'tags', 'gw',
+             'non_detect_instrument', 'internal_names']
+# Top-level flags of the upload
+control_keys = ['noupdatestatus', 'TNS']
+# Postage stamps kept from the existing transient
+stamp_fields = ['postage_stamp_file', 'postage_stamp_ref', 'postage_stamp_diff',
+                'postage_stamp_file_fits', 'postage_stamp_ref_fits',
+                'postage_stamp_diff_fits']
+
+# Radius of the positional match [deg]
+match_radius = 0.0003
+# Max difference of discovery dates for a positional match
+match_window = datetime.timedelta(365)
+# Transients per cone query
+match_chunk = 200
+
+subject = "TNS Transient Upload Failure"
+
+
+def _alert(user, msg:str):
+    """ Email the uploader about a failure """
+    from django.conf import settings as djangoSettings
+    from YSE_App.common.alert import sendemail
+
+    smtpserver = "%s:%s" % (djangoSettings.SMTP_HOST, djangoSettings.SMTP_PORT)
+    from_addr = "%s@gmail.com" % djangoSettings.SMTP_LOGIN
+    print("Sending email to: %s" % user.username)
+    sendemail(from_addr, user.email, subject, msg,
+              djangoSettings.SMTP_LOGIN, djangoSettings.SMTP_PASSWORD, smtpserver)
+
+def _by_name(model, names, **kwargs):
+    """ Objects of a model keyed by name, in one query;  the first
+    (lowest pk) when names are repeated.  'Unknown' is always included.
+    """
+    objs = {}
+    for obj in model.objects.filter(name__in=set(names) | {'Unknown'},
+                                    **kwargs).order_by('pk'):
+        objs.setdefault(obj.name, obj)
+    return objs
+
+def _aware(date):
+    date = dateutil.parser.parse(date) if isinstance(date, str) else date
+    return date if date.tzinfo is not None else date.replace(tzinfo=datetime.timezone.utc)
+
+
+# #########################################################
+# Stages
+# #########################################################
+
+def resolve_fields(transients:dict, user, results:dict):
+    """ Field values of the transients, with the foreign keys
+    resolved by name, one query per model
+
+    Unknown names map to the 'Unknown' entry of the model
+    (and the uploader is emailed)
+
+    Args:
+        transients (dict): uploaded transients
+        user (User): uploader
+        results (dict): outcome per transient;  failures are added
+
+    Returns:
+        dict: field values, keyed like transients
+    """
+    from django.core.exceptions import FieldDoesNotExist
+    from django.db.models import ForeignKey
+    from YSE_App.models import Transient, PhotometricBand
+
+    # Names to look up, per model
+    names = collections.defaultdict(set)
+    for key, transient in transients.items():
+        for tkey in transient.keys():
+            if tkey in skip_keys:
+                continue
+            try:
+                field = Transient._meta.get_field(tkey)
+            except FieldDoesNotExist:
+                # Fails the transient below
+                continue
+            if isinstance(field, ForeignKey) and transient[tkey] is not None:
+                names[field.remote_field.model].add(transient[tkey])
+    lookups = {model: _by_name(model, inames) for model, inames in names.items()}
+    bands = {}
+    if PhotometricBand in names:
+        for band in PhotometricBand.objects.filter(
+                name__in=names[PhotometricBand]).select_related('instrument').order_by('pk'):
+            bands.setdefault((band.name, band.instrument.name), band)
+
+    all_fields = {}
+    for key, transient in transients.items():
+        try:
+            fields = {'created_by_id': user.id, 'modified_by_id': user.id}
+            for tkey in transient.keys():
+                if tkey in skip_keys:
+                    continue
+                field = Transient._meta.get_field(tkey)
+                if not isinstance(field, ForeignKey):
+                    if transient[tkey] is not None:
+                        fields[tkey] = transient[tkey]
+                    continue
+                lookup = lookups.get(field.remote_field.model, {})
+                value = None
+                if tkey == 'non_detect_band' and 'non_detect_instrument' in transient.keys():
+                    value = bands.get((transient[tkey], transient['non_detect_instrument']))
+                if value is None:
+                    value = lookup.get(transient[tkey])
+                if value is None:
+                    value = lookup['Unknown']
+                    html_msg = "Alert : YSE_PZ Failed to upload transient %s "
+                    html_msg += "\nError : %s value doesn\'t exist in transient.%s FK relationship"
+                    _alert(user, html_msg%(transient['name'],transient[tkey],tkey))
+                fields[tkey] = value
+            all_fields[key] = fields
+        except Exception as e:
+            _fail(user, transient, key, e, results)
+    return all_fields
+
+def match_existing(transients:dict):
+    """ Existing transients matching the uploaded ones
+
+    By name, then by alternate name, then by position (within
+    match_radius and, if a disc_date is given, match_window)
+
+    Args:
+        transients (dict): uploaded transients
+
+    Returns:
+        tuple: dict of (Transient, 'name'|'alias'|'position') keyed
+            like the matched transients, list of ids of the
+            duplicated (same name) transients to delete
+    """
+    from django.db.models import Q
+    from YSE_App.models import Transient, AlternateTransientNames
+
+    names = [transient['name'] for transient in transients.values()]
+    by_name = collections.defaultdict(list)
+    for dbtransient in Transient.objects.filter(name__in=names).select_related(
+            'status').order_by('pk'):
+        by_name[dbtransient.name].append(dbtransient)
+    duplicates = [dbtransient.id for dbtransients in by_name.values()
+                  for dbtransient in dbtransients[1:]]
+    alts = {}
+    for alt in AlternateTransientNames.objects.filter(name__in=names).select_related(
+            'transient__status').order_by('pk'):
+        alts.setdefault(alt.name, alt.transient)
+
+    matches, unmatched = {}, []
+    for key, transient in transients.items():
+        if transient['name'] in by_name:
+            matches[key] = (by_name[transient['name']][0], 'name')
+        elif transient['name'] in alts:
+            matches[key] = (alts[transient['name']], 'alias')
+        else:
+            unmatched.append(key)
+
+    # Position, one query per chunk
+    for ii in range(0, len(unmatched), match_chunk):
+        keys = unmatched[ii:ii+match_chunk]
+        q = Q()
+        for key in keys:
+            q |= healpix.cone_q(transients[key]['ra'], transients[key]['dec'], match_radius)
+        candidates = list(Transient.objects.filter(q).select_related('status').order_by('pk'))
+        if len(candidates) == 0:
+            continue
+        cras = np.array([candidate.ra for candidate in candidates])
+        cdecs = np.array([candidate.dec for candidate in candidates])
+        for key in keys:
+            transient = transients[key]
+            seps = healpix.separation(transient['ra'], transient['dec'], cras, cdecs)
+            good = seps <= match_radius
+            if transient.get('disc_date') is not None:
+                disc_date = _aware(transient['disc_date'])
+                good &= np.array([candidate.disc_date is not None and
+                                  abs(candidate.disc_date - disc_date) <= match_window
+                                  for candidate in candidates])
+            if np.any(good):
+                idx = np.where(good)[0][np.argmin(seps[good])]
+                matches[key] = (candidates[idx], 'position')
+    return matches, duplicates
+
+def _guess_obs_group(internal_name:str, groups:dict):
+    """ Observation group of an internal name, from its prefix
+    (this isn't perfect)
+    """
+    prefix = internal_name.replace(' ','')[:3]
+    found = [group for name, group in groups.items() if name.startswith(prefix)]
+    return found[0] if len(found) == 1 else groups['Unknown']
+
+def _fail(user, transient:dict, key:str, e:Exception, results:dict,
+          alert:bool=True):
+    """ Record (and email) the failure of a transient """
+    exc_type, exc_obj, exc_tb = sys.exc_info()
+    print('Transient %s failed!'%transient.get('name'))
+    if alert:
+        html_msg = """Alert : YSE_PZ Failed to upload transient %s with error %s at line number %s"""
+        _alert(user, html_msg%(transient.get('name'),e,
+                               exc_tb.tb_lineno if exc_tb is not None else None))
+    results[key] = dict(name=transient.get('name'), action='failed', message=str(e))
+
+def _fail_all(user, transients:dict, e:Exception, results:dict):
+    """ Record the failure of a whole stage, with a single email """
+    _alert(user, "Alert : YSE_PZ Failed to upload %d transients with error %s"%(
+        len(transients), e))
+    for key, transient in transients.items():
+        _fail(user, transient, key, e, results, alert=False)
+
+def upsert_transients(transient_data:dict, user):
+    """ Add or update a set of transients, with their tags,
+    alternate names, photometry, spectra and hosts
+
+    Args:
+        transient_data (dict): upload of the add_transient endpoint:
+            transients keyed by any label, and the optional flags
+            noupdatestatus and TNS
+        user (User): uploader
+
+    Raises:
+        IOError: a transient has no name
+
+    Returns:
+        dict: keyed like the transients:  name, transient_id,
+            action ('created', 'updated' or 'failed'), matched_by
+            ('name', 'alias' or 'position') and message
+    """
+    from django.db import transaction
+    from django.utils import timezone
+    from YSE_App.models import (Transient, TransientStatus, TransientTag,
+                                AlternateTransientNames, ObservationGroup)
+
+    transients = {key: transient for key, transient in transient_data.items()
+                  if key not in control_keys}
+    for key, transient in transients.items():
+        if 'name' not in transient.keys():
+            raise IOError("Error : Transient name not provided for transient %s!"%key)
+    tns = 'TNS' in transient_data.keys() and transient_data['TNS']
+    update_status = 'noupdatestatus' in transient_data.keys() and \
+        not transient_data['noupdatestatus']
+
+    results = {}
+
+    # 1. Foreign keys
+    all_fields = resolve_fields(transients, user, results)
+
+    # 2. Existing transients
+    good = {key: transients[key] for key in all_fields}
+    try:
+        matches, duplicates = match_existing(good)
+    except Exception as e:
+        _fail_all(user, good, e, results)
+        return results
+
+    # 3. Write the transients, alternate names and tags
+    tag_names = set([tag for transient in good.values() for tag in transient.get('tags', [])])
+    tags = {tag.name: tag for tag in TransientTag.objects.filter(name__in=tag_names)}
+    groups = {group.name: group for group in ObservationGroup.objects.all()}
+    new_status = TransientStatus.objects.filter(name='New').first()
+    now = timezone.now()
+
+    updates, creates, alt_entries = collections.defaultdict(list), [], []
+    dbtransients = {}
+    for key, transient in list(good.items()):
+        fields = all_fields[key]
+        if key not in matches:
+            creates.append(Transient(**fields))
+            results[key] = dict(name=transient['name'], action='created')
+            continue
+
+        try:
+            dbtransient, matched_by = matches[key]
+            obs_group = fields.get('obs_group', groups['Unknown'])
+            if matched_by != 'name':
+                # Known under another name
+                if tns:
+                    alt_entries.append(AlternateTransientNames(
+                        transient=dbtransient,obs_group=obs_group,name=dbtransient.name,
+                        created_by_id=user.id,modified_by_id=user.id))
+                    fields['slug'] = transient['name']
+                else:
+                    alt_entries.append(AlternateTransientNames(
+                        transient=dbtransient,obs_group=obs_group,name=transient['name'],
+                        created_by_id=user.id,modified_by_id=user.id))
+                    fields['name'] = dbtransient.name
+
+            if update_status and dbtransient.status.name == 'Ignore':
+                fields.setdefault('status', new_status)
+            else:
+                fields['status'] = dbtransient.status
+            if dbtransient.postage_stamp_file:
+                for field in stamp_fields:
+                    fields[field] = getattr(dbtransient, field)
+
+            # The creator is kept
+            fields.pop('created_by_id')
+            fields['modified_date'] = now
+            for field, value in fields.items():
+                setattr(dbtransient, field, value)
+        except Exception as e:
+            _fail(user, transient, key, e, results)
+            good.pop(key)
+            continue
+        updates[tuple(sorted(fields.keys()) + ['healpix'])].append(dbtransient)
+        dbtransients[key] = dbtransient
+        results[key] = dict(name=dbtransient.name, transient_id=dbtransient.id,
+                            action='updated', matched_by=matched_by)
+
+    try:
+        with transaction.atomic():
+            if len(duplicates) > 0:
+                Transient.objects.filter(id__in=duplicates).delete()
+            for fields, objs in updates.items():
+                healpix.assign(objs)
+                Transient.objects.bulk_update(objs, list(fields), batch_size=500)
+
+            healpix.assign(creates)
+            Transient.objects.bulk_create(creates, batch_size=500)
+            # MySQL does not return the new ids
+            new_names = [obj.name for obj in creates]
+            created = {}
+            for dbtransient in Transient.objects.filter(name__in=new_names).order_by('pk'):
+                created[dbtransient.name] = dbtransient
+            for key, result in results.items():
+                if result['action'] == 'created':
+                    dbtransients[key] = created[result['name']]
+                    result['transient_id'] = dbtransients[key].id
+
+            # Alternate names
+            for key, transient in good.items():
+                if 'internal_names' in transient.keys():
+                    for internal_name in transient['internal_names'].split(','):
+                        alt_entries.append(AlternateTransientNames(
+                            name=internal_name,
+                            obs_group=_guess_obs_group(internal_name, groups),
+                            created_by_id=user.id,modified_by_id=user.id,
+                            transient=dbtransients[key]))
+            existing_alts = set(AlternateTransientNames.objects.filter(
+                name__in=[alt.name for alt in alt_entries]).values_list('name', flat=True))
+            new_alts = []
+            for alt in alt_entries:
+                if alt.name not in existing_alts:
+                    new_alts.append(alt)
+                    existing_alts.add(alt.name)
+            AlternateTransientNames.objects.bulk_create(new_alts, batch_size=500)
+
+            # Tags
+            TransientTags = Transient.tags.through
+            tag_entries = []
+            for key, transient in good.items():
+                for tag in transient.get('tags', []):
+                    if tag not in tags:
+                        results[key]['message'] = f'Unknown tag: {tag}'
+                        continue
+                    tag_entries.append(TransientTags(transient_id=dbtransients[key].id,
+                                                     transienttag_id=tags[tag].id))
+            TransientTags.objects.bulk_create(tag_entries, batch_size=1000,
+                                              ignore_conflicts=True)
+    except Exception as e:
+        _fail_all(user, good, e, results)
+        return results
+
+    # 4. Photometry, spectra and hosts
+    from YSE_App.data_utils import add_transient_spec_util, add_transient_host_util
+
+    phot_entries = [(dbtransients[key], transient['transientphotometry'])
+                    for key, transient in good.items()
+                    if 'transientphotometry' in transient.keys()]
+    try:
+        write_photometry(phot_entries, user)
+    except Exception as e:
+        _fail_all(user, {key: transient for key, transient in good.items()
+                         if 'transientphotometry' in transient.keys()}, e, results)
+    for key, transient in good.items():
+        try:
+            if 'transientspectra' in transient.keys():
+                add_transient_spec_util(transient['transientspectra'],dbtransients[key],user)
+            if 'host' in transient.keys():
+                add_transient_host_util(transient['host'],dbtransients[key],user)
+        except Exception as e:
+            _fail(user, transient, key, e, results)
+
+    return results
+
+
+def write_photometry(entries:list, user):
+    """ Bulk photometry writer
+
+    The instruments and observation groups are resolved and the
+    missing TransientPhotometry created with one query each;
+    the photdata are then merged per TransientPhotometry
+
+    Args:
+        entries (list): (Transient, photdict) tuples, photdict as
+            uploaded to add_transient (photometry entries plus
+            clobber and mjdmatchmin)
+        user (User): uploader
+
+    Returns:
+        int: number of TransientPhotometry created
+    """
+    from YSE_App.models import Instrument, ObservationGroup, TransientPhotometry
+    from YSE_App.data_utils import add_photdata_util
+
+    photometries = [(transient, photdict, photdict[k]) for transient, photdict in entries
+                    for k in photdict.keys() if k not in ['clobber', 'mjdmatchmin']]
+    if len(photometries) == 0:
+        return 0
+    instruments = _by_name(Instrument, [photometry['instrument'] for _, _, photometry in photometries])
+    groups = _by_name(ObservationGroup, [photometry['obs_group'] for _, _, photometry in photometries])
+
+    def phot_key(transient, photometry):
+        return (transient.id,
+                instruments.get(photometry['instrument'], instruments['Unknown']).id,
+                groups.get(photometry['obs_group'], groups['Unknown']).id)
+
+    def existing():
+        phots = {}
+        for phot in TransientPhotometry.objects.filter(
+                transient_id__in=set([transient.id for transient, _ in entries])).order_by('pk'):
+            phots.setdefault((phot.transient_id, phot.instrument_id, phot.obs_group_id), phot)
+        return phots
+
+    phots = existing()
+    new_phots = {}
+    for transient, _, photometry in photometries:
+        key = phot_key(transient, photometry)
+        if key not in phots and key not in new_phots:
+            new_phots[key] = TransientPhotometry(
+                transient_id=key[0], instrument_id=key[1], obs_group_id=key[2],
+                created_by_id=user.id, modified_by_id=user.id)
+    if len(new_phots) > 0:
+        TransientPhotometry.objects.bulk_create(list(new_phots.values()), batch_size=500)
+        phots = existing()
+
+    for transient, photdict, photometry in photometries:
+        add_photdata_util(photometry, phots[phot_key(transient, photometry)], photdict, user)
+    return len(new_phots)
+
+
+def add_photometry(phot_data:dict, user):
+    """ Add the photometry of one transient, creating the transient
+    if needed (see the add_transient_phot endpoint)
+
+    Args:
+        phot_data (dict): header (clobber, mjdmatchmin), transient
+            (name, ra, dec, status), photheader (instrument, obs_group,
+            groups) and the points, keyed by any label
+        user (User): uploader
+
+    Raises:
+        IOError: missing keys, or unknown status or group
+
+    Returns:
+        tuple: number of points created, number of points updated
+    """
+    from django.contrib.auth.models import Group
+    from YSE_App.models import (Transient, TransientStatus, Instrument,
+                                ObservationGroup, TransientPhotometry)
+    from YSE_App.data_utils import add_photdata_util
+
+    if 'header' not in phot_data.keys() or 'transient' not in phot_data.keys() or \
+       'photheader' not in phot_data.keys():
+        raise IOError("header, transient, and photheader keys are required")
+    hd, tr, ph = phot_data['header'], phot_data['transient'], phot_data['photheader']
+
+    # Foreign keys
+    instrument = _by_name(Instrument, [ph['instrument']])
+    instrument = instrument.get(ph['instrument'], instrument['Unknown'])
+    obs_group = _by_name(ObservationGroup, [ph['obs_group']])
+    obs_group = obs_group.get(ph['obs_group'], obs_group['Unknown'])
+    status = TransientStatus.objects.filter(name=tr['status']).first()
+    if status is None:
+        raise IOError("status %s is not in DB"%tr['status'])
+    allgroups = []
+    if ph['groups']:
+        group_names = ph['groups'].split(',')
+        allgroups = list(Group.objects.filter(name__in=group_names))
+        if len(set([group.name for group in allgroups])) < len(set(group_names)):
+            raise IOError("group %s is not in DB"%ph['groups'])
+
+    # Transient and photometry
+    transient = Transient.objects.filter(name=tr['name']).first()
+    if transient is None:
+        transient = Transient.objects.create(name=tr['name'],ra=tr['ra'],dec=tr['dec'],
+                                             status=status,created_by_id=user.id,
+                                             obs_group=obs_group,
+                                             modified_by_id=user.id)
+    transientphot = TransientPhotometry.objects.filter(
+        transient=transient, instrument=instrument, obs_group=obs_group).first()
+    if transientphot is None:
+        transientphot = TransientPhotometry.objects.create(
+            instrument=instrument,obs_group=obs_group,transient=transient,
+            created_by_id=user.id,modified_by_id=user.id)
+    elif hd['clobber']:
+        transientphot.modified_by_id = user.id
+        transientphot.save()
+    if len(allgroups):
+        transientphot.groups.add(*allgroups)
+
+    photometry = dict(instrument=ph['instrument'], obs_group=ph['obs_group'],
+                      photdata={k: v for k, v in phot_data.items()
+                                if k not in ['header', 'transient', 'photheader']})
+    return add_photdata_util(photometry, transientphot, hd, user)
+
+
+# #########################################################
+# In-process uploads
+# #########################################################
+
+def ingest_user(login:str):
+    """ User of the uploads of a cron job
+
+    The jobs run in the server process, so no password is checked
+
+    Args:
+        login (str): username
+
+    Returns:
+        User: the user
+    """
+    from django.contrib.auth.models import User
+    return User.objects.get(username=login)
+
+def upload_transients(transients:dict, login:str, noupdatestatus:bool=None,
+                      TNS:bool=None):
+    """ Upload a batch of transients from within the server,
+    with the semantics of the add_transient endpoint
+
+    Args:
+        transients (dict): transients keyed by any label, as uploaded
+            to add_transient;  may also hold the noupdatestatus and TNS flags
+        login (str): username of the uploader
+        noupdatestatus (bool, optional): Do not reset the Ignore statuses.
+            Overrides the flag of transients.
+        TNS (bool, optional): The names are TNS names.
+            Overrides the flag of transients.
+
+    Returns:
+        dict: outcome per transient (see upsert_transients())
+    """
+    transient_data = dict(transients)
+    if noupdatestatus is not None:
+        transient_data['noupdatestatus'] = noupdatestatus
+    if TNS is not None:
+        transient_data['TNS'] = TNS
+    return upsert_transients(transient_data, ingest_user(login))
+
+def summary(results:dict):
+    """ One-line summary of the outcome of an upload
+
+    Args:
+        results (dict): see upsert_transients()
+
+    Returns:
+        str: the numbers of created, updated and failed transients
+    """
+    counts = collections.Counter([result['action'] for result in results.values()])
+    msg = ', '.join([f"{counts[action]} {action}" for action in ['created', 'updated', 'failed']])
+    return ('success: ' if counts['failed'] == 0 else 'errors: ') + msg
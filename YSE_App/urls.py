@@ -44,6 +44,7 @@ urlpatterns = [
     re_path(r'^add_frb_galaxy/', data_utils.add_frb_galaxy, name='add_frb_galaxy'),
     re_path(r'^rm_frb_galaxy/', data_utils.rm_frb_galaxy, name='rm_frb_galaxy'),
     re_path(r'^ingest_path/', data_utils.IngestPathView.as_view(), name='ingest_path'),
+    re_path(r'^ingest_path_bulk/', data_utils.IngestPathBulkView.as_view(), name='ingest_path_bulk'),
     re_path(r'^debug_request/', data_utils.debug_request, name='debug_request'),
     re_path(r'^targets_from_frb_followup_resource/', data_utils.targets_from_frb_followup_resource, name='targets_from_frb_followup_resource'),
     re_path(r'^ingest_obsplan/', data_utils.ingest_obsplan, name='ingest_obsplan'),
@@ -58,6 +59,7 @@ urlpatterns = [
     re_path(r'^addmodify_criteria/', data_utils.addmodify_criteria, name='addmodify_criteria'),
     re_path(r'^add_band/', data_utils.add_band, name='add_band'),
     re_path(r'^frb_update_status/', data_utils.frb_update_status, name='frb_update_status'),
+    re_path(r'^frb_job_status/', data_utils.frb_job_status, name='frb_job_status'),
     re_path(r'^get_frb_table/', data_utils.get_frb_table, name='get_frb_table'),
     re_path(r'^get_criteria/', data_utils.get_criteria, name='get_criteria'),
     re_path(r'^chk_frb/', data_utils.chk_frb, name='chk_frb'),
@@ -132,6 +134,8 @@ urlpatterns = [
     re_path(r'^add_transient_spec/', data_utils.add_transient_spec, name='add_transient_spec'),
     re_path(r'^ztf_forced_phot/(?P<slug>.*)/$', views.ztf_forced_phot, name='ztf_forced_phot'),
     re_path(r'^get_host/(?P<ra>\d+\.\d+)/(?P<dec>[+-]?\d+\.\d+)/(?P<sep>\d+\.?\d*)/$', data_utils.get_host, name='get_host'),
+    re_path(r'^cone_search/(?P<table>[a-z]+)/(?P<ra>\d+\.\d+)/(?P<dec>[+-]?\d+\.\d+)/(?P<sep>\d+\.?\d*)/$', data_utils.cone_search, name='cone_search'),
+    re_path(r'^metrics/$', data_utils.request_metrics, name='metrics'),
     re_path(r'^get_rising_transients_box/(?P<ra>\d+\.\d+)/(?P<dec>[+-]?\d+\.\d+)/(?P<ra_width>\d+\.?\d*)/(?P<dec_width>\d+\.?\d*)/$',
         data_utils.get_rising_transients_box, name='get_rising_transients_box'),
     re_path(r'^get_new_transients_box/(?P<ra>\d+\.\d+)/(?P<dec>[+-]?\d+\.\d+)/(?P<ra_width>\d+\.?\d*)/(?P<dec_width>\d+\.?\d*)/$',
@@ -1693,8 +1693,8 @@ def frb_dashboard(request):
          ['GoodSpectrum'],
          ['Unassigned'], 
          ]):
-        transients = FRBTransient.objects.filter(status__in=TransientStatus.objects.filter(
-            name__in=statusnames))
+        transients = FRBTransient.objects.filter(
+            status__name__in=statusnames).order_by('name').for_table()
         #status = TransientStatus.objects.filter(name__in=statusnames).order_by('-modified_date')
         #if len(status) == 1:
         #    transients = FRBTransient.objects.filter(status=status[0]).order_by('name')
@@ -1704,7 +1704,8 @@ def frb_dashboard(request):
         #if statusname == 'New': table = NewFRBTransientTable(transientfilter.qs,prefix=statusname.lower())
         #else: table = FRBTransientTable(transientfilter.qs,prefix=statusname.lower())
         #table = FRBTransientTable(transientfilter.qs)#,prefix=statusname.lower())
-        table = FRBTransientTable(transients)
+        # Paginated per panel;  only the rows of the page are loaded
+        table = FRBTransientTable(transients, prefix=f'{statusnames[0].lower()}-')
         RequestConfig(request, paginate={'per_page': 10}).configure(table)
         #transient_categories += [(table,title,statusnames[0].lower(),transientfilter),]
         transient_categories += [(table,title,statusnames[0].lower(),None),]
@@ -1929,19 +1930,19 @@ def frb_followup_resource(request, slug):
         frbs_by_mode = frb_fu.get_frbs_by_mode()
         # Build the tables
         for key in frbs_by_mode.keys():
-            context[f'{key}_table'] = FRBTransientTable(frbs_by_mode[key])
+            context[f'{key}_table'] = FRBTransientTable(frbs_by_mode[key].for_table())
 
     # Pending FRBs
     fu_requested = FRBFollowUpRequest.objects.filter(resource=frb_fu)
     frb_ids = [x.transient.id for x in fu_requested]
-    pending_frbs = FRBTransient.objects.filter(id__in=frb_ids)
+    pending_frbs = FRBTransient.objects.filter(id__in=frb_ids).for_table()
     context['pending_table'] = FRBTransientTable(pending_frbs)
 
     # Observed
     fu_obs = FRBFollowUpObservation.objects.filter(resource=frb_fu)
     if len(fu_obs) > 0:
         frb_ids = [x.transient.id for x in fu_obs]
-        obs_frbs = FRBTransient.objects.filter(id__in=frb_ids)
+        obs_frbs = FRBTransient.objects.filter(id__in=frb_ids).for_table()
         context['obs_table'] = FRBTransientTable(obs_frbs)
 
         # Obs log
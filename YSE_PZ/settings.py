@@ -247,6 +247,18 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 ZTFTMPDIR = config.get('ztf','ztfforcedtmpdir')
+# Local PS1 point-source catalog for the broker crons (see YSE_App/data_ingest/alert_enrich.py)
+PS1_PSC_CATALOG = config.get('ps1', 'psc_catalog', fallback='')
+# Local Galactic foreground files for the FRBs (see YSE_App/frb_ism.py)
+FRB_SFD_MAP = config.get('frb', 'sfd_map', fallback='')
+FRB_NE2001_GRID = config.get('frb', 'ne2001_grid', fallback='')
+# Run the E(B-V)/DM_ISM/status updates of new FRBs in the job workers (see YSE_App/frb_jobs.py)
+FRB_ASYNC_ENRICH = config.get('frb', 'async_enrich', fallback='').strip().lower() == 'true'
+# Request instrumentation (see YSE_App/middleware/request_logger.py)
+REQUEST_LOG_SAMPLE = 0.         # Fraction of the request bodies printed
+REQUEST_LOG_BODY_MAX = 1000     # Bytes printed of a sampled body
+REQUEST_METRICS_SIZE = 10000    # Requests kept for the metrics
+REQUEST_METRICS_INTERVAL = 30.  # Seconds between aggregations of the metrics
 
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True